@@ -0,0 +1,5 @@
+from .burst import BurstCoalescer
+from .cache import ResponseCache, normalize_prompt
+from .engine import AIEngine, extract_content, extract_delta
+from .memory import ConversationMemory, estimate_tokens
+from .streaming import StreamingReplies
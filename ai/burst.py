@@ -0,0 +1,105 @@
+# ai/burst.py - per-chat burst coalescing in front of the AI engine
+# When a group gets excited, many "master ..." messages arrive within seconds.
+# Instead of one completion and one reply each, the messages of a chat are
+# collected into a burst: it closes once the chat has been quiet for `quiet`
+# seconds, after `window` seconds at most, or at `max_messages`; then the
+# respond callback gets the whole burst (one LLM call, one threaded reply).
+# A burst of one message is answered exactly like before, just `quiet` later.
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+log = logging.getLogger("masterbot.ai")
+
+
+class _Burst:
+    __slots__ = ("items", "opened", "timer")
+
+    def __init__(self, opened: float):
+        self.items: List[object] = []
+        self.opened = opened
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class BurstCoalescer:
+    """
+    - respond: async callback(chat_id, items) run once per closed burst
+    - quiet: seconds without a new message that close a burst (debounce)
+    - window: seconds a burst may stay open at most (bounds the added latency)
+    - max_messages: a burst this large closes at once
+    """
+
+    def __init__(self, respond: Callable[[int, List[object]], Awaitable[None]], quiet: float = 1.5,
+                 window: float = 4.0, max_messages: int = 10):
+        self.respond = respond
+        self.quiet = quiet
+        self.window = window
+        self.max_messages = max_messages
+        self._open: Dict[int, _Burst] = {}
+        self._running: set = set()
+        self.bursts = 0
+        self.messages = 0
+        self.largest = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(self, chat_id: int, item):
+        """Add a message to the chat's open burst (opening one if needed); returns at once."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        burst = self._open.get(chat_id)
+        if burst is None:
+            burst = self._open[chat_id] = _Burst(now)
+        burst.items.append(item)
+        self.messages += 1
+        if burst.timer is not None:
+            burst.timer.cancel()
+        if len(burst.items) >= self.max_messages:
+            self._close(chat_id)
+            return
+        delay = min(self.quiet, burst.opened + self.window - now)
+        burst.timer = loop.call_later(max(delay, 0.0), self._close, chat_id)
+
+    def _close(self, chat_id: int):
+        burst = self._open.pop(chat_id, None)
+        if burst is None:
+            return
+        if burst.timer is not None:
+            burst.timer.cancel()
+        self.bursts += 1
+        self.largest = max(self.largest, len(burst.items))
+        task = asyncio.get_running_loop().create_task(self._respond(chat_id, burst.items))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _respond(self, chat_id: int, items: List[object]):
+        try:
+            await self.respond(chat_id, items)
+        except Exception as e:
+            log.exception("Burst reply in %s failed: %s", chat_id, e)
+
+    async def drain(self, poll: float = 0.01):
+        """Wait until every open burst has closed and been answered."""
+        while self._open or self._running:
+            await asyncio.sleep(poll)
+
+    async def close(self):
+        """Answer the open bursts now (shutdown), then wait for them."""
+        for chat_id in list(self._open):
+            self._close(chat_id)
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "open": len(self._open),
+            "answering": len(self._running),
+            "bursts": self.bursts,
+            "messages": self.messages,
+            # LLM calls and replies saved by coalescing
+            "coalesced": self.messages - self.bursts - sum(len(b.items) for b in self._open.values()),
+            "largest": self.largest,
+        }
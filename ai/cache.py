@@ -0,0 +1,144 @@
+# ai/cache.py - response cache for ai_generate_reply
+# Near-identical group messages ("hi master", "Hi master!!") share one completion.
+# Bounded by size (LRU) and age (TTL); concurrent misses on the same key are
+# single-flighted so a burst of the same text makes exactly one upstream call.
+
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+_PUNCT_RE = re.compile(r"[^\w\s]+", flags=re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+_REPEAT_RE = re.compile(r"(\w)\1{2,}", flags=re.UNICODE)
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Canonical form used for cache keys:
+    lowercase, punctuation/emoji dropped, letters repeated 3+ times squeezed
+    ("hiiii" -> "hii"), whitespace collapsed.
+    """
+    t = (text or "").lower()
+    t = _PUNCT_RE.sub(" ", t)
+    t = _REPEAT_RE.sub(r"\1\1", t)
+    return _SPACE_RE.sub(" ", t).strip()
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of reply texts.
+
+    - max_entries: LRU bound
+    - ttl: seconds an entry stays valid
+    - per_chat: include the chat id in the key, so chats never share replies
+    - max_words: only prompts up to this many (normalized) words are cacheable;
+      longer messages are answered with conversation context instead
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 600.0, per_chat: bool = False, max_words: int = 4):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.per_chat = per_chat
+        self.max_words = max_words
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def cacheable(self, text: str) -> bool:
+        words = normalize_prompt(text).split()
+        return 0 < len(words) <= self.max_words
+
+    def make_key(self, text: str, *settings, chat_id: Optional[int] = None) -> str:
+        """Key = normalized text + persona/model settings (+ chat id when per_chat)."""
+        parts = [normalize_prompt(text)]
+        parts.extend(str(s) for s in settings)
+        if self.per_chat and chat_id is not None:
+            parts.append(str(chat_id))
+        return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """
+        Return the cached value, or run compute() once for all concurrent callers
+        of the same key. Falsy results (engine fallback) are shared but not stored.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        value = None
+        try:
+            value = await compute()
+            if value:
+                self.put(key, value)
+            return value
+        finally:
+            # Waiters get whatever we got; on error/cancellation that is None
+            # and they fall back locally instead of inheriting the exception.
+            self._inflight.pop(key, None)
+            if not fut.done():
+                fut.set_result(value)
+
+    def clear(self):
+        self._data.clear()
+
+    # ---- warm restarts (db/snapshots.py) ----
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {"entries": [[key, expires - now, value] for key, (expires, value) in self._data.items() if expires > now]}
+
+    def restore(self, data: dict, age: float) -> int:
+        """Reload a snapshot taken `age` seconds ago; expired and already cached keys are skipped."""
+        now = time.monotonic()
+        restored = 0
+        for key, remaining, value in reversed(data.get("entries", ())):  # pushed in front: oldest ends first
+            if remaining > age and key not in self._data:
+                self._data[key] = (now + remaining - age, value)
+                self._data.move_to_end(key, last=False)
+                restored += 1
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+        return restored
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._data)
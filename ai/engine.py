@@ -0,0 +1,290 @@
+# ai/engine.py - non-blocking OpenAI engine for Master Bot
+# One shared AsyncOpenAI client (and therefore one keep-alive connection pool),
+# a bounded number of in-flight completions, per-chat caps and hard timeouts.
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from utils.lazy import timed_import
+from utils.metrics import metrics
+
+log = logging.getLogger("masterbot.ai")
+
+
+def extract_content(resp) -> Optional[str]:
+    """
+    Pull the reply text out of a chat completion response.
+    Different SDK builds expose the shape differently; try attribute access first,
+    then dict-style, then the legacy `choice.text`.
+    """
+    if not resp or not getattr(resp, "choices", None):
+        return None
+    choice = resp.choices[0]
+    content = None
+    try:
+        msg = getattr(choice, "message", None)
+        if isinstance(msg, dict):
+            content = msg.get("content")
+        elif msg is not None:
+            content = getattr(msg, "content", None)
+    except Exception:
+        content = None
+    if not content:
+        try:
+            content = choice["message"]["content"]
+        except Exception:
+            content = getattr(choice, "text", None)
+    if content:
+        return content.strip()
+    return None
+
+
+def extract_delta(chunk) -> Optional[str]:
+    """The text piece of one streamed chat completion chunk (None for role / finish chunks)."""
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return None
+    delta = getattr(choices[0], "delta", None)
+    if isinstance(delta, dict):
+        return delta.get("content")
+    return getattr(delta, "content", None)
+
+
+class StreamInterrupted(Exception):
+    """stream() failed after yielding part of the reply (what was yielded is not the whole answer)."""
+
+
+class AIEngine:
+    """
+    Async wrapper around the OpenAI chat completions API.
+
+    - max_workers: completions allowed in flight at once (global cap)
+    - per_chat_limit: completions allowed in flight per chat
+    - max_pending: callers allowed to wait for a slot; extra callers get None
+    - timeout: seconds before a call is abandoned (caller falls back locally)
+
+    complete() never raises: it returns the reply text, or None when the engine
+    is disabled, saturated, timed out or the upstream call failed. stream() is
+    the same call yielding the reply in pieces; it yields nothing where
+    complete() would return None, and raises StreamInterrupted when it fails
+    after some pieces were yielded, so a cut-off reply is never taken for a whole one.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        model: str = "gpt-5.1",
+        base_url: Optional[str] = None,
+        max_workers: int = 8,
+        per_chat_limit: int = 1,
+        max_pending: int = 64,
+        timeout: float = 20.0,
+        temperature: float = 0.85,
+        max_tokens: int = 300,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.per_chat_limit = per_chat_limit
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+        self._client = None
+        self._client_failed = False
+        self._slots: Optional[asyncio.Semaphore] = None
+        # chat_id -> [semaphore, users]; entries are dropped when no call uses them
+        self._chat_slots: Dict[int, list] = {}
+        self._pending = 0
+
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key) and not self._client_failed
+
+    def _get_client(self):
+        # Imported on first use so the SDK does not slow down bot start-up.
+        if self._client is None and not self._client_failed:
+            try:
+                AsyncOpenAI = timed_import("openai").AsyncOpenAI
+                kwargs = {"api_key": self.api_key, "max_retries": 0}
+                if self.base_url:
+                    kwargs["base_url"] = self.base_url
+                self._client = AsyncOpenAI(**kwargs)
+                log.info("OpenAI async client initialised successfully.")
+            except ImportError:
+                self._client_failed = True
+                log.warning("OPENAI_API_KEY present but OpenAI SDK not installed. pip install openai")
+            except Exception as e:
+                self._client_failed = True
+                log.exception("Failed to initialize OpenAI client: %s", e)
+        return self._client
+
+    def _acquire_chat(self, chat_id: int) -> asyncio.Semaphore:
+        entry = self._chat_slots.get(chat_id)
+        if entry is None:
+            entry = [asyncio.Semaphore(self.per_chat_limit), 0]
+            self._chat_slots[chat_id] = entry
+        entry[1] += 1
+        return entry[0]
+
+    def _release_chat(self, chat_id: int):
+        entry = self._chat_slots.get(chat_id)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._chat_slots[chat_id]
+
+    async def _request(self, messages: List[dict]) -> Optional[str]:
+        client = self._get_client()
+        if client is None:
+            return None
+        self.calls += 1
+        metrics.inc("openai_requests_total")
+        start = time.perf_counter()
+        try:
+            resp = await client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+            )
+        finally:
+            metrics.observe("openai_request", time.perf_counter() - start)
+        return extract_content(resp)
+
+    async def complete(self, messages: List[dict], chat_id: Optional[int] = None) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            log.warning("AI engine saturated (%d pending); using local fallback.", self._pending)
+            return None
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        self._pending += 1
+        chat_sem = self._acquire_chat(chat_id) if chat_id is not None else None
+        try:
+            # The timeout covers queueing too: a reply that arrives a minute late is useless.
+            return await asyncio.wait_for(self._run(messages, chat_sem), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            log.warning("OpenAI call timed out after %.1fs (chat %s).", self.timeout, chat_id)
+        except Exception as e:
+            self.errors += 1
+            log.exception("OpenAI call failed: %s", e)
+        finally:
+            self._pending -= 1
+            if chat_id is not None:
+                self._release_chat(chat_id)
+        return None
+
+    async def _run(self, messages: List[dict], chat_sem: Optional[asyncio.Semaphore]) -> Optional[str]:
+        if chat_sem is None:
+            async with self._slots:
+                return await self._request(messages)
+        async with chat_sem:
+            async with self._slots:
+                return await self._request(messages)
+
+    async def stream(self, messages: List[dict], chat_id: Optional[int] = None) -> AsyncIterator[str]:
+        if not self.enabled:
+            return
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            log.warning("AI engine saturated (%d pending); using local fallback.", self._pending)
+            return
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        loop = asyncio.get_running_loop()
+        # As in complete(), the timeout covers queueing and the whole generation
+        deadline = loop.time() + self.timeout
+        remaining = lambda: max(deadline - loop.time(), 0.0)
+        self._pending += 1
+        chat_sem = self._acquire_chat(chat_id) if chat_id is not None else None
+        held: List[asyncio.Semaphore] = []
+        resp = None
+        start = None
+        first = True
+        try:
+            for sem in (chat_sem, self._slots):
+                if sem is not None:
+                    await asyncio.wait_for(sem.acquire(), remaining())
+                    held.append(sem)
+            client = self._get_client()
+            if client is None:
+                return
+            self.calls += 1
+            metrics.inc("openai_requests_total")
+            start = time.perf_counter()
+            resp = await asyncio.wait_for(client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stream=True,
+            ), remaining())
+            chunks = resp.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), remaining())
+                except StopAsyncIteration:
+                    break
+                piece = extract_delta(chunk)
+                if piece:
+                    if first:
+                        first = False
+                        metrics.observe("openai_first_token", time.perf_counter() - start)
+                    yield piece
+        except asyncio.TimeoutError as e:
+            self.timeouts += 1
+            log.warning("OpenAI stream timed out after %.1fs (chat %s).", self.timeout, chat_id)
+            if not first:
+                raise StreamInterrupted("timed out") from e
+        except Exception as e:
+            self.errors += 1
+            log.exception("OpenAI stream failed: %s", e)
+            if not first:
+                raise StreamInterrupted(str(e)) from e
+        finally:
+            if resp is not None:
+                try:
+                    await resp.close()  # frees the pooled connection when the reader stops early
+                except Exception:
+                    pass
+            if start is not None:
+                metrics.observe("openai_request", time.perf_counter() - start)
+            for sem in held:
+                sem.release()
+            self._pending -= 1
+            if chat_id is not None:
+                self._release_chat(chat_id)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "pending": self._pending,
+            "active_chats": len(self._chat_slots),
+        }
+
+    async def close(self):
+        if self._client is not None:
+            try:
+                await self._client.close()
+            except Exception:
+                pass
+            self._client = None
@@ -0,0 +1,7 @@
+# ai/manifest.py - nothing to register; the SDK is warmed in the background when a key is set
+
+import os
+
+HANDLERS = ()
+
+WARM = ("openai",) if os.getenv("OPENAI_API_KEY") else ()
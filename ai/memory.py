@@ -0,0 +1,166 @@
+# ai/memory.py - compact per-chat conversation memory
+# Each chat keeps a fixed-size ring buffer of __slots__ turns; role/speaker strings
+# and short texts are interned. A global token ceiling evicts the least recently
+# used chats, so RAM stays bounded across thousands of groups, and prompts are
+# trimmed to a token budget so their size (and cost) stays flat.
+
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+# Texts this short repeat a lot in groups ("hi master", "ok", "lol"); intern them.
+INTERN_MAX_CHARS = 32
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+class Turn:
+    __slots__ = ("role", "speaker", "text", "tokens", "ts")
+
+    def __init__(self, role: str, speaker: Optional[str], text: str, ts: float):
+        self.role = sys.intern(role)
+        self.speaker = sys.intern(speaker) if speaker else None
+        self.text = sys.intern(text) if len(text) <= INTERN_MAX_CHARS else text
+        self.tokens = estimate_tokens(text) + (estimate_tokens(speaker) if speaker else 0)
+        self.ts = ts
+
+    def as_message(self) -> Dict[str, str]:
+        content = f"{self.speaker}: {self.text}" if self.speaker else self.text
+        return {"role": self.role, "content": content}
+
+
+class ChatHistory:
+    __slots__ = ("turns", "tokens", "last_used")
+
+    def __init__(self, maxlen: int):
+        self.turns = deque(maxlen=maxlen)
+        self.tokens = 0
+        self.last_used = 0.0
+
+
+class ConversationMemory:
+    """
+    - turns_per_chat: ring buffer size per chat (older turns fall off)
+    - max_chats: chats kept at all (LRU beyond this)
+    - max_total_tokens: global ceiling over every stored turn (LRU chats evicted)
+    - max_turn_chars: longer messages are truncated before storing
+    """
+
+    def __init__(
+        self,
+        turns_per_chat: int = 12,
+        max_chats: int = 5000,
+        max_total_tokens: int = 1_000_000,
+        max_turn_chars: int = 800,
+    ):
+        self.turns_per_chat = turns_per_chat
+        self.max_chats = max_chats
+        self.max_total_tokens = max_total_tokens
+        self.max_turn_chars = max_turn_chars
+        self._chats: "OrderedDict[int, ChatHistory]" = OrderedDict()
+        self.total_tokens = 0
+        self.evicted_chats = 0
+
+    def add(self, chat_id: int, role: str, text: str, speaker: Optional[str] = None):
+        text = (text or "").strip()
+        if not text:
+            return
+        if len(text) > self.max_turn_chars:
+            text = text[: self.max_turn_chars]
+        hist = self._chats.get(chat_id)
+        if hist is None:
+            hist = ChatHistory(self.turns_per_chat)
+            self._chats[chat_id] = hist
+        else:
+            self._chats.move_to_end(chat_id)
+
+        if len(hist.turns) == hist.turns.maxlen:
+            dropped = hist.turns[0]
+            hist.tokens -= dropped.tokens
+            self.total_tokens -= dropped.tokens
+        turn = Turn(role, speaker, text, time.time())
+        hist.turns.append(turn)
+        hist.tokens += turn.tokens
+        self.total_tokens += turn.tokens
+        hist.last_used = turn.ts
+        self._evict()
+
+    def _evict(self):
+        while self._chats and (len(self._chats) > self.max_chats or self.total_tokens > self.max_total_tokens):
+            _, hist = self._chats.popitem(last=False)
+            self.total_tokens -= hist.tokens
+            self.evicted_chats += 1
+
+    def forget(self, chat_id: int):
+        hist = self._chats.pop(chat_id, None)
+        if hist is not None:
+            self.total_tokens -= hist.tokens
+
+    def history(self, chat_id: int) -> List[Turn]:
+        hist = self._chats.get(chat_id)
+        return list(hist.turns) if hist else []
+
+    def build_context(
+        self,
+        chat_id: Optional[int],
+        system_prompt: str,
+        user_text: str,
+        token_budget: int = 1200,
+        speaker: Optional[str] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        [system, ...most recent turns that fit the budget..., current user message].
+        The system prompt and current message are always included; history is
+        filled newest-first until token_budget would be exceeded.
+        """
+        current = Turn("user", speaker, user_text, 0.0)
+        budget = token_budget - estimate_tokens(system_prompt) - current.tokens
+        picked = []
+        hist = self._chats.get(chat_id) if chat_id is not None else None
+        if hist is not None:
+            for turn in reversed(hist.turns):
+                if turn.tokens > budget:
+                    break
+                budget -= turn.tokens
+                picked.append(turn.as_message())
+            picked.reverse()
+        return [{"role": "system", "content": system_prompt}] + picked + [current.as_message()]
+
+    # ---- warm restarts (db/snapshots.py) ----
+    def snapshot(self) -> dict:
+        """Every chat's turns as [role, speaker, text, ts], least recently used chat first."""
+        return {"chats": [[chat_id, [[t.role, t.speaker, t.text, t.ts] for t in hist.turns]]
+                          for chat_id, hist in self._chats.items()]}
+
+    def restore(self, data: dict, age: float) -> int:
+        """Reload a snapshot; chats that talked since start-up keep their own history."""
+        restored = 0
+        for chat_id, turns in reversed(data.get("chats", ())):
+            if chat_id in self._chats or not turns:
+                continue
+            hist = ChatHistory(self.turns_per_chat)
+            for role, speaker, text, ts in turns[-self.turns_per_chat:]:
+                turn = Turn(role, speaker, text, ts)
+                hist.turns.append(turn)
+                hist.tokens += turn.tokens
+            hist.last_used = hist.turns[-1].ts
+            self._chats[chat_id] = hist
+            self._chats.move_to_end(chat_id, last=False)  # older than anything seen live
+            self.total_tokens += hist.tokens
+            restored += 1
+        self._evict()
+        return restored
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._chats),
+            "tokens": self.total_tokens,
+            "evicted_chats": self.evicted_chats,
+        }
+
+    def __len__(self):
+        return len(self._chats)
@@ -0,0 +1,134 @@
+# ai/streaming.py - progressive AI replies (placeholder, then edits as tokens arrive)
+# A long completion takes seconds; instead of showing nothing until it is done,
+# a placeholder goes out as soon as the request starts and is edited while the
+# reply streams in. Edits are batched: one at a time, at most every `interval`
+# seconds and only after `min_chars` new characters, and they go through the
+# outbox like any other call. An intermediate edit is skipped while the chat's
+# message bucket could not spare it and still send the final text at once, so
+# streaming never delays the complete reply behind its own progress edits.
+# A stream cut off part-way (StreamInterrupted) keeps what was shown, marked as
+# interrupted, and is not returned as the reply, so it is not remembered as one.
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Callable, Optional
+
+from utils.metrics import metrics
+
+from .engine import StreamInterrupted
+
+log = logging.getLogger("masterbot.ai")
+
+TELEGRAM_MAX_CHARS = 4096
+
+
+class StreamingReplies:
+    """
+    - outbox: bot/sender.py Outbox that sends the placeholder and the edits
+    - interval: seconds between two edits of one reply at least
+    - min_chars: new characters needed before an intermediate edit
+    - placeholder: text shown until the first edit
+    - interrupted: appended to the partial text of a stream that failed part-way
+    - priority: outbox priority of the placeholder and edits (chit-chat)
+    """
+
+    def __init__(self, outbox, interval: float = 1.0, min_chars: int = 30, placeholder: str = "…",
+                 interrupted: str = "(interrupted)", priority: int = 2):
+        self.outbox = outbox
+        self.interval = interval
+        self.min_chars = min_chars
+        self.placeholder = placeholder
+        self.interrupted_marker = interrupted
+        self.priority = priority
+        self.replies = 0
+        self.edits = 0
+        self.fallbacks = 0
+        self.interrupted = 0
+        self.failed = 0
+
+    async def reply(self, message, pieces: AsyncIterator[str], fallback: Callable[[], str]) -> str:
+        """
+        Answer message with the streamed text; returns what the stream produced
+        ("" when it produced nothing and fallback() was shown instead, or when it
+        was interrupted and only part of it was shown).
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.replies += 1
+        # The placeholder goes out while the completion is still queued upstream
+        placeholder = loop.create_task(self.outbox.reply(message, self.placeholder, priority=self.priority))
+        text = ""
+        shown = ""
+        last_edit = 0.0
+        edit: Optional[asyncio.Future] = None
+        interrupted = False
+        try:
+            async for piece in pieces:
+                text += piece
+                if not placeholder.done() or placeholder.exception() is not None:
+                    continue
+                if edit is not None and not edit.done():
+                    continue  # one edit in flight; the next one carries everything since
+                now = loop.time()
+                if len(text) - len(shown) < self.min_chars or now - last_edit < self.interval:
+                    continue
+                if self.outbox.available(message.chat.id) < 2:
+                    continue  # keep a message for the final edit
+                if not shown:
+                    metrics.observe("ai_stream_first_edit", time.perf_counter() - started)
+                shown, last_edit = text, now
+                edit = self._edit(placeholder.result(), text)
+        except StreamInterrupted:
+            interrupted = True
+            self.interrupted += 1
+
+        final = text.strip()
+        result = "" if interrupted else final
+        if not final:
+            self.fallbacks += 1
+            final = fallback()
+        elif interrupted:
+            marker = self.interrupted_marker
+            final = f"{final[:TELEGRAM_MAX_CHARS - len(marker) - 1]} {marker}"
+        try:
+            sent = await placeholder
+        except Exception as e:
+            # No message to edit: send the answer as a plain reply
+            log.warning("Streaming placeholder in %s failed: %s", message.chat.id, e)
+            await self.outbox.reply(message, final, priority=self.priority, wait=False)
+            return result
+        if edit is not None:
+            try:
+                await edit
+            except Exception:
+                pass  # counted and logged by _edit; the final edit below retries with the full text
+        if final != shown.strip():
+            try:
+                await self._edit(sent, final)
+            except Exception:
+                pass
+        metrics.observe("ai_stream_reply", time.perf_counter() - started)
+        return result
+
+    def _edit(self, sent, text: str) -> asyncio.Future:
+        text = text.strip()[:TELEGRAM_MAX_CHARS]  # Telegram trims, and rejects an edit that changes nothing
+        self.edits += 1
+        fut = self.outbox.submit(sent.chat.id, lambda: sent.edit_text(text), priority=self.priority)
+        fut.add_done_callback(self._log_failure)
+        return fut
+
+    def _log_failure(self, fut: asyncio.Future):
+        if not fut.cancelled() and fut.exception() is not None:
+            self.failed += 1
+            log.warning("Streaming edit failed: %s", fut.exception())
+
+    def stats(self) -> dict:
+        return {
+            "replies": self.replies,
+            "edits": self.edits,
+            "avg_edits": round(self.edits / self.replies, 2) if self.replies else 0.0,
+            "fallbacks": self.fallbacks,
+            "interrupted": self.interrupted,
+            "failed": self.failed,
+        }
@@ -0,0 +1,184 @@
+# ai/stub.py - tiny local stand-in for the OpenAI chat completions endpoint
+# Lets you run the bot (or check the engine's concurrency) with no network and no key:
+#
+#   python -m ai.stub --port 8089 --delay 1.0
+#   OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python main.py
+#
+#   python -m ai.stub --check 20   # 20 concurrent chats should finish in ~1 delay
+#   python -m ai.stub --check 20 --stream --token-delay 0.05   # the same, streamed
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Optional
+
+
+class StubServer:
+    """
+    Minimal HTTP/1.1 server answering POST .../chat/completions after `delay` seconds.
+    The reply echoes the last user message so callers can tell answers apart.
+    With "stream": true the first chunk comes after `delay` and then one word
+    every `token_delay` seconds, as server-sent events like the real API.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 1.0, token_delay: float = 0.05,
+                 words: int = 40):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.token_delay = token_delay
+        self.words = words  # length of a streamed reply, so there is something to stream
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0") or 0))
+                self.requests += 1
+                req = json.loads(body or b"{}")
+                if req.get("stream"):
+                    await self._stream(writer, req)
+                    continue
+                payload = self._reply(req)
+                await asyncio.sleep(self.delay)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, writer: asyncio.StreamWriter, req: dict):
+        content = self._reply(req)["choices"][0]["message"]["content"]
+        words = (content + " " + " ".join(f"word{i}" for i in range(self.words))).split(" ")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        await asyncio.sleep(self.delay)
+        for i, word in enumerate(words):
+            delta = {"role": "assistant", "content": word} if i == 0 else {"content": " " + word}
+            self._event(writer, self._chunk(req, delta, None))
+            await writer.drain()
+            await asyncio.sleep(self.token_delay)
+        self._event(writer, self._chunk(req, {}, "stop"))
+        self._event(writer, "[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _event(writer: asyncio.StreamWriter, data):
+        line = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode()
+        writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+
+    def _chunk(self, req: dict, delta: dict, finish_reason: Optional[str]) -> dict:
+        return {
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": req.get("model", "stub"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def _reply(self, req: dict) -> dict:
+        messages = req.get("messages") or []
+        last = messages[-1]["content"] if messages else ""
+        return {
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"stub reply to: {last}"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+
+async def _check(chats: int, delay: float, stream: bool = False, token_delay: float = 0.05):
+    from ai.engine import AIEngine, StreamInterrupted
+
+    server = await StubServer(delay=delay, token_delay=token_delay).start()
+    engine = AIEngine(api_key="stub", base_url=server.base_url, max_workers=chats, timeout=delay * 10 + 10)
+    first = []
+
+    async def streamed(i: int) -> str:
+        t0 = time.perf_counter()
+        pieces = []
+        try:
+            async for piece in engine.stream([{"role": "user", "content": f"hi {i}"}], chat_id=i):
+                if not pieces:
+                    first.append(time.perf_counter() - t0)
+                pieces.append(piece)
+        except StreamInterrupted:
+            return ""  # a cut-off reply does not count
+        return "".join(pieces)
+
+    try:
+        engine._get_client()  # keep the SDK import out of the timing
+        t0 = time.perf_counter()
+        replies = await asyncio.gather(*[
+            streamed(i) if stream else engine.complete([{"role": "user", "content": f"hi {i}"}], chat_id=i)
+            for i in range(chats)
+        ])
+        elapsed = time.perf_counter() - t0
+    finally:
+        await engine.close()
+        await server.stop()
+    ok = sum(1 for r in replies if r)
+    print(f"{ok}/{chats} replies in {elapsed:.2f}s (one call = {delay:.2f}s)"
+          + (f", first piece after {max(first):.2f}s at most" if first else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI chat completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=1.0, help="seconds to the reply (streamed: to its first word)")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="seconds between streamed words")
+    parser.add_argument("--check", type=int, metavar="N", help="run N concurrent chats through AIEngine and exit")
+    parser.add_argument("--stream", action="store_true", help="--check with AIEngine.stream")
+    args = parser.parse_args()
+
+    if args.check:
+        asyncio.run(_check(args.check, args.delay, args.stream, args.token_delay))
+        return
+
+    async def serve():
+        server = await StubServer(args.host, args.port, args.delay, args.token_delay).start()
+        print(f"Stub listening on {server.base_url}")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
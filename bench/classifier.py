@@ -0,0 +1,76 @@
+# bench/classifier.py - micro-batching of classifier/service.py
+# Group messages arrive at a steady rate and are scored through the real
+# worker process. The stub model sleeps like a batched CPU model would (fixed
+# cost per batch plus a small cost per text), so the run shows what batching
+# does to throughput and latency without downloading a model. Pass
+# --model hf:<name> to measure a real one.
+#
+#   python -m bench.classifier [--messages 2000] [--rate 200] [--model stub:25:1]
+
+import argparse
+import asyncio
+import random
+import time
+
+from classifier.service import Classifier
+
+WORDS = "kal aaj bhai yaar group game match movie dinner office college exam bus train rain idiot pagal".split()
+
+
+def texts(n: int, repeat: float, seed: int = 5):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        if out and rnd.random() < repeat:
+            out.append(rnd.choice(out[-200:]))  # "good morning", stickers' captions, forwarded jokes...
+        else:
+            out.append(" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 20))))
+    return out
+
+
+async def run(model: str, messages: int, rate: float, max_batch: int, wait_ms: float, repeat: float):
+    classifier = Classifier(model, max_batch=max_batch, max_wait=wait_ms / 1000, max_queue=100000)
+    await classifier.warm_up()  # process spawn and model load are not part of the run
+    loop = asyncio.get_running_loop()
+    latencies = []
+
+    async def one(text):
+        start = loop.time()
+        await classifier.classify(text)
+        latencies.append(loop.time() - start)
+
+    tasks = []
+    t0 = time.perf_counter()
+    for i, text in enumerate(texts(messages, repeat)):
+        # Open loop: arrivals do not wait for earlier results
+        delay = t0 + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(loop.create_task(one(text)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - t0
+    await classifier.close()
+    latencies.sort()
+    stats = classifier.stats()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    print(f"max_batch {max_batch:3d}: {messages / elapsed:7.0f} msgs/s  latency ms p50 {pct(0.5):7.1f} "
+          f"p95 {pct(0.95):7.1f} p99 {pct(0.99):7.1f}  batches {stats['batches']:5d} avg {stats['avg_batch']:5.1f}  "
+          f"cache hits {stats['hits']} coalesced {stats['coalesced']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classifier micro-batching benchmark")
+    parser.add_argument("--model", default="stub:25:1", help="CLASSIFIER_MODEL spec (stub:<batch ms>:<item ms>)")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200, help="messages per second offered")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--wait-ms", type=float, default=20)
+    parser.add_argument("--repeat", type=float, default=0.2, help="share of messages repeating a recent text")
+    args = parser.parse_args()
+    print(f"{args.messages} messages at {args.rate:.0f}/s, model {args.model}, max wait {args.wait_ms:g} ms")
+    for max_batch in args.batch:
+        asyncio.run(run(args.model, args.messages, args.rate, max_batch, args.wait_ms, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
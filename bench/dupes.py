@@ -0,0 +1,99 @@
+# bench/dupes.py - throughput and accuracy of filters/dupes.py
+# Ordinary group chatter (random sentences, mostly unique) mixed with spam waves:
+# one template posted across many chats with per-copy variations (numbers,
+# casing, emoji, zero-width characters, swapped words). Reports messages/s,
+# index size, wave copies caught and ordinary messages wrongly flagged.
+#
+#   python -m bench.dupes [--messages 100000] [--waves 20] [--chats 2000]
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from filters.dupes import DuplicateIndex
+
+WORDS = (
+    "kal aaj bhai yaar group game match movie dinner office college exam bus train rain "
+    "coffee chai phone photo party birthday weekend monday late early sorry thanks please "
+    "why what when where who how good bad nice funny crazy tired happy ready done again "
+    "the a is was are were to of in on for with at from this that it you me we they"
+).split()
+
+TEMPLATES = [
+    "Earn {n}$ daily from home, join our crypto signals channel now t.me/pump{n} limited seats left",
+    "Congratulations! You won an iPhone {n} Pro, claim your prize here bit.ly/win{n} before midnight",
+    "Hot singles in your area want to chat with you tonight, click the link in my bio for {n} free credits",
+    "Investment opportunity: double your money in {n} days guaranteed, message admin @profit{n} today",
+]
+NOISE = ("🔥", "‼️", "💰", "​", "!!", "...", "✅")
+
+
+def chatter(rnd: random.Random) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(4, 30)))
+
+
+def variant(rnd: random.Random, template: str) -> str:
+    words = template.format(n=rnd.randint(1, 9999)).split()
+    if rnd.random() < 0.5:
+        i = rnd.randrange(len(words) - 1)
+        words[i], words[i + 1] = words[i + 1], words[i]
+    if rnd.random() < 0.5:
+        words.insert(rnd.randrange(len(words)), rnd.choice(NOISE))
+    text = " ".join(words)
+    return text.upper() if rnd.random() < 0.2 else text
+
+
+def run(messages: int, rate: float, chats: int, waves: int, copies: int, seed: int = 11):
+    rnd = random.Random(seed)
+    events = []
+    now = 0.0
+    spam_share = waves * copies / messages
+    wave_templates = [rnd.choice(TEMPLATES) + f" #{w}" for w in range(waves)]
+    for _ in range(messages):
+        now += rnd.expovariate(rate)
+        if rnd.random() < spam_share:
+            events.append((-(1 + rnd.randrange(chats)), variant(rnd, rnd.choice(wave_templates)), now, True))
+        else:
+            events.append((-(1 + rnd.randrange(chats)), chatter(rnd), now, False))
+    spam = sum(1 for e in events if e[3])
+    index = DuplicateIndex()
+    caught = false_flags = 0
+    t0 = time.perf_counter()
+    for chat_id, text, ts, is_spam in events:
+        if index.add(chat_id, text, ts) is not None:
+            if is_spam:
+                caught += 1
+            else:
+                false_flags += 1
+    elapsed = time.perf_counter() - t0
+    # Memory: the same stream again with allocation tracing on (slow, so untimed)
+    tracemalloc.start()
+    traced = DuplicateIndex()
+    for chat_id, text, ts, _ in events:
+        traced.add(chat_id, text, ts)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = index.stats()
+    print(f"{messages:,} messages over {now:,.0f}s ({rate:,.0f}/s), {chats:,} chats, {spam:,} spam copies in {waves} waves")
+    print(f"  {messages / elapsed:12,.0f} msgs/s  ({elapsed * 1e6 / messages:.1f} us/msg)")
+    print(f"  clusters {stats['clusters']:,}, lsh keys {stats['lsh_keys']:,}, evicted {stats['evicted']:,}, "
+          f"peak traced memory {peak / 1e6:.1f} MB")
+    # The first copies of a wave are what identifies it; they are never caught
+    print(f"  spam copies caught {caught:,}/{spam:,} ({caught / max(spam, 1):.1%}), "
+          f"ordinary messages flagged {false_flags:,}/{messages - spam:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate spam index benchmark")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--rate", type=float, default=300)
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--waves", type=int, default=20)
+    parser.add_argument("--copies", type=int, default=100, help="copies per wave")
+    args = parser.parse_args()
+    run(args.messages, args.rate, args.chats, args.waves, args.copies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# bench/flood.py - throughput and accuracy of filters/flood.py
+# Mixed traffic: many ordinary users at human rates plus a few flooders;
+# reports messages/s, sketch memory, flooders caught and false trips.
+#
+#   python -m bench.flood [--messages 500000] [--rate 3000] [--users 1000000]
+
+import argparse
+import random
+import time
+
+from filters.flood import FloodDetector
+
+
+def run(messages: int, rate: float, users: int, chats: int, flooders: int, seed: int = 7):
+    rnd = random.Random(seed)
+    detector = FloodDetector()
+    bad = {(-(1 + i % chats), 10 ** 9 + i) for i in range(flooders)}
+    bad_list = sorted(bad)
+    events = []
+    now = 0.0
+    for _ in range(messages):
+        now += rnd.expovariate(rate)
+        if rnd.random() < 0.02:
+            events.append((*rnd.choice(bad_list), now))  # flooders: ~2% of all traffic
+        else:
+            events.append((-(1 + rnd.randrange(chats)), rnd.randrange(users), now))
+    caught, false_trips = set(), 0
+    t0 = time.perf_counter()
+    for chat_id, user_id, ts in events:
+        if detector.hit(chat_id, user_id, ts):
+            if (chat_id, user_id) in bad:
+                caught.add((chat_id, user_id))
+            else:
+                false_trips += 1
+    elapsed = time.perf_counter() - t0
+    print(f"{messages:,} messages over {now:,.0f}s of traffic ({rate:,.0f}/s), {users:,} users, {chats:,} chats")
+    print(f"  {messages / elapsed:12,.0f} msgs/s  ({elapsed * 1e6 / messages:.2f} us/msg)")
+    print(f"  sketch memory {detector.stats()['sketch_bytes'] / 1e6:.1f} MB (fixed)")
+    print(f"  flooders caught {len(caught)}/{flooders}, false trips {false_trips}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flood detector benchmark")
+    parser.add_argument("--messages", type=int, default=500000)
+    parser.add_argument("--rate", type=float, default=3000)
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--chats", type=int, default=5000)
+    parser.add_argument("--flooders", type=int, default=20)
+    args = parser.parse_args()
+    run(args.messages, args.rate, args.users, args.chats, args.flooders)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bench/intent.py - microbenchmark for filters/intent.py
+# Compares the old per-handler scans (lowercase + "master" checks + keyword regex
+# + up to five detect_action searches, then ai_handler repeating the checks)
+# against one classify_message() shared by both handler groups.
+#
+#   python -m bench.intent [--messages 200000]
+
+import argparse
+import random
+import re
+import time
+from datetime import timedelta
+
+from pyrogram.types import Message
+
+from filters.intent import classify_message
+
+CHATTER = [
+    "hello everyone", "kya haal hai sab", "lol", "good morning group", "anyone up for a game tonight?",
+    "this is a long message about nothing in particular that keeps going for a while " * 3,
+    "ok", "haha sahi hai", "who removed the pinned message?", "bhai kal milte hai",
+]
+MASTER = [
+    "master kya haal hai", "hi master", "master joke sunao", "master mute rahul 10 min",
+    "master ban @spammer_bot", "master unmute priya", "master kick him out", "master nikal do isko",
+]
+
+
+def _legacy(message):
+    # moderation_handler (group=1)
+    text = (message.text or "").strip()
+    lower = text.lower()
+    contains_master = "master" in lower
+    is_reply_to_master = False
+    if message.reply_to_message and message.reply_to_message.text:
+        is_reply_to_master = "master" in message.reply_to_message.text.lower()
+    action = duration = None
+    if (contains_master or is_reply_to_master) and re.search(r"(mute|unmute|ban|unban|kick|nikal|chup|remove|allow|unblock)", lower):
+        t = lower.lower()
+        if re.search(r"\b(mute|chup|silent|silence|restrict|restricted)\b", t):
+            action = "mute"
+        elif re.search(r"\b(unmute|allow|undo mute|remove mute|kholo|bolne do)\b", t):
+            action = "unmute"
+        elif re.search(r"\b(ban|nikal|remove from group|ban karo|nikal do)\b", t):
+            action = "ban"
+        elif re.search(r"\b(unban|wapis|unblock|remove ban|unban karo)\b", t):
+            action = "unban"
+        elif re.search(r"\b(kick|kick out|bahar|nakaal)\b", t):
+            action = "kick"
+        if action == "mute":
+            m = re.search(r"(\d+)\s*(min(?:ute)?s?|hour(?:s?)|day(?:s?))", lower, flags=re.IGNORECASE)
+            duration = timedelta(minutes=int(m.group(1))) if m else timedelta(minutes=10)
+    # ai_handler (group=2) repeats the master checks
+    text = (message.text or "").strip()
+    lower = text.lower()
+    reply_to_master = False
+    if message.reply_to_message and message.reply_to_message.text:
+        reply_to_master = "master" in message.reply_to_message.text.lower()
+    return ("master" in lower or reply_to_master), action, duration if action == "mute" else None
+
+
+def _shared(message):
+    intent = classify_message(message)  # group=1
+    intent = classify_message(message)  # group=2 reuses it
+    return intent.is_master_related, intent.action, intent.duration
+
+
+def _messages(n, master_ratio, seed=7):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        text = rnd.choice(MASTER if rnd.random() < master_ratio else CHATTER)
+        reply = Message(id=1, text=rnd.choice(CHATTER + MASTER)) if rnd.random() < 0.2 else None
+        out.append(Message(id=2, text=text, reply_to_message=reply))
+    return out
+
+
+def run(n: int, master_ratio: float, repeat: int = 3):
+    print(f"{n:,} messages, {master_ratio:.0%} addressed to master (best of {repeat})")
+    for name, fn in (("legacy multi-scan", _legacy), ("single-pass shared", _shared)):
+        elapsed = float("inf")
+        for _ in range(repeat):
+            msgs = _messages(n, master_ratio)  # fresh objects: no memoised intents carried over
+            t0 = time.perf_counter()
+            for m in msgs:
+                fn(m)
+            elapsed = min(elapsed, time.perf_counter() - t0)
+        print(f"  {name:20s} {n / elapsed:12,.0f} msgs/s  ({elapsed * 1e6 / n:.2f} us/msg)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trigger/intent matcher microbenchmark")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--master-ratio", type=float, nargs="*", default=[0.05, 0.2, 1.0])
+    args = parser.parse_args()
+    for ratio in args.master_ratio:
+        run(args.messages, ratio)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,528 @@
+# bench/replay.py - offline update-replay benchmark for the message pipeline
+# Replays synthetic (or recorded) updates through the real handlers - main.py's
+# moderation_handler / ai_handler / trackers and the plugin handlers from the
+# manifests (modules/moderation.py) - exactly the way Pyrogram's dispatcher does (handler groups
+# in order, first matching handler per group, N concurrent workers).
+# Telegram, OpenAI and the database are in-process fakes with configurable
+# latency, so it runs with no network and no credentials.
+#
+#   python -m bench.replay [--workload dm groups storm mixed] [--updates 1000]
+#                          [--tg-latency 0.03] [--openai-latency 0.6] [--db-latency 0.002]
+#                          [--input recorded.jsonl] [--json]
+#
+# Each workload runs in a fresh interpreter so caches never carry over.
+#
+# Recorded updates are JSON lines:
+#   {"chat_id": -100123, "chat_type": "supergroup", "user_id": 42, "first_name": "Asha",
+#    "username": "asha", "text": "master mute @rahul 5 min", "admin": true,
+#    "reply_to": {"user_id": 7, "first_name": "Rahul", "text": "spam"}}
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+WORKLOADS = ("dm", "groups", "storm", "mixed")
+OWNER = 1000
+BOT_ID = 999
+
+CHATTER = [
+    "hello everyone", "kya haal hai sab", "lol", "good morning group", "anyone up for a game tonight?",
+    "ok", "haha sahi hai", "who removed the pinned message?", "bhai kal milte hai", "😂😂😂",
+    "this is a long message about nothing in particular that keeps going for a while",
+]
+TO_MASTER = [
+    "hi master", "hello master!", "master kya haal hai", "master joke sunao", "master how are you",
+    "master can you tell me something interesting about the moon tonight",
+    "master what should I cook for dinner, I have rice and dal",
+]
+DM = [
+    "hi", "hello", "how are you", "tell me a joke", "kya kar rahi ho", "good night",
+    "I had a long day at work and my boss keeps changing the deadline",
+    "what music do you like?", "can you help me write a birthday wish for my sister",
+]
+MOD = [
+    "master mute @{u} 5 min", "master mute @{u}", "master ban @{u}", "master unmute @{u}",
+    "master kick @{u}", "master unban @{u}", "master chup karao @{u} 1 hour", "master nikal do @{u}",
+]
+
+
+# ----------------------------
+# Fakes
+# ----------------------------
+class FakeTelegram:
+    """
+    Stands in for pyrogram.Client in handlers. High-level methods keep Pyrogram's
+    signatures (so a wrong call fails here as it would in production), sleep for
+    `latency` and are counted by name.
+    """
+
+    def __init__(self, latency: float, members: Dict[int, List[dict]], admins: Dict[int, set]):
+        from pyrogram.enums import ParseMode
+        from pyrogram.types import User
+
+        self.latency = latency
+        self.members = members
+        self.admins = admins
+        self.calls: Counter = Counter()
+        self.parse_mode = ParseMode.DEFAULT
+        self.me = User(id=BOT_ID, is_self=True, is_bot=True, first_name="Master", username="MasterBot")
+        self._next_id = 10_000_000
+
+    async def _api(self, method: str):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def user(self, d: dict):
+        from pyrogram.types import User
+        return User(id=d["user_id"], first_name=d.get("first_name"), username=d.get("username"), client=self)
+
+    def _member(self, chat_id: int, d: dict):
+        from pyrogram.enums import ChatMemberStatus
+        from pyrogram.types import ChatMember, ChatPrivileges
+        if d["user_id"] in self.admins.get(chat_id, ()):
+            return ChatMember(status=ChatMemberStatus.ADMINISTRATOR, user=self.user(d),
+                              privileges=ChatPrivileges(can_restrict_members=True), client=self)
+        return ChatMember(status=ChatMemberStatus.MEMBER, user=self.user(d), client=self)
+
+    async def send_message(self, chat_id, text, parse_mode=None, entities=None, disable_web_page_preview=None,
+                           disable_notification=None, reply_to_message_id=None, schedule_date=None,
+                           protect_content=None, reply_markup=None):
+        from pyrogram.enums import ChatType
+        from pyrogram.types import Chat, Message
+        await self._api("send_message")
+        self._next_id += 1
+        return Message(id=self._next_id, chat=Chat(id=chat_id, type=ChatType.SUPERGROUP, client=self),
+                       from_user=self.me, text=text, date=datetime.now(), client=self)
+
+    async def edit_message_text(self, chat_id, message_id, text, parse_mode=None, entities=None,
+                                disable_web_page_preview=None, reply_markup=None):
+        await self._api("edit_message_text")
+
+    async def delete_messages(self, chat_id, message_ids, revoke=True):
+        await self._api("delete_messages")
+        return 1
+
+    async def restrict_chat_member(self, chat_id, user_id, permissions, until_date=None):
+        await self._api("restrict_chat_member")
+
+    async def ban_chat_member(self, chat_id, user_id, until_date=None):
+        await self._api("ban_chat_member")
+
+    async def unban_chat_member(self, chat_id, user_id):
+        await self._api("unban_chat_member")
+        return True
+
+    async def get_users(self, user_ids):
+        await self._api("get_users")
+        name = str(user_ids).lstrip("@").lower()
+        for people in self.members.values():
+            for d in people:
+                if (d.get("username") or "").lower() == name:
+                    return self.user(d)
+        from pyrogram.errors import UsernameNotOccupied
+        raise UsernameNotOccupied()
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._api("get_chat_member")
+        for d in self.members.get(chat_id, ()):
+            if d["user_id"] == user_id:
+                return self._member(chat_id, d)
+        from pyrogram.errors import UserNotParticipant
+        raise UserNotParticipant()
+
+    async def get_chat_members(self, chat_id, query: str = "", limit: int = 0, filter=None):
+        from pyrogram.enums import ChatMembersFilter
+        await self._api("get_chat_members")
+        people = self.members.get(chat_id, ())
+        if filter == ChatMembersFilter.ADMINISTRATORS:
+            people = [d for d in people if d["user_id"] in self.admins.get(chat_id, ())]
+        elif query:
+            q = query.lower()
+            people = [d for d in people if q in (d.get("username") or "").lower() or q in (d.get("first_name") or "").lower()]
+        for d in people[: limit or None]:
+            yield self._member(chat_id, d)
+
+
+class FakeOpenAI:
+    """Minimal AsyncOpenAI stand-in: chat.completions.create sleeps, then echoes."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    async def create(self, model, messages, **kwargs):
+        from types import SimpleNamespace
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = f"(stub) {messages[-1]['content'][:40]}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+    async def close(self):
+        pass
+
+
+def _latency_backend(inner, latency: float):
+    """Wrap a db backend so every operation costs `latency` and is counted."""
+    from db.backends import Backend
+
+    class LatencyBackend(Backend):
+        name = f"{inner.name}+latency"
+
+        def __init__(self):
+            self.calls: Counter = Counter()
+
+        async def _op(self, op, *args):
+            self.calls[op] += 1
+            if latency:
+                await asyncio.sleep(latency)
+            return await getattr(inner, op)(*args)
+
+        async def find_one(self, coll, query):
+            return await self._op("find_one", coll, query)
+
+        async def find(self, coll, query):
+            return await self._op("find", coll, query)
+
+        async def update_one(self, coll, query, fields, upsert=True):
+            return await self._op("update_one", coll, query, fields, upsert)
+
+        async def bulk_update(self, coll, updates):
+            return await self._op("bulk_update", coll, updates)
+
+        async def delete_one(self, coll, query):
+            return await self._op("delete_one", coll, query)
+
+    return LatencyBackend()
+
+
+# ----------------------------
+# Workloads
+# ----------------------------
+def _people(rnd: random.Random, chat_id: int, n: int) -> List[dict]:
+    names = ["Asha", "Rahul", "Priya", "Aman", "Neha", "Vikram", "Sana", "Kabir", "Isha", "Rohan"]
+    out = []
+    for i in range(n):
+        uid = abs(chat_id) * 1000 + i
+        first = rnd.choice(names)
+        out.append({"user_id": uid, "first_name": first, "username": f"{first.lower()}_{uid}"})
+    return out
+
+
+def synthesize(workload: str, n: int, seed: int = 7) -> List[dict]:
+    """Update records (same shape as recorded ones) for a named workload."""
+    rnd = random.Random(seed)
+    groups = {-(1000 + i): _people(rnd, 1000 + i, 150) for i in range(40)}
+    storm_chats = list(groups)[:4]
+    records = []
+
+    def group_msg(chat_id, text, sender=None, reply_to=None, admin=False):
+        sender = sender or rnd.choice(groups[chat_id])
+        return {"chat_id": chat_id, "chat_type": "supergroup", "text": text, "admin": admin,
+                "reply_to": reply_to, **sender}
+
+    def dm():
+        uid = 500 + rnd.randrange(200)
+        return {"chat_id": uid, "chat_type": "private", "user_id": uid, "first_name": "Dee",
+                "username": f"dee_{uid}", "text": rnd.choice(DM)}
+
+    def chatter():
+        chat_id = rnd.choice(list(groups))
+        if rnd.random() < 0.06:
+            return group_msg(chat_id, rnd.choice(TO_MASTER))
+        return group_msg(chat_id, rnd.choice(CHATTER))
+
+    def storm():
+        chat_id = rnd.choice(storm_chats)
+        people = groups[chat_id]
+        admins = people[:3]
+        target = rnd.choice(people[3:])
+        r = rnd.random()
+        if r < 0.55:
+            return group_msg(chat_id, rnd.choice(MOD).format(u=target["username"]), sender=rnd.choice(admins), admin=True)
+        if r < 0.75:  # non-admins trying their luck
+            return group_msg(chat_id, rnd.choice(MOD).format(u=target["username"]))
+        if r < 0.9:
+            return group_msg(chat_id, "/mute", sender=rnd.choice(admins), admin=True,
+                             reply_to={**target, "text": rnd.choice(CHATTER)})
+        return group_msg(chat_id, "sorry master", sender=target)
+
+    make = {
+        "dm": lambda: dm(),
+        "groups": lambda: chatter(),
+        "storm": lambda: storm(),
+        "mixed": lambda: rnd.choices([dm, chatter, storm], weights=[2, 6, 2])[0](),
+    }[workload]
+    # Everyone in a group has spoken once before the measured run (member index warm-up
+    # would otherwise dominate short runs); those updates are flagged and not timed.
+    warm = [group_msg(c, rnd.choice(CHATTER), sender=p) for c in storm_chats for p in groups[c]]
+    for r in warm:
+        r["warmup"] = True
+    return warm + [make() for _ in range(n)]
+
+
+def load_records(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _build_world(records: List[dict]):
+    """Members and admins per chat as implied by the records."""
+    members: Dict[int, Dict[int, dict]] = defaultdict(dict)
+    admins: Dict[int, set] = defaultdict(set)
+    for r in records:
+        if r.get("chat_type", "supergroup") == "private":
+            continue
+        people = [r] + ([r["reply_to"]] if r.get("reply_to") else [])
+        for p in people:
+            members[r["chat_id"]].setdefault(p["user_id"], {k: p.get(k) for k in ("user_id", "first_name", "username")})
+        if r.get("admin"):
+            admins[r["chat_id"]].add(r["user_id"])
+    # Targets named with @username only (never spoke) still need to be resolvable
+    return {c: list(m.values()) for c, m in members.items()}, admins
+
+
+def _to_message(r: dict, client, msg_id: int):
+    from pyrogram.enums import ChatType, MessageEntityType
+    from pyrogram.types import Chat, Message, MessageEntity
+
+    ctype = {"private": ChatType.PRIVATE, "group": ChatType.GROUP}.get(r.get("chat_type"), ChatType.SUPERGROUP)
+    chat = Chat(id=r["chat_id"], type=ctype, client=client)
+    text = r.get("text") or ""
+    entities = []
+    if text.startswith("/"):
+        entities.append(MessageEntity(type=MessageEntityType.BOT_COMMAND, offset=0, length=len(text.split()[0])))
+    at = text.find("@")
+    if at >= 0:
+        entities.append(MessageEntity(type=MessageEntityType.MENTION, offset=at, length=len(text[at:].split()[0])))
+    reply = None
+    if r.get("reply_to"):
+        rt = r["reply_to"]
+        reply = Message(id=msg_id - 1, chat=chat, from_user=client.user(rt), text=rt.get("text"),
+                        date=datetime.now(), client=client)
+    return Message(id=msg_id, chat=chat, from_user=client.user(r), text=text, entities=entities or None,
+                   reply_to_message=reply, date=datetime.now(), client=client)
+
+
+# ----------------------------
+# Runner (one workload, this process)
+# ----------------------------
+def _pct(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def run_single(name: str, records: List[dict], args) -> dict:
+    # Configuration the handlers read at import time
+    os.environ.setdefault("OWNER_ID", str(OWNER))
+    os.environ.setdefault("BOT_OWNER_ID", str(OWNER))
+    os.environ["MONGO_URL"] = "memory://"
+    os.environ["METRICS_PORT"] = "0"
+    os.environ.pop("OPENAI_BASE_URL", None)
+    import logging
+    logging.disable(logging.WARNING)
+
+    import main as bot
+    from pyrogram import ContinuePropagation, StopPropagation
+    from pyrogram.handlers import MessageHandler
+    from bot.sender import get_outbox
+    from db import get_store
+
+    members, admins = _build_world(records)
+    tg = FakeTelegram(args.tg_latency, members, admins)
+    ai = FakeOpenAI(args.openai_latency)
+    bot.ai_engine.api_key = "offline"
+    bot.ai_engine._client = ai
+    store = get_store()
+    store.backend = _latency_backend(store.backend, args.db_latency)
+    outbox = get_outbox()
+    if not args.telegram_limits:
+        # Measure the bot, not Telegram's flood limits
+        outbox.global_rate = outbox.chat_rate = outbox.chat_burst = outbox.dm_rate = outbox.dm_burst = 1e9
+        outbox._global.rate = outbox._global.capacity = outbox._global.tokens = 1e9
+
+    async def go():
+        await asyncio.sleep(0)  # let the decorators' add_handler tasks register
+        groups = {g: list(hs) for g, hs in bot.app.dispatcher.groups.items()}
+        # Only message handlers see these updates (as with the dispatcher's parsed type)
+        ordered = [[h for h in groups[g] if isinstance(h, MessageHandler)] for g in sorted(groups)]
+
+        latency: Dict[str, List[float]] = defaultdict(list)
+        update_latency: List[float] = []
+        errors: Counter = Counter()
+
+        async def dispatch(message, timed: bool):
+            start = time.perf_counter()
+            try:
+                for group in ordered:
+                    for handler in group:
+                        if not await handler.check(tg, message):
+                            continue
+                        t0 = time.perf_counter()
+                        try:
+                            await handler.callback(tg, message)
+                        except ContinuePropagation:
+                            continue
+                        except StopPropagation:
+                            raise
+                        except Exception as e:
+                            errors[f"{handler.callback.__name__}: {type(e).__name__}"] += 1
+                        finally:
+                            if timed:
+                                latency[handler.callback.__name__].append(time.perf_counter() - t0)
+                        break
+            except StopPropagation:
+                pass
+            if timed:
+                update_latency.append(time.perf_counter() - start)
+
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await dispatch(*item)
+
+        # Warm-up updates go through first and are not measured
+        warm = [r for r in records if r.get("warmup")]
+        measured = [r for r in records if not r.get("warmup")]
+        ids = iter(range(1, 10 ** 9, 2))
+        for r in warm:
+            await dispatch(_to_message(r, tg, next(ids)), False)
+        await bot.ai_bursts.drain()
+        await bot.scheduler.drain()
+        await outbox.drain()
+        base_tg, base_ai, base_db = sum(tg.calls.values()), ai.calls, sum(store.backend.calls.values())
+        tg.calls.clear()
+        store.backend.calls.clear()
+
+        messages = [_to_message(r, tg, next(ids)) for r in measured]
+        workers = [asyncio.get_running_loop().create_task(worker()) for _ in range(args.workers)]
+        t0 = time.perf_counter()
+        for m in messages:
+            if args.rate:
+                await asyncio.sleep(1 / args.rate)
+            queue.put_nowait((m, True))
+        for _ in workers:
+            queue.put_nowait(None)
+        await asyncio.gather(*workers)
+        await bot.ai_bursts.drain()  # group bursts still collecting are answered
+        await bot.scheduler.drain()  # moderation and AI jobs still queued on their lanes
+        await outbox.drain()  # replies queued without waiting still count
+        elapsed = time.perf_counter() - t0
+        await store.flush()
+
+        n = len(messages)
+        return {
+            "workload": name,
+            "updates": n,
+            "seconds": round(elapsed, 3),
+            "updates_per_s": round(n / elapsed, 1) if elapsed else 0.0,
+            "update_latency_ms": {q: round(_pct(update_latency, p) * 1000, 2)
+                                  for q, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+            "handlers": {
+                h: {"count": len(s), "p50_ms": round(_pct(s, 0.5) * 1000, 2),
+                    "p95_ms": round(_pct(s, 0.95) * 1000, 2), "p99_ms": round(_pct(s, 0.99) * 1000, 2)}
+                for h, s in sorted(latency.items())
+            },
+            "api_per_update": {
+                "telegram": round(sum(tg.calls.values()) / n, 3),
+                "openai": round((ai.calls - base_ai) / n, 3),
+                "db": round(sum(store.backend.calls.values()) / n, 3),
+            },
+            "lanes": {
+                name: {"done": lane.done, "shed": lane.shed, "peak": lane.peak,
+                       "wait_p95_ms": round(bot.metrics.histograms[f"queue_wait_{name}"].quantile(0.95) * 1000, 2)
+                       if f"queue_wait_{name}" in bot.metrics.histograms else 0.0}
+                for name, lane in bot.scheduler.lanes.items() if lane.done or lane.shed
+            },
+            "telegram_calls": dict(tg.calls.most_common()),
+            "errors": dict(errors),
+            "warmup": {"updates": len(warm), "telegram": base_tg, "openai": base_ai, "db": base_db},
+        }
+
+    return bot.app.loop.run_until_complete(go())
+
+
+def _print(result: dict):
+    r = result
+    print(f"\n== {r['workload']}: {r['updates']} updates in {r['seconds']}s -> {r['updates_per_s']:,} updates/s")
+    ul = r["update_latency_ms"]
+    print(f"   update latency ms  p50 {ul['p50']}  p95 {ul['p95']}  p99 {ul['p99']}")
+    print(f"   {'handler':22s} {'count':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for h, s in r["handlers"].items():
+        print(f"   {h:22s} {s['count']:7d} {s['p50_ms']:9.2f} {s['p95_ms']:9.2f} {s['p99_ms']:9.2f}")
+    for name, lane in r.get("lanes", {}).items():
+        print(f"   lane {name:12s} done {lane['done']:6d}  shed {lane['shed']:5d}  peak queue {lane['peak']:5d}  "
+              f"wait p95 {lane['wait_p95_ms']:.2f} ms")
+    api = r["api_per_update"]
+    print(f"   API calls/update   telegram {api['telegram']}  openai {api['openai']}  db {api['db']}")
+    if r["telegram_calls"]:
+        print("   telegram: " + ", ".join(f"{k} {v}" for k, v in r["telegram_calls"].items()))
+    if r["errors"]:
+        print("   handler errors: " + ", ".join(f"{k} x{v}" for k, v in r["errors"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline update-replay benchmark")
+    parser.add_argument("--workload", nargs="*", default=list(WORKLOADS), choices=WORKLOADS)
+    parser.add_argument("--input", help="replay recorded updates (JSON lines) instead of synthetic workloads")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) + 4),
+                        help="concurrent dispatcher workers (Pyrogram's default)")
+    parser.add_argument("--rate", type=float, default=0, help="arrival rate in updates/s (0 = all at once)")
+    parser.add_argument("--tg-latency", type=float, default=0.03)
+    parser.add_argument("--openai-latency", type=float, default=0.6)
+    parser.add_argument("--db-latency", type=float, default=0.002)
+    parser.add_argument("--telegram-limits", action="store_true", help="keep the outbox's real flood limits")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="print results as JSON (one object per line)")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single or args.input:
+        if args.input:
+            name, records = os.path.basename(args.input), load_records(args.input)
+        else:
+            name, records = args.workload[0], synthesize(args.workload[0], args.updates, args.seed)
+        result = run_single(name, records, args)
+        print(json.dumps(result)) if args.json else _print(result)
+        return
+
+    # One interpreter per workload: module-level caches start cold every time
+    passthrough = [a for a in sys.argv[1:] if a not in ("--json",)]
+    cut = [i for i, a in enumerate(passthrough) if a == "--workload"]
+    if cut:
+        i = cut[0] + 1
+        while i < len(passthrough) and not passthrough[i].startswith("--"):
+            i += 1
+        passthrough = passthrough[:cut[0]] + passthrough[i:]
+    for workload in args.workload:
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.replay", "--single", "--json", "--workload", workload, *passthrough],
+            capture_output=True, text=True,
+        )
+        if out.returncode != 0:
+            print(f"== {workload}: failed\n{out.stderr}", file=sys.stderr)
+            continue
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(json.dumps(result)) if args.json else _print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bench/streaming.py - time to first visible reply, streamed vs. complete
+# DMs go through the real AIEngine against ai/stub.py (first word after
+# --delay, then one word per --token-delay) and out through the real Outbox to
+# fake messages that record when text becomes visible. Both runs generate the
+# same streamed reply; without streaming it is sent once complete (what a
+# non-streamed completion costs), with it the placeholder is edited as words
+# arrive (ai/streaming.py), at a cadence the outbox's Telegram limits allow.
+#
+#   python -m bench.streaming [--chats 20] [--delay 0.8] [--token-delay 0.05] [--interval 1.0]
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import List
+
+from ai.engine import AIEngine, StreamInterrupted
+from ai.streaming import StreamingReplies
+from ai.stub import StubServer
+from bot.sender import CHAT, Outbox
+
+
+class FakeSent:
+    def __init__(self, chat, latency: float, log: list):
+        self.chat = chat
+        self.latency = latency
+        self.log = log
+
+    async def edit_text(self, text: str):
+        await asyncio.sleep(self.latency)
+        self.log.append((time.perf_counter(), text))
+        return self
+
+
+class FakeMessage:
+    def __init__(self, chat_id: int, latency: float):
+        self.chat = SimpleNamespace(id=chat_id)
+        self.latency = latency
+        self.log: List[tuple] = []  # (when visible, text)
+
+    async def reply_text(self, text: str, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.log.append((time.perf_counter(), text))
+        return FakeSent(self.chat, self.latency, self.log)
+
+
+async def run(args, stream: bool) -> dict:
+    server = await StubServer(delay=args.delay, token_delay=args.token_delay, words=args.words).start()
+    engine = AIEngine(api_key="stub", base_url=server.base_url, max_workers=args.chats, timeout=60)
+    outbox = Outbox()  # real per-chat and global limits: edits are messages too
+    replies = StreamingReplies(outbox, interval=args.interval, min_chars=args.min_chars, priority=CHAT)
+    engine._get_client()  # keep the SDK import out of the timing
+    messages = [FakeMessage(i, args.tg_latency) for i in range(1, args.chats + 1)]
+
+    async def answer(message: FakeMessage):
+        prompt = [{"role": "user", "content": f"tell me a story {message.chat.id}"}]
+        pieces = engine.stream(prompt, chat_id=message.chat.id)
+        if stream:
+            await replies.reply(message, pieces, lambda: "fallback")
+        else:
+            try:
+                text = "".join([piece async for piece in pieces])
+            except StreamInterrupted:
+                text = ""
+            await outbox.reply(message, text or "fallback", priority=CHAT)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(answer(m) for m in messages))
+    await outbox.drain()
+    await engine.close()
+    await server.stop()
+    await outbox.close()
+    # First time real text (not the placeholder) is on screen, and when the full reply is
+    first = sorted(next(t for t, text in m.log if text != replies.placeholder) - t0 for m in messages)
+    done = sorted(m.log[-1][0] - t0 for m in messages)
+    return {
+        "first_p50": first[len(first) // 2], "first_max": first[-1],
+        "done_p50": done[len(done) // 2], "done_max": done[-1],
+        "calls": sum(len(m.log) for m in messages) / len(messages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming reply benchmark")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.8, help="seconds to the first streamed word")
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--words", type=int, default=60, help="words per reply")
+    parser.add_argument("--tg-latency", type=float, default=0.05)
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between edits")
+    parser.add_argument("--min-chars", type=int, default=30)
+    args = parser.parse_args()
+    print(f"{args.chats} DMs, first word after {args.delay:g}s, {args.words} words at {args.token_delay:g}s each")
+    for stream in (False, True):
+        r = asyncio.run(run(args, stream))
+        print(f"{'streamed' if stream else 'complete':9s} first visible text s p50 {r['first_p50']:5.2f} "
+              f"max {r['first_max']:5.2f}  full reply s p50 {r['done_p50']:5.2f} max {r['done_max']:5.2f}  "
+              f"Telegram calls/reply {r['calls']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
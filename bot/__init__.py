@@ -0,0 +1,5 @@
+from .admins import AdminCache, member_can_moderate, member_is_admin
+from .fanout import GbanExecutor, get_gban_executor
+from .members import MemberIndex, MemberRef
+from .scheduler import Lane, Scheduler, get_scheduler
+from .sender import Outbox, TokenBucket, get_outbox
@@ -0,0 +1,218 @@
+# bot/admins.py - TTL-cached moderation rights per (chat, user)
+# The admin list of a chat is fetched once (one API call) and kept for `ttl`
+# seconds; after that both "is admin" and "is not admin" answers are dict lookups.
+# Chat-member-updated events patch the cache immediately.
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+log = logging.getLogger("masterbot.admins")
+
+_OWNER_STATUSES = {"owner", "creator"}
+_ADMIN_STATUSES = _OWNER_STATUSES | {"administrator"}
+
+
+def _status_name(member) -> str:
+    status = getattr(member, "status", None)
+    # Pyrogram 2 uses ChatMemberStatus enums; older builds used plain strings
+    return str(getattr(status, "value", status) or "").lower()
+
+
+def member_can_moderate(member) -> bool:
+    """True for the chat owner and admins who can restrict or promote members."""
+    if member is None:
+        return False
+    status = _status_name(member)
+    if status in _OWNER_STATUSES:
+        return True
+    if status == "administrator":
+        rights = getattr(member, "privileges", None) or member
+        if getattr(rights, "can_restrict_members", False) or getattr(rights, "can_promote_members", False):
+            return True
+    return False
+
+
+def member_is_admin(member) -> bool:
+    return _status_name(member) in _ADMIN_STATUSES
+
+
+class AdminCache:
+    """
+    - ttl: seconds a chat's admin list (and every answer derived from it) is trusted
+    - single_ttl: seconds a one-off get_chat_member answer is trusted (when warming failed)
+    - max_chats / max_entries: LRU bounds for warmed chats and one-off entries
+    """
+
+    def __init__(self, ttl: float = 600.0, single_ttl: float = 120.0, max_chats: int = 10000, max_entries: int = 50000):
+        self.ttl = ttl
+        self.single_ttl = single_ttl
+        self.max_chats = max_chats
+        self.max_entries = max_entries
+        # chat_id -> (expires, moderators, all admins)
+        self._chats: "OrderedDict[int, Tuple[float, Set[int], Set[int]]]" = OrderedDict()
+        # (chat_id, user_id) -> (expires, allowed); used only for chats we could not warm
+        self._single: "OrderedDict[Tuple[int, int], Tuple[float, bool]]" = OrderedDict()
+        self._warming: Dict[int, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    def lookup(self, chat_id: int, user_id: int) -> Optional[bool]:
+        """In-memory answer, or None when the chat needs (re)warming."""
+        now = time.monotonic()
+        entry = self._chats.get(chat_id)
+        if entry is not None:
+            if entry[0] >= now:
+                self._chats.move_to_end(chat_id)
+                return user_id in entry[1]
+            del self._chats[chat_id]
+        single = self._single.get((chat_id, user_id))
+        if single is not None:
+            if single[0] >= now:
+                return single[1]
+            del self._single[(chat_id, user_id)]
+        return None
+
+    async def can_moderate(self, client, chat_id: int, user_id: int) -> bool:
+        allowed = self.lookup(chat_id, user_id)
+        if allowed is not None:
+            self.hits += 1
+            return allowed
+        self.misses += 1
+        if await self.warm(client, chat_id):
+            return bool(self.lookup(chat_id, user_id))
+        # Could not list admins (e.g. bot is not admin there): ask about this user only.
+        try:
+            self.api_calls += 1
+            member = await client.get_chat_member(chat_id, user_id)
+            allowed = member_can_moderate(member)
+        except Exception:
+            allowed = False
+        self._put_single(chat_id, user_id, allowed)
+        return allowed
+
+    async def warm(self, client, chat_id: int) -> bool:
+        """Fetch the chat's admin list once; concurrent callers share the request."""
+        task = self._warming.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_admins(client, chat_id))
+            self._warming[chat_id] = task
+            task.add_done_callback(lambda _t: self._warming.pop(chat_id, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_admins(self, client, chat_id: int) -> bool:
+        from pyrogram.enums import ChatMembersFilter
+
+        moderators, admins = set(), set()
+        try:
+            self.api_calls += 1
+            async for member in client.get_chat_members(chat_id, filter=ChatMembersFilter.ADMINISTRATORS):
+                if not member.user:
+                    continue
+                admins.add(member.user.id)
+                if member_can_moderate(member):
+                    moderators.add(member.user.id)
+        except Exception as e:
+            log.debug("Admin list for %s unavailable: %s", chat_id, e)
+            return False
+        self.set_admins(chat_id, moderators, admins)
+        return True
+
+    def set_admins(self, chat_id: int, moderators: Set[int], admins: Optional[Set[int]] = None, expires: Optional[float] = None):
+        self._chats[chat_id] = (
+            expires if expires is not None else time.monotonic() + self.ttl,
+            set(moderators),
+            set(admins if admins is not None else moderators),
+        )
+        self._chats.move_to_end(chat_id)
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+    def _put_single(self, chat_id: int, user_id: int, allowed: bool):
+        key = (chat_id, user_id)
+        self._single[key] = (time.monotonic() + self.single_ttl, allowed)
+        self._single.move_to_end(key)
+        while len(self._single) > self.max_entries:
+            self._single.popitem(last=False)
+
+    def invalidate(self, chat_id: int, user_id: Optional[int] = None):
+        if user_id is None:
+            self._chats.pop(chat_id, None)
+            for key in [k for k in self._single if k[0] == chat_id]:
+                del self._single[key]
+            return
+        self._single.pop((chat_id, user_id), None)
+
+    def on_member_updated(self, update):
+        """
+        Apply a ChatMemberUpdated event: promotions, demotions, rights changes,
+        admins leaving. A warmed chat is patched in place instead of re-fetched.
+        """
+        chat = getattr(update, "chat", None)
+        new = getattr(update, "new_chat_member", None)
+        old = getattr(update, "old_chat_member", None)
+        member = new or old
+        user = getattr(member, "user", None)
+        if chat is None or user is None:
+            return
+        if not (member_is_admin(new) or member_is_admin(old)):
+            return  # ordinary joins/leaves do not change moderation rights
+        self.invalidate(chat.id, user.id)
+        entry = self._chats.get(chat.id)
+        if entry is None:
+            return
+        _, moderators, admins = entry
+        moderators.discard(user.id)
+        admins.discard(user.id)
+        if new is not None and member_is_admin(new):
+            admins.add(user.id)
+            if member_can_moderate(new):
+                moderators.add(user.id)
+
+    def is_admin(self, chat_id: int, user_id: int) -> Optional[bool]:
+        """Any admin (not necessarily with restrict rights); None when not warmed."""
+        entry = self._chats.get(chat_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return user_id in entry[2]
+
+    # ---- warm restarts (db/snapshots.py) ----
+    def snapshot(self) -> dict:
+        """Unexpired entries with their remaining seconds, least recently used first."""
+        now = time.monotonic()
+        return {
+            "chats": [[chat_id, expires - now, sorted(mods), sorted(admins)]
+                      for chat_id, (expires, mods, admins) in self._chats.items() if expires > now],
+            "single": [[chat_id, user_id, expires - now, allowed]
+                       for (chat_id, user_id), (expires, allowed) in self._single.items() if expires > now],
+        }
+
+    def restore(self, data: dict, age: float) -> int:
+        """Reload a snapshot taken `age` seconds ago; expired entries and chats known by now are skipped."""
+        now = time.monotonic()
+        restored = 0
+        for chat_id, remaining, mods, admins in data.get("chats", ()):
+            if remaining > age and chat_id not in self._chats:
+                self.set_admins(chat_id, set(mods), set(admins), expires=now + remaining - age)
+                restored += 1
+        for chat_id, user_id, remaining, allowed in data.get("single", ()):
+            if remaining > age and (chat_id, user_id) not in self._single:
+                self._single[(chat_id, user_id)] = (now + remaining - age, allowed)
+                restored += 1
+        while len(self._single) > self.max_entries:
+            self._single.popitem(last=False)
+        return restored
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "chats": len(self._chats),
+            "single_entries": len(self._single),
+            "hits": self.hits,
+            "misses": self.misses,
+            "api_calls": self.api_calls,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
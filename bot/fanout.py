@@ -0,0 +1,312 @@
+# bot/fanout.py - throttled gban/ungban fan-out across every group the bot administers
+# Each job bans (or unbans) one user in many chats from a background task:
+# rate-limited, FloodWait-aware, checkpointed to the data store so a restart
+# resumes where it stopped, with a progress message edited for the owner.
+# A running job holds a lease in its document, renewed by a heartbeat; only
+# jobs whose lease ran out (their process died) are resumed, so a restarted
+# shard never repeats a fan-out another shard is still executing.
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Dict, List, Optional
+
+log = logging.getLogger("masterbot.fanout")
+
+KIND = "gban"
+
+
+class FanoutJob:
+    __slots__ = ("job_id", "action", "user_id", "pending", "total", "done", "failed",
+                 "status", "report_chat", "report_message", "created", "owner", "lease_until", "task")
+
+    def __init__(self, job_id: str, action: str, user_id: int, pending: List[int],
+                 report_chat: Optional[int] = None, report_message: Optional[int] = None,
+                 total: Optional[int] = None, done: int = 0, failed: int = 0, created: Optional[float] = None,
+                 owner: str = "", lease_until: float = 0.0):
+        self.job_id = job_id
+        self.action = action
+        self.user_id = user_id
+        self.pending = list(pending)
+        self.total = total if total is not None else len(pending)
+        self.done = done
+        self.failed = failed
+        self.status = "running"
+        self.report_chat = report_chat
+        self.report_message = report_message
+        self.created = created or time.time()
+        self.owner = owner  # host:pid of the process executing it
+        self.lease_until = lease_until  # wall clock; another process may take the job over after it
+        self.task: Optional[asyncio.Task] = None
+
+    def to_doc(self) -> dict:
+        return {
+            "kind": KIND, "action": self.action, "user_id": self.user_id, "pending": list(self.pending),
+            "total": self.total, "done": self.done, "failed": self.failed, "status": self.status,
+            "report_chat": self.report_chat, "report_message": self.report_message, "created": self.created,
+            "owner": self.owner, "lease_until": self.lease_until,
+        }
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "FanoutJob":
+        return cls(doc["job_id"], doc["action"], doc["user_id"], doc.get("pending") or [],
+                   doc.get("report_chat"), doc.get("report_message"), doc.get("total"),
+                   doc.get("done", 0), doc.get("failed", 0), doc.get("created"),
+                   doc.get("owner", ""), doc.get("lease_until", 0.0))
+
+    def progress(self) -> str:
+        verb = "Global ban" if self.action == "ban" else "Global unban"
+        text = f"{verb} of {self.user_id}: {self.done + self.failed}/{self.total} groups"
+        if self.failed:
+            text += f" ({self.failed} failed)"
+        if self.status != "running":
+            text += f" — {self.status}."
+        return text
+
+
+class GbanExecutor:
+    """
+    - rate: ban/unban API calls per second across all jobs
+    - checkpoint_every: chats processed between checkpoints to the store
+    - progress_interval: seconds between edits of the owner's progress message
+    - lease: seconds a running job stays claimed without a heartbeat (renewed every lease/3)
+    """
+
+    def __init__(self, store, rate: float = 20.0, checkpoint_every: int = 25, progress_interval: float = 5.0,
+                 lease: float = 60.0):
+        self.store = store
+        self.rate = rate
+        self.checkpoint_every = checkpoint_every
+        self.progress_interval = progress_interval
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs: Dict[str, FanoutJob] = {}
+        self._next_slot = 0.0
+        self._throttle_lock: Optional[asyncio.Lock] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watch: Optional[asyncio.Task] = None
+        self.flood_waits = 0
+        self.taken_over = 0
+
+    # ---- public API ----
+    async def submit(self, client, user_id: int, action: str = "ban", chats: Optional[List[int]] = None,
+                     report_chat: Optional[int] = None, report_message: Optional[int] = None) -> FanoutJob:
+        """Start a fan-out job; an unfinished job for the same user is cancelled first."""
+        await self.store.start()
+        await self.store.wait_loaded()  # the chat list must be complete, not just the snapshot's
+        for job in list(self.jobs.values()):
+            if job.user_id == user_id and job.status == "running":
+                await self.cancel(job.job_id)
+        if chats is None:
+            # Every known group: bot_admin flags are only learned from our own ChatMemberUpdated or an
+            # earlier fan-out, so filtering on them would skip groups the bot does administer.
+            # Chats known to be administered go first; the others prune themselves (ChatAdminRequired).
+            admin = self.store.admin_chats()
+            chats = admin + [c for c, is_admin in self.store.chats.items() if not is_admin]
+        job = FanoutJob(uuid.uuid4().hex[:12], action, user_id, chats, report_chat, report_message)
+        self._claim(job)
+        await self.store.save_job(job.job_id, job.to_doc())
+        self._launch(client, job)
+        return job
+
+    async def resume(self, client) -> int:
+        """Take over "running" jobs whose lease expired (their process stopped or died)."""
+        await self.store.start()
+        resumed = 0
+        now = time.time()
+        for doc in await self.store.load_jobs(KIND):
+            if doc.get("job_id") in self.jobs or (doc.get("lease_until") or 0) > now:
+                continue  # ours, or another process still heartbeats it
+            job = FanoutJob.from_doc(doc)
+            if job.owner and job.owner != self.owner:
+                self.taken_over += 1
+            self._claim(job)
+            await self.store.save_job(job.job_id, job.to_doc())
+            self._launch(client, job)
+            resumed += 1
+        if resumed:
+            log.info("Resumed %d gban fan-out job(s).", resumed)
+        return resumed
+
+    def watch(self, client):
+        """resume() every lease: jobs of a crashed worker are picked up once their lease runs out."""
+        if self._watch is None or self._watch.done():
+            self._watch = asyncio.get_running_loop().create_task(self._watch_loop(client))
+
+    async def _watch_loop(self, client):
+        while True:
+            await asyncio.sleep(self.lease)
+            try:
+                await self.resume(client)
+            except Exception as e:
+                log.warning("Checking for orphaned gban jobs failed: %s", e)
+
+    async def cancel(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is None or job.status != "running":
+            return
+        job.status = "cancelled"
+        if job.task is not None:
+            job.task.cancel()
+        await self.store.save_job(job.job_id, job.to_doc())
+
+    def running(self) -> List[FanoutJob]:
+        return [j for j in self.jobs.values() if j.status == "running"]
+
+    async def close(self):
+        # Leave jobs "running" in the store, with the lease released, so the next start resumes them at once
+        for task in (self._watch, self._heartbeat):
+            if task is not None:
+                task.cancel()
+        self._watch = self._heartbeat = None
+        for job in self.running():
+            job.lease_until = 0.0  # written by the job's checkpoint on cancellation
+            if job.task is not None:
+                job.task.cancel()
+                try:
+                    await job.task
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+    # ---- internals ----
+    def _claim(self, job: FanoutJob):
+        job.owner = self.owner
+        job.lease_until = time.time() + self.lease
+
+    def _launch(self, client, job: FanoutJob):
+        self.jobs[job.job_id] = job
+        loop = asyncio.get_running_loop()
+        job.task = loop.create_task(self._run(client, job))
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = loop.create_task(self._heartbeat_loop())
+
+    async def _heartbeat_loop(self):
+        # Renews the leases even while a job sits in a long FloodWait between checkpoints
+        while self.running():
+            await asyncio.sleep(self.lease / 3)
+            for job in self.running():
+                self._claim(job)
+                try:
+                    await self.store.save_job(job.job_id, {"owner": job.owner, "lease_until": job.lease_until})
+                except Exception as e:
+                    log.warning("Renewing the lease of gban job %s failed: %s", job.job_id, e)
+
+    async def _throttle(self):
+        if self._throttle_lock is None:
+            self._throttle_lock = asyncio.Lock()
+        async with self._throttle_lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + 1.0 / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _apply(self, client, chat_id: int, user_id: int, action: str) -> bool:
+        from pyrogram.errors import FloodWait, RPCError
+
+        from .sender import BULK, get_outbox
+
+        call = client.ban_chat_member if action == "ban" else client.unban_chat_member
+        while True:
+            await self._throttle()
+            try:
+                # Lowest priority in the shared outbox: replies and moderation go first
+                await get_outbox().call(chat_id, call, chat_id, user_id, priority=BULK)
+                self.store.note_chat(chat_id, bot_admin=True)  # it could (un)ban, so it administers the chat
+                return True
+            except FloodWait as e:
+                # Pause the whole executor, not just this job: the limit is per bot
+                self.flood_waits += 1
+                delay = float(getattr(e, "value", 1) or 1) + 1.0
+                log.warning("FloodWait %.0fs during gban fan-out; pausing.", delay)
+                self._next_slot = max(self._next_slot, time.monotonic() + delay)
+            except RPCError as e:
+                name = type(e).__name__
+                if name in ("ChatAdminRequired", "ChannelPrivate", "ChatWriteForbidden", "PeerIdInvalid"):
+                    self.store.note_chat(chat_id, bot_admin=False)
+                log.debug("gban %s in %s failed: %s", action, chat_id, name)
+                return False
+            except Exception as e:
+                log.debug("gban %s in %s failed: %s", action, chat_id, e)
+                return False
+
+    async def _run(self, client, job: FanoutJob):
+        last_report = 0.0
+        since_checkpoint = 0
+        try:
+            while job.pending:
+                chat_id = job.pending[0]
+                if await self._apply(client, chat_id, job.user_id, job.action):
+                    job.done += 1
+                else:
+                    job.failed += 1
+                job.pending.pop(0)
+                since_checkpoint += 1
+                if since_checkpoint >= self.checkpoint_every:
+                    since_checkpoint = 0
+                    await self.store.save_job(job.job_id, job.to_doc())
+                if time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    await self._report(client, job)
+            job.status = "done"
+        except asyncio.CancelledError:
+            # Checkpoint on the way out; "cancelled" was set by cancel(), else we resume later
+            await self.store.save_job(job.job_id, job.to_doc())
+            raise
+        except Exception as e:
+            job.status = "failed"
+            log.exception("gban fan-out job %s failed: %s", job.job_id, e)
+        await self.store.save_job(job.job_id, job.to_doc())
+        await self._report(client, job, final=True)
+        log.info(job.progress())
+
+    async def _report(self, client, job: FanoutJob, final: bool = False):
+        if not job.report_chat or not job.report_message:
+            return
+        from .sender import BULK, get_outbox
+
+        # The text is read when the edit is sent, so a queued edit carries the latest count. Progress
+        # edits coalesce per job (and are not resent within the outbox's window); the final one always goes.
+        fut = get_outbox().submit(
+            job.report_chat, lambda: client.edit_message_text(job.report_chat, job.report_message, job.progress()),
+            priority=BULK, key=None if final else f"gban_progress:{job.job_id}",
+        )
+        if not final:
+            fut.add_done_callback(_log_report_failure)
+            return
+        try:
+            await fut
+        except Exception as e:
+            _log_report_error(e)
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self.running()),
+            "jobs": len(self.jobs),
+            "flood_waits": self.flood_waits,
+            "taken_over": self.taken_over,
+        }
+
+
+def _log_report_failure(fut: asyncio.Future):
+    if not fut.cancelled() and fut.exception() is not None:
+        _log_report_error(fut.exception())
+
+
+def _log_report_error(e: BaseException):
+    if type(e).__name__ != "MessageNotModified":  # harmless: the text did not change
+        log.debug("gban progress edit failed: %s", e)
+
+
+_executor: Optional[GbanExecutor] = None
+
+
+def get_gban_executor() -> GbanExecutor:
+    global _executor
+    if _executor is None:
+        from db import get_store
+        _executor = GbanExecutor(get_store())
+    return _executor
@@ -0,0 +1,289 @@
+# bot/members.py - passive per-chat member index for resolve_user
+# Fed from messages and member events the bot already receives, so resolving
+# "@name" or "master ban rahul" is a dict lookup instead of an API scan.
+# Bounded: members per chat and chats overall are LRU-evicted.
+# Usernames change hands on Telegram: a user seen under a new name loses the old
+# one here, and a name not seen for `username_ttl` is looked up again
+# (client.get_users) instead of trusted.
+
+import bisect
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+
+class MemberRef:
+    __slots__ = ("id", "username", "first_name", "seen")
+
+    def __init__(self, user_id: int, username: Optional[str], first_name: Optional[str]):
+        self.id = user_id
+        self.username = sys.intern(username) if username else None
+        self.first_name = sys.intern(first_name) if first_name else None
+        self.seen = 0.0  # time.monotonic() of the last update showing this username (global index)
+
+    def to_user(self, client=None):
+        """A minimal pyrogram User (enough for .id, .first_name, .username, .mention)."""
+        from pyrogram.types import User
+        return User(id=self.id, first_name=self.first_name, username=self.username, client=client)
+
+
+class _ChatIndex:
+    __slots__ = ("members", "by_username", "by_name", "_sorted", "_dirty")
+
+    def __init__(self):
+        self.members: "OrderedDict[int, MemberRef]" = OrderedDict()
+        self.by_username: Dict[str, int] = {}
+        self.by_name: Dict[str, List[int]] = {}
+        self._sorted: List[str] = []
+        self._dirty = False
+
+    def add(self, ref: MemberRef):
+        old = self.members.get(ref.id)
+        if old is not None:
+            if old.username == ref.username and old.first_name == ref.first_name:
+                self.members.move_to_end(ref.id)
+                return
+            self.remove(ref.id)
+        self.members[ref.id] = ref
+        if ref.username:
+            self.by_username[ref.username.lower()] = ref.id
+        if ref.first_name:
+            self.by_name.setdefault(ref.first_name.lower(), []).append(ref.id)
+        self._dirty = True
+
+    def remove(self, user_id: int) -> Optional[MemberRef]:
+        ref = self.members.pop(user_id, None)
+        if ref is None:
+            return None
+        if ref.username and self.by_username.get(ref.username.lower()) == user_id:
+            del self.by_username[ref.username.lower()]
+        if ref.first_name:
+            key = ref.first_name.lower()
+            ids = self.by_name.get(key)
+            if ids and user_id in ids:
+                ids.remove(user_id)
+                if not ids:
+                    del self.by_name[key]
+        self._dirty = True
+        return ref
+
+    def keys(self) -> List[str]:
+        # Sorted usernames + first names, rebuilt lazily for prefix search
+        if self._dirty:
+            self._sorted = sorted(set(self.by_username) | set(self.by_name))
+            self._dirty = False
+        return self._sorted
+
+
+class MemberIndex:
+    """
+    - max_members_per_chat: LRU bound per chat (least recently seen users dropped)
+    - max_chats: LRU bound on chats
+    - max_usernames: LRU bound on the global username index
+    - username_ttl: seconds after which an unseen username is no longer trusted
+      (by_username() misses, so the caller asks Telegram who holds it now)
+    Usernames are global on Telegram, so they are also indexed across chats.
+    """
+
+    def __init__(self, max_members_per_chat: int = 5000, max_chats: int = 2000, max_usernames: int = 200000,
+                 username_ttl: float = 3600.0):
+        self.max_members_per_chat = max_members_per_chat
+        self.max_chats = max_chats
+        self.max_usernames = max_usernames
+        self.username_ttl = username_ttl
+        self._chats: "OrderedDict[int, _ChatIndex]" = OrderedDict()
+        self._usernames: "OrderedDict[str, MemberRef]" = OrderedDict()
+        self._username_of: Dict[int, str] = {}  # user id -> its key in _usernames
+        self.hits = 0
+        self.misses = 0
+        self.renamed = 0
+        self.expired = 0
+
+    # ---- feeding ----
+    def add(self, chat_id: Optional[int], user) -> Optional[MemberRef]:
+        if user is None:
+            return None
+        user_id = getattr(user, "id", None)
+        if not user_id:
+            return None
+        ref = MemberRef(user_id, getattr(user, "username", None), getattr(user, "first_name", None))
+        self._index_username(ref, time.monotonic())
+        if chat_id is not None:
+            self._add_member(chat_id, ref)
+        return ref
+
+    def _add_member(self, chat_id: int, ref: MemberRef):
+        idx = self._chats.get(chat_id)
+        if idx is None:
+            idx = _ChatIndex()
+            self._chats[chat_id] = idx
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        idx.add(ref)
+        while len(idx.members) > self.max_members_per_chat:
+            idx.remove(next(iter(idx.members)))
+
+    def remove(self, chat_id: int, user_id: int):
+        idx = self._chats.get(chat_id)
+        if idx is not None:
+            idx.remove(user_id)
+
+    def _index_username(self, ref: MemberRef, seen: float):
+        key = ref.username.lower() if ref.username else None
+        old = self._username_of.get(ref.id)
+        if old is not None and old != key:
+            # Renamed, or dropped the username: the old one is free for someone else to take
+            self._drop_username(old)
+            self.renamed += 1
+        if key is None:
+            return
+        holder = self._usernames.get(key)
+        if holder is not None and holder.id != ref.id:
+            self._drop_username(key)  # the name changed hands
+        ref.seen = seen
+        self._usernames[key] = ref
+        self._usernames.move_to_end(key)
+        self._username_of[ref.id] = key
+        while len(self._usernames) > self.max_usernames:
+            self._drop_username(next(iter(self._usernames)))
+
+    def _drop_username(self, key: str):
+        ref = self._usernames.pop(key, None)
+        if ref is not None and self._username_of.get(ref.id) == key:
+            del self._username_of[ref.id]
+
+    def observe_message(self, message):
+        """Index every user visible on a message: sender, replied-to sender, new members, text mentions."""
+        chat = getattr(message, "chat", None)
+        chat_id = chat.id if chat else None
+        self.add(chat_id, getattr(message, "from_user", None))
+        reply = getattr(message, "reply_to_message", None)
+        if reply is not None:
+            self.add(chat_id, getattr(reply, "from_user", None))
+        for user in getattr(message, "new_chat_members", None) or ():
+            self.add(chat_id, user)
+        left = getattr(message, "left_chat_member", None)
+        if left is not None and chat_id is not None:
+            self.remove(chat_id, left.id)
+        for ent in getattr(message, "entities", None) or ():
+            if getattr(ent, "user", None) is not None:
+                self.add(chat_id, ent.user)
+
+    def observe_member_update(self, update):
+        chat = getattr(update, "chat", None)
+        if chat is None:
+            return
+        new = getattr(update, "new_chat_member", None)
+        old = getattr(update, "old_chat_member", None)
+        member = new or old
+        user = getattr(member, "user", None)
+        if user is None:
+            return
+        status = getattr(getattr(new, "status", None), "value", None) if new is not None else "left"
+        if status in ("left", "banned"):
+            self.remove(chat.id, user.id)
+        else:
+            self.add(chat.id, user)
+
+    def observe_members(self, chat_id: int, members: Iterable):
+        for member in members:
+            self.add(chat_id, getattr(member, "user", member))
+
+    # ---- lookups ----
+    def by_username(self, username: str) -> Optional[MemberRef]:
+        key = username.lstrip("@").lower()
+        ref = self._usernames.get(key)
+        if ref is not None and time.monotonic() - ref.seen > self.username_ttl:
+            # Not seen for a while: it may belong to someone else by now
+            self._drop_username(key)
+            self.expired += 1
+            ref = None
+        if ref is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return ref
+
+    def lookup(self, chat_id: int, name: str) -> Optional[MemberRef]:
+        """Exact username or first-name match in this chat (most recently seen wins)."""
+        idx = self._chats.get(chat_id)
+        key = name.lstrip("@").lower()
+        if idx is not None:
+            user_id = idx.by_username.get(key)
+            if user_id is None:
+                ids = idx.by_name.get(key)
+                user_id = ids[-1] if ids else None
+            if user_id is not None:
+                self.hits += 1
+                return idx.members[user_id]
+        self.misses += 1
+        return None
+
+    def prefix(self, chat_id: int, prefix: str, limit: int = 10) -> List[MemberRef]:
+        """Members whose username or first name starts with prefix."""
+        idx = self._chats.get(chat_id)
+        if idx is None or not prefix:
+            return []
+        prefix = prefix.lstrip("@").lower()
+        keys = idx.keys()
+        out, seen = [], set()
+        i = bisect.bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix) and len(out) < limit:
+            key = keys[i]
+            ids = [idx.by_username[key]] if key in idx.by_username else []
+            ids += idx.by_name.get(key, [])
+            for user_id in ids:
+                if user_id not in seen and user_id in idx.members:
+                    seen.add(user_id)
+                    out.append(idx.members[user_id])
+            i += 1
+        return out[:limit]
+
+    # ---- warm restarts (db/snapshots.py) ----
+    def snapshot(self) -> dict:
+        """Every indexed user as [id, username, first_name], least recently seen first."""
+        row = lambda ref: [ref.id, ref.username, ref.first_name]
+        now = time.monotonic()
+        return {
+            # Plus seconds since the username was last seen, so expiry carries over a restart
+            "usernames": [row(ref) + [round(now - ref.seen)] for ref in self._usernames.values()],
+            "chats": [[chat_id, [row(ref) for ref in idx.members.values()]] for chat_id, idx in self._chats.items()],
+        }
+
+    def restore(self, data: dict, age: float) -> int:
+        """Reload a snapshot; chats and usernames seen since start-up keep their fresher entries."""
+        restored = 0
+        now = time.monotonic()
+        for user_id, username, first_name, *unseen in data.get("usernames", ()):
+            seen = now - age - (unseen[0] if unseen else 0)
+            if (username and username.lower() not in self._usernames and user_id not in self._username_of
+                    and now - seen <= self.username_ttl):
+                self._index_username(MemberRef(user_id, username, first_name), seen)
+                restored += 1
+        for chat_id, members in data.get("chats", ()):
+            if chat_id in self._chats:
+                continue
+            for user_id, username, first_name in members:
+                # Per chat only: the global username index trusts its own rows and their ages
+                self._add_member(chat_id, MemberRef(user_id, username, first_name))
+                restored += 1
+        return restored
+
+    def chat_ids(self) -> List[int]:
+        return list(self._chats)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "chats": len(self._chats),
+            "members": sum(len(i.members) for i in self._chats.values()),
+            "usernames": len(self._usernames),
+            "usernames_renamed": self.renamed,
+            "usernames_expired": self.expired,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,173 @@
+# bot/plugins.py - manifest-driven lazy plugin loader
+# Each package listed in PACKAGES may ship a small `manifest.py` that names its
+# handlers ("package.module:function") with their filters and handler group.
+# Registering a handler imports nothing but the manifest; the module behind it
+# is imported the first time one of its handlers matches an update. Manifests
+# can also list heavy modules (WARM) to import in a background thread once the
+# bot is up, so the first request that needs them does not stall the loop.
+#
+#   python -m bot.plugins    # cold-start import timing report
+
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.lazy import import_timings, timed_import, warm
+
+log = logging.getLogger("masterbot.plugins")
+
+PACKAGES = ("modules", "ai", "filters", "voice", "classifier")
+
+
+class Plugin:
+    __slots__ = ("target", "filters", "group", "kind", "lane")
+
+    def __init__(self, target: str, filters=None, group: int = 0, kind: str = "message", lane: Optional[str] = None):
+        self.target = target  # "package.module:function"
+        self.filters = filters
+        self.group = group
+        self.kind = kind
+        self.lane = lane  # bot/scheduler.py lane the handler runs on; None runs it in the dispatcher
+
+    def __repr__(self):
+        return f"Plugin({self.target!r}, group={self.group}, kind={self.kind!r})"
+
+
+def on_message(target: str, filters=None, group: int = 0, lane: Optional[str] = None) -> Plugin:
+    return Plugin(target, filters, group, "message", lane)
+
+
+def on_chat_member_updated(target: str, filters=None, group: int = 0) -> Plugin:
+    return Plugin(target, filters, group, "chat_member_updated")
+
+
+def _handler_class(kind: str):
+    from pyrogram import handlers
+    return {
+        "message": handlers.MessageHandler,
+        "edited_message": handlers.EditedMessageHandler,
+        "chat_member_updated": handlers.ChatMemberUpdatedHandler,
+        "callback_query": handlers.CallbackQueryHandler,
+    }[kind]
+
+
+class PluginLoader:
+    """
+    - packages: packages whose manifest.py is read (missing manifests are skipped)
+    """
+
+    def __init__(self, packages: Tuple[str, ...] = PACKAGES):
+        self.packages = packages
+        self.plugins: List[Plugin] = []
+        self.warm_modules: List[str] = []
+        self.manifest_ms: Dict[str, float] = {}
+        self._resolved: Dict[str, object] = {}
+
+    def load(self, app) -> int:
+        """Register every manifest's handlers on app; returns the number registered."""
+        for package in self.packages:
+            manifest = self._manifest(package)
+            if manifest is None:
+                continue
+            for plugin in getattr(manifest, "HANDLERS", ()):
+                app.add_handler(_handler_class(plugin.kind)(self._lazy(plugin), plugin.filters), plugin.group)
+                self.plugins.append(plugin)
+            for name in getattr(manifest, "WARM", ()):
+                if name not in self.warm_modules:
+                    self.warm_modules.append(name)
+        log.info("Registered %d plugin handler(s) from %s (%.1f ms).", len(self.plugins),
+                 ", ".join(self.manifest_ms) or "no manifests", sum(self.manifest_ms.values()))
+        return len(self.plugins)
+
+    def _manifest(self, package: str):
+        name = f"{package}.manifest"
+        start = time.perf_counter()
+        try:
+            manifest = timed_import(name)
+        except ModuleNotFoundError as e:
+            if e.name in (package, name):
+                return None
+            raise
+        self.manifest_ms[package] = (time.perf_counter() - start) * 1000
+        return manifest
+
+    def _lazy(self, plugin: Plugin):
+        module_name, _, attr = plugin.target.partition(":")
+        resolved = self._resolved
+
+        async def callback(client, *args):
+            fn = resolved.get(plugin.target)
+            if fn is None:
+                fn = getattr(timed_import(module_name), attr)
+                resolved[plugin.target] = fn
+            if plugin.lane is not None:
+                from bot.scheduler import get_scheduler
+                return await get_scheduler().dispatch(plugin.lane, lambda: fn(client, *args))
+            return await fn(client, *args)
+
+        # Pyrogram awaits coroutine functions directly; the name shows up in logs and benchmarks
+        callback.__name__ = callback.__qualname__ = attr
+        return callback
+
+    async def warm_up(self):
+        """Import the manifests' WARM modules off the event loop."""
+        await warm(self.warm_modules)
+
+    def stats(self) -> dict:
+        return {
+            "manifests": len(self.manifest_ms),
+            "handlers": len(self.plugins),
+            "loaded": len(self._resolved),
+        }
+
+    def report(self) -> str:
+        lines = [f"{len(self.plugins)} plugin handler(s), {len(self._resolved)} loaded"]
+        for package, ms in self.manifest_ms.items():
+            lines.append(f"  manifest {package}: {ms:.1f} ms")
+        for name, seconds in sorted(import_timings.items(), key=lambda kv: -kv[1]):
+            if not name.endswith(".manifest"):
+                lines.append(f"  import {name}: {seconds * 1000:.1f} ms")
+        return "\n".join(lines)
+
+
+# Objects the composition root (main.py) hands to plugins, e.g. ai_generate_reply
+_services: Dict[str, object] = {}
+
+
+def provide(name: str, obj):
+    _services[name] = obj
+
+
+def service(name: str):
+    try:
+        return _services[name]
+    except KeyError:
+        raise LookupError(f"No service {name!r} provided (is main.py running?)") from None
+
+
+_loader: Optional[PluginLoader] = None
+
+
+def get_plugin_loader() -> PluginLoader:
+    global _loader
+    if _loader is None:
+        _loader = PluginLoader()
+    return _loader
+
+
+def _main():
+    # Cold-start report: how long `import main` takes and what it pulled in
+    import sys
+
+    start = time.perf_counter()
+    timed_import("main")
+    total = time.perf_counter() - start
+    heavy = ("openai", "pymongo", "transformers", "torch", "librosa")
+    print(f"import main: {total * 1000:.0f} ms")
+    # The loader main.py used (this file runs as __main__, a separate module object)
+    print(timed_import("bot.plugins").get_plugin_loader().report())
+    print("heavy modules loaded at import: " + (", ".join(m for m in heavy if m in sys.modules) or "none"))
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,210 @@
+# bot/scheduler.py - priority dispatch between moderation and AI work
+# Handlers do their cheap checks inline, then hand the expensive part (API
+# calls, LLM completions) to a lane here and return, so Pyrogram's dispatcher
+# workers never sit in an LLM call while a raid piles up behind them.
+# - lanes are served in priority order: moderation > owner commands > group AI > DM AI
+# - every lane has a bounded queue; `reserved` worker slots are kept for the
+#   lanes that may not shed, so moderation starts at once even when AI is saturated
+# - a sheddable lane that is full, or whose job waited longer than max_age, sheds
+#   the job: its on_shed callback runs instead (a local persona reply) or it is dropped
+# - a full lane that may not shed runs the job in the caller (back-pressure)
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Sequence
+
+from utils.metrics import metrics
+
+log = logging.getLogger("masterbot.scheduler")
+
+
+class Lane:
+    """
+    - name: "moderation", "owner", "group_ai", "dm_ai"
+    - max_queue: jobs waiting before new ones are shed (or run by the caller)
+    - sheddable: whether jobs may be shed; only others may use the reserved slots
+    - max_age: seconds a sheddable job may wait before it is shed instead of run
+    """
+
+    __slots__ = ("name", "max_queue", "sheddable", "max_age", "queue", "running", "done", "shed", "inline", "peak")
+
+    def __init__(self, name: str, max_queue: int, sheddable: bool = False, max_age: Optional[float] = None):
+        self.name = name
+        self.max_queue = max_queue
+        self.sheddable = sheddable
+        self.max_age = max_age
+        self.queue: deque = deque()
+        self.running = 0
+        self.done = 0
+        self.shed = 0
+        self.inline = 0
+        self.peak = 0
+
+
+class _Job:
+    __slots__ = ("factory", "on_shed", "queued")
+
+    def __init__(self, factory, on_shed, queued):
+        self.factory = factory
+        self.on_shed = on_shed
+        self.queued = queued
+
+
+class Scheduler:
+    """
+    - lanes: in priority order (first is served first)
+    - workers: jobs running at once across all lanes
+    - reserved: of those, slots that sheddable lanes may not take
+    """
+
+    def __init__(self, lanes: Sequence[Lane], workers: int = 16, reserved: int = 4):
+        self.lanes: Dict[str, Lane] = {lane.name: lane for lane in lanes}
+        self.workers = workers
+        self.reserved = min(reserved, workers - 1)
+        self._running = 0
+        self._running_sheddable = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+
+    # ---- public API ----
+    async def dispatch(self, lane: str, factory: Callable[[], Awaitable], on_shed: Optional[Callable[[], None]] = None):
+        """
+        Queue factory() (a coroutine factory) on a lane and return at once.
+        on_shed: called instead of factory if the job is shed (None: dropped).
+        """
+        target = self.lanes[lane]
+        if len(target.queue) >= target.max_queue:
+            if target.sheddable:
+                self._shed(target, on_shed)
+                return
+            # Never drop moderation: the caller (a dispatcher worker) runs it and slows the intake
+            target.inline += 1
+            await self._run_job(target, _Job(factory, on_shed, time.monotonic()), counted=False)
+            return
+        self._ensure_running()
+        target.queue.append(_Job(factory, on_shed, time.monotonic()))
+        target.peak = max(target.peak, len(target.queue))
+        self._wakeup.set()
+
+    def depth(self, lane: Optional[str] = None) -> int:
+        if lane is not None:
+            return len(self.lanes[lane].queue)
+        return sum(len(l.queue) for l in self.lanes.values())
+
+    async def drain(self, poll: float = 0.01):
+        """Wait until every lane is empty and nothing runs."""
+        while self.depth() or self._running:
+            await asyncio.sleep(poll)
+
+    def stats(self) -> dict:
+        out = {"running": self._running}
+        for lane in self.lanes.values():
+            out[f"{lane.name}_queued"] = len(lane.queue)
+            out[f"{lane.name}_peak"] = lane.peak
+            out[f"{lane.name}_running"] = lane.running
+            out[f"{lane.name}_done"] = lane.done
+            if lane.sheddable:
+                out[f"{lane.name}_shed"] = lane.shed
+            else:
+                out[f"{lane.name}_inline"] = lane.inline
+        return out
+
+    async def close(self, timeout: float = 10.0):
+        """Give queued and running jobs `timeout` seconds, then cancel what is left."""
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            log.warning("Scheduler closing with %d queued and %d running job(s).", self.depth(), self._running)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    # ---- scheduling ----
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _pick(self) -> Optional[Lane]:
+        if self._running >= self.workers:
+            return None
+        now = time.monotonic()
+        for lane in self.lanes.values():
+            if lane.sheddable:
+                if self._running_sheddable >= self.workers - self.reserved:
+                    continue
+                # Expired jobs are shed here, so a backlog never answers questions a minute late
+                while lane.queue and lane.max_age is not None and now - lane.queue[0].queued > lane.max_age:
+                    self._shed(lane, lane.queue.popleft().on_shed)
+            if lane.queue:
+                return lane
+        return None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lane = self._pick()
+            if lane is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            job = lane.queue.popleft()
+            metrics.observe(f"queue_wait_{lane.name}", time.monotonic() - job.queued)
+            task = loop.create_task(self._run_job(lane, job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            # Count it now so the next pick sees the slot as taken
+            self._running += 1
+            lane.running += 1
+            if lane.sheddable:
+                self._running_sheddable += 1
+
+    async def _run_job(self, lane: Lane, job: _Job, counted: bool = True):
+        try:
+            await job.factory()
+        except Exception as e:
+            log.exception("%s job failed: %s", lane.name, e)
+        finally:
+            lane.done += 1
+            if counted:
+                self._running -= 1
+                lane.running -= 1
+                if lane.sheddable:
+                    self._running_sheddable -= 1
+                self._wakeup.set()
+
+    def _shed(self, lane: Lane, on_shed: Optional[Callable[[], None]]):
+        lane.shed += 1
+        metrics.inc("jobs_shed_total", lane.name, label_name="lane")
+        if on_shed is not None:
+            try:
+                on_shed()
+            except Exception as e:
+                log.warning("Shedding a %s job failed: %s", lane.name, e)
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def get_scheduler() -> Scheduler:
+    """Process-wide scheduler configured from SCHED_* variables."""
+    global _scheduler
+    if _scheduler is None:
+        max_age = float(os.getenv("SCHED_AI_MAX_AGE", "15"))
+        _scheduler = Scheduler(
+            lanes=(
+                Lane("moderation", int(os.getenv("SCHED_MOD_QUEUE", "1000"))),
+                Lane("owner", int(os.getenv("SCHED_OWNER_QUEUE", "100"))),
+                Lane("group_ai", int(os.getenv("SCHED_GROUP_AI_QUEUE", "200")), sheddable=True, max_age=max_age),
+                Lane("dm_ai", int(os.getenv("SCHED_DM_AI_QUEUE", "200")), sheddable=True, max_age=max_age),
+            ),
+            workers=int(os.getenv("SCHED_WORKERS", "16")),
+            reserved=int(os.getenv("SCHED_RESERVED", "4")),
+        )
+    return _scheduler
@@ -0,0 +1,382 @@
+# bot/sender.py - outbound scheduler for replies and moderation API calls
+# Every outgoing call goes through one Outbox:
+# - token buckets per chat (messages) and globally (all calls)
+# - FloodWait reschedules the call instead of dropping it
+# - identical notices in the same chat within a short window are sent once
+# - moderation actions jump ahead of chit-chat
+# Each chat's jobs form a heap; chats whose best job may run now sit in a
+# "ready" heap ordered by that job, the others in a "delayed" heap ordered by
+# when their bucket allows it, so picking the next call is O(log n) however
+# large the backlog. Idle chats' buckets are dropped by a periodic sweep.
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger("masterbot.sender")
+
+# Priorities (lower is sooner)
+MODERATION = 0
+NOTICE = 1   # command replies, moderation results, permission notices
+CHAT = 2     # AI chit-chat
+BULK = 3     # background fan-out (gban)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp", "blocked_until", "last_used")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+        self.last_used = self.stamp
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available (0 = now)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+        self.last_used = now
+
+    def idle(self, now: float, after: float) -> bool:
+        """Unused for `after` seconds, refilled and not blocked: as good as a new bucket."""
+        if now - self.last_used < after or now < self.blocked_until:
+            return False
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "chat_id", "factory", "future", "counts", "key", "attempts")
+
+    def __init__(self, priority, seq, chat_id, factory, future, counts, key):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.factory = factory
+        self.future = future
+        self.counts = counts  # counts against the per-chat message bucket
+        self.key = key
+        self.attempts = 0
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Outbox:
+    """
+    - global_rate: calls per second across all chats (Telegram: ~30 msg/s per bot)
+    - chat_rate / chat_burst: messages per second per group and burst size
+      (Telegram allows ~20 msg/min in a group)
+    - dm_rate / dm_burst: the same for private chats (about one message a second)
+    - coalesce_window: seconds during which an identical keyed notice is not resent
+    - max_attempts: FloodWait retries before a call fails
+    - concurrency: calls in flight at once
+    - idle_after: seconds a chat's bucket is kept after its last message
+    """
+
+    def __init__(self, global_rate: float = 25.0, chat_rate: float = 20 / 60, chat_burst: float = 5,
+                 dm_rate: float = 1.0, dm_burst: float = 3, coalesce_window: float = 10.0,
+                 max_attempts: int = 3, concurrency: int = 8, idle_after: float = 300.0):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.dm_rate = dm_rate
+        self.dm_burst = dm_burst
+        self.coalesce_window = coalesce_window
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+        self.idle_after = idle_after
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._pending: Dict[int, List[_Job]] = {}  # chat_id -> heap of its jobs
+        self._ready: List[tuple] = []  # (priority, seq, token, chat_id) of chats whose best job may run now
+        self._delayed: List[tuple] = []  # (ready_at, token, chat_id) of chats waiting for their bucket
+        self._tokens: Dict[int, int] = {}  # chat_id -> token of its live heap entry; others are stale
+        self._next_token = itertools.count()
+        self._next_sweep = 0.0
+        self._by_key: Dict[Tuple[int, str], _Job] = {}
+        self._recent: Dict[Tuple[int, str], Tuple[float, asyncio.Future]] = {}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight = 0
+
+        self.sent = 0
+        self.coalesced = 0
+        self.flood_waits = 0
+        self.failed = 0
+
+    # ---- public API ----
+    def submit(self, chat_id: int, factory: Callable[[], Awaitable], priority: int = CHAT,
+               counts: bool = True, key: Optional[str] = None) -> asyncio.Future:
+        """
+        Queue factory() (a coroutine factory) for chat_id; returns a future with its result.
+        counts: whether it is a message (per-chat bucket) or a plain API call (global only).
+        key: coalescing key; a queued or recently sent job with the same key is reused.
+        """
+        self._ensure_running()
+        loop = asyncio.get_running_loop()
+        if key is not None:
+            ck = (chat_id, key)
+            queued = self._by_key.get(ck)
+            if queued is not None:
+                self.coalesced += 1
+                return queued.future
+            recent = self._recent.get(ck)
+            if recent is not None and recent[0] > time.monotonic():
+                self.coalesced += 1
+                return recent[1]
+        job = _Job(priority, next(self._seq), chat_id, factory, loop.create_future(), counts, key)
+        self._enqueue(job)
+        if key is not None:
+            self._by_key[(chat_id, key)] = job
+        return job.future
+
+    async def call(self, chat_id: int, fn: Callable[..., Awaitable], *args, priority: int = MODERATION,
+                   counts: bool = False, **kwargs):
+        """Run an API call (ban, restrict, ...) through the scheduler and return its result."""
+        return await self.submit(chat_id, lambda: fn(*args, **kwargs), priority=priority, counts=counts)
+
+    async def reply(self, message, text: str, priority: int = NOTICE, key: Optional[str] = None,
+                    wait: bool = True, **kwargs):
+        """
+        message.reply_text through the scheduler.
+        key: coalesce identical notices (e.g. key="not_allowed").
+        wait=False returns immediately; failures are logged instead of raised.
+        """
+        fut = self.submit(message.chat.id, lambda: message.reply_text(text, **kwargs), priority=priority, key=key)
+        if wait:
+            return await asyncio.shield(fut)
+        fut.add_done_callback(_log_failure)
+        return None
+
+    def set_global_rate(self, rate: float):
+        """Change the cross-chat rate (a sharded worker gets its share of the bot's limit)."""
+        self.global_rate = rate
+        self._global = TokenBucket(rate, rate)
+
+    def available(self, chat_id: int) -> float:
+        """Messages chat_id could send right now without waiting for its bucket."""
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            return self._limits(chat_id)[1]
+        if bucket.wait_time(time.monotonic()) > 0:
+            return 0.0
+        return bucket.tokens
+
+    def pending(self) -> int:
+        return sum(len(q) for q in self._pending.values())
+
+    async def drain(self, poll: float = 0.01):
+        """Wait until nothing is queued or in flight."""
+        while self._pending or self._in_flight:
+            await asyncio.sleep(poll)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "in_flight": self._in_flight,
+            "chats_waiting": len(self._pending),
+            "chat_buckets": len(self._chats),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "flood_waits": self.flood_waits,
+            "failed": self.failed,
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ---- scheduler ----
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _limits(self, chat_id: int) -> Tuple[float, float]:
+        # Private chats have positive ids; groups and channels negative ones
+        return (self.dm_rate, self.dm_burst) if chat_id > 0 else (self.chat_rate, self.chat_burst)
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        b = self._chats.get(chat_id)
+        if b is None:
+            b = TokenBucket(*self._limits(chat_id))
+            self._chats[chat_id] = b
+        return b
+
+    def _wait(self, job: _Job, now: float) -> float:
+        if job.counts:
+            return self._bucket(job.chat_id).wait_time(now)
+        # API calls skip the message bucket but still respect a FloodWait block
+        bucket = self._chats.get(job.chat_id)
+        return bucket.blocked_until - now if bucket is not None and bucket.blocked_until > now else 0.0
+
+    def _enqueue(self, job: _Job):
+        queue = self._pending.setdefault(job.chat_id, [])
+        heapq.heappush(queue, job)
+        if queue[0] is job:  # a new best job for the chat: place the chat again
+            self._schedule(job.chat_id, time.monotonic())
+            self._wakeup.set()
+
+    def _schedule(self, chat_id: int, now: float):
+        """(Re)place a chat in the ready or delayed heap by its best job; older entries go stale."""
+        head = self._pending[chat_id][0]
+        token = self._tokens[chat_id] = next(self._next_token)
+        wait = self._wait(head, now)
+        if wait > 0:
+            heapq.heappush(self._delayed, (now + wait, token, chat_id))
+        else:
+            heapq.heappush(self._ready, (head.priority, head.seq, token, chat_id))
+
+    def _pick(self, now: float) -> Tuple[Optional[_Job], float]:
+        """Best job that may run now, else how long until one may."""
+        delayed, ready = self._delayed, self._ready
+        while delayed and delayed[0][0] <= now:
+            _, token, chat_id = heapq.heappop(delayed)
+            if self._tokens.get(chat_id) == token:
+                self._schedule(chat_id, now)
+        while ready:
+            _, _, token, chat_id = ready[0]
+            if self._tokens.get(chat_id) != token:
+                heapq.heappop(ready)
+                continue
+            job = self._pending[chat_id][0]
+            if self._wait(job, now) > 0:  # blocked by a FloodWait since it was placed
+                heapq.heappop(ready)
+                self._schedule(chat_id, now)
+                continue
+            return job, 0.0
+        while delayed and self._tokens.get(delayed[0][2]) != delayed[0][1]:
+            heapq.heappop(delayed)
+        return None, (delayed[0][0] - now if delayed else float("inf"))
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            if now >= self._next_sweep:
+                self._sweep(now)
+            job, wait = self._pick(now) if self._pending else (None, float("inf"))
+            if job is not None:
+                gw = self._global.wait_time(now)
+                if gw > 0:
+                    await asyncio.sleep(gw)
+                    continue
+                await self._slots.acquire()
+                if not self._pending.get(job.chat_id) or self._pending[job.chat_id][0] is not job:
+                    self._slots.release()  # a better job arrived for that chat meanwhile: pick again
+                    continue
+                self._dequeue(job)
+                now = time.monotonic()
+                self._global.take(now)
+                if job.counts:
+                    self._bucket(job.chat_id).take(now)
+                self._in_flight += 1
+                asyncio.get_running_loop().create_task(self._execute(job))
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), None if wait == float("inf") else wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dequeue(self, job: _Job):
+        queue = self._pending[job.chat_id]
+        heapq.heappop(queue)  # job is the head: _run checked
+        if queue:
+            self._schedule(job.chat_id, time.monotonic())
+        else:
+            del self._pending[job.chat_id]
+            del self._tokens[job.chat_id]
+
+    def _sweep(self, now: float):
+        """Drop idle chats' buckets and expired coalescing entries (every coalesce_window seconds)."""
+        self._next_sweep = now + self.coalesce_window
+        for chat_id in [c for c, b in self._chats.items() if c not in self._pending and b.idle(now, self.idle_after)]:
+            del self._chats[chat_id]
+        for ck in [k for k, (until, _) in self._recent.items() if until <= now]:
+            del self._recent[ck]
+
+    async def _execute(self, job: _Job):
+        from pyrogram.errors import FloodWait
+
+        try:
+            job.attempts += 1
+            result = await job.factory()
+        except FloodWait as e:
+            self.flood_waits += 1
+            delay = float(getattr(e, "value", 1) or 1)
+            log.warning("FloodWait %.0fs in chat %s; rescheduling.", delay, job.chat_id)
+            self._bucket(job.chat_id).block(delay)
+            if job.attempts < self.max_attempts:
+                self._enqueue(job)
+            else:
+                self._finish(job, exc=e)
+        except Exception as e:
+            self._finish(job, exc=e)
+        else:
+            self._finish(job, result=result)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+            self._wakeup.set()
+
+    def _finish(self, job: _Job, result=None, exc: Optional[BaseException] = None):
+        if exc is None:
+            self.sent += 1
+        else:
+            self.failed += 1
+        if job.key is not None:
+            ck = (job.chat_id, job.key)
+            if self._by_key.get(ck) is job:
+                del self._by_key[ck]
+            if exc is None:
+                self._recent[ck] = (time.monotonic() + self.coalesce_window, job.future)
+        if not job.future.done():
+            if exc is None:
+                job.future.set_result(result)
+            else:
+                job.future.set_exception(exc)
+
+
+def _log_failure(fut: asyncio.Future):
+    if not fut.cancelled() and fut.exception() is not None:
+        log.warning("Outbound reply failed: %s", fut.exception())
+
+
+_outbox: Optional[Outbox] = None
+
+
+def get_outbox() -> Outbox:
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox()
+    return _outbox
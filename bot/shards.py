@@ -0,0 +1,449 @@
+# bot/shards.py - multi-process sharded runner
+# One supervisor process owns the bot's Telegram session and receives every
+# update; it routes each update, by a hash of its chat id, to one of N worker
+# processes. A chat always lands on the same worker, so its updates arrive in
+# order and its caches (admins, members, flood counters, conversation memory)
+# live in one place. Each worker is a full copy of main.py - handlers, outbox,
+# AI engine - with its own session file (MasterBot-shard<i>) for API calls; it
+# never subscribes to updates itself.
+#
+# The supervisor also relays the global state every worker needs: the
+# global-ban set and the chats the bot is in / administers (the DataStore change
+# feed). Bot-level admins (BOT_ADMINS, OWNER_ID) are configuration and identical
+# in every worker. Workers send a heartbeat every few seconds; a worker that
+# exits or goes quiet is restarted, and its updates are buffered meanwhile.
+#
+#   python -m bot.shards [workers]      # default: SHARDS, else the number of CPUs
+
+import asyncio
+import logging
+import os
+import pickle
+import signal
+import socket
+import struct
+import time
+from collections import deque
+from datetime import datetime
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+from pyrogram import Client, idle, raw, utils
+from pyrogram.raw.core import TLObject
+
+log = logging.getLogger("masterbot.shards")
+
+_HEADER = struct.Struct("!I")
+_socket: Optional[socket.socket] = None  # a worker's end of its supervisor channel
+
+
+# ----------------------------
+# Routing
+# ----------------------------
+def shard_of(chat_id: int, shards: int) -> int:
+    """Stable shard for a chat (Fibonacci hashing spreads sequential ids evenly)."""
+    return (((chat_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) * shards) >> 64
+
+
+def update_chat_id(update) -> Optional[int]:
+    """Pyrogram-style chat id a raw update belongs to (private chats: the user's id)."""
+    peer = getattr(getattr(update, "message", None), "peer_id", None) or getattr(update, "peer", None)
+    if peer is not None:
+        try:
+            return utils.get_peer_id(peer)
+        except ValueError:
+            pass
+    channel_id = getattr(update, "channel_id", None)
+    if channel_id:
+        return utils.get_channel_id(channel_id)
+    chat_id = getattr(update, "chat_id", None)
+    if chat_id:
+        return -chat_id  # basic group
+    return getattr(update, "user_id", None)
+
+
+def split_updates(updates, shards: int) -> Dict[int, TLObject]:
+    """Raw updates container -> {shard: container holding that shard's updates}."""
+    if isinstance(updates, (raw.types.Updates, raw.types.UpdatesCombined)):
+        parts: Dict[int, list] = {}
+        for update in updates.updates:
+            chat_id = update_chat_id(update)
+            parts.setdefault(shard_of(chat_id, shards) if chat_id is not None else 0, []).append(update)
+        if len(parts) == 1:
+            return {next(iter(parts)): updates}
+        # users/chats are kept whole: the worker's handle_updates picks what it needs
+        return {shard: raw.types.Updates(updates=part, users=updates.users, chats=updates.chats,
+                                         date=updates.date, seq=0)
+                for shard, part in parts.items()}
+    if isinstance(updates, raw.types.UpdateShortMessage):
+        chat_id = updates.user_id
+    elif isinstance(updates, raw.types.UpdateShortChatMessage):
+        chat_id = -updates.chat_id
+    elif isinstance(updates, raw.types.UpdateShort):
+        chat_id = update_chat_id(updates.update)
+    else:
+        chat_id = None
+    return {shard_of(chat_id, shards) if chat_id is not None else 0: updates}
+
+
+# ----------------------------
+# Supervisor <-> worker channel: length-prefixed pickles over a socketpair
+# ----------------------------
+class Channel:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, sock: socket.socket) -> "Channel":
+        reader, writer = await asyncio.open_unix_connection(sock=sock)
+        return cls(reader, writer)
+
+    def send(self, message: tuple):
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        self.writer.write(_HEADER.pack(len(data)) + data)
+
+    async def recv(self) -> tuple:
+        """Next message; raises asyncio.IncompleteReadError once the other side is gone."""
+        (size,) = _HEADER.unpack(await self.reader.readexactly(_HEADER.size))
+        return pickle.loads(await self.reader.readexactly(size))
+
+    def buffered(self) -> int:
+        return self.writer.transport.get_write_buffer_size()
+
+    def close(self):
+        self.writer.close()
+
+
+# ----------------------------
+# Worker side
+# ----------------------------
+class ShardClient(Client):
+    """
+    Client of one worker: API calls go out on its own session without
+    subscribing it to updates; the updates it handles come from the supervisor.
+    """
+
+    def __init__(self, *args, shard: int = 0, shards: int = 1, beat_interval: float = 2.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shard = shard
+        self.shards = shards
+        self.beat_interval = beat_interval
+        self.received = 0
+        self._channel: Optional[Channel] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def invoke(self, query, *args, **kwargs):
+        if not isinstance(query, raw.functions.InvokeWithoutUpdates):
+            query = raw.functions.InvokeWithoutUpdates(query=query)
+        return await super().invoke(query, *args, **kwargs)
+
+    async def handle_updates(self, updates):
+        # Pushed on this worker's own session (there should be none): the
+        # supervisor forwards its copy to whichever worker owns the chat
+        self.last_update_time = datetime.now()
+
+    async def attach(self):
+        """Connect to the supervisor: routed updates and state changes in; heartbeats and local changes out."""
+        from bot.sender import get_outbox
+        from db import get_store
+
+        self._channel = await Channel.open(_socket)
+        # Telegram's per-bot limit is shared by every worker
+        outbox = get_outbox()
+        outbox.set_global_rate(outbox.global_rate / self.shards)
+        get_store().subscribe(self._publish)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._read()), loop.create_task(self._beat())]
+        log.info("Shard %d/%d attached.", self.shard, self.shards)
+
+    async def detach(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._channel is not None:
+            self._channel.close()
+            self._channel = None
+
+    def _publish(self, kind: str, key: int, value):
+        if self._channel is not None:
+            self._channel.send(("state", kind, key, value))
+
+    async def _read(self):
+        from db import get_store
+
+        while True:
+            try:
+                message = await self._channel.recv()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                # Supervisor gone: shut down the way a Ctrl+C would
+                log.warning("Supervisor channel closed; stopping shard %d.", self.shard)
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+            kind = message[0]
+            if kind == "update":
+                self.received += 1
+                try:
+                    await Client.handle_updates(self, TLObject.read(BytesIO(message[1])))
+                except Exception as e:
+                    log.exception("Routed update failed: %s", e)
+            elif kind == "state":
+                get_store().apply_remote(*message[1:])
+
+    async def _beat(self):
+        from bot.sender import get_outbox
+        from utils.metrics import metrics
+
+        while True:
+            self._channel.send(("beat", {
+                "received": self.received,
+                "queued": self.dispatcher.updates_queue.qsize(),
+                "outbox": get_outbox().pending(),
+                "loop_lag_ms": round(metrics.loop_lag * 1000, 1),
+            }))
+            await asyncio.sleep(self.beat_interval)
+
+
+def _worker_main(index: int, shards: int, sock: socket.socket):
+    """Worker process entry: run main.py as shard `index`, fed through sock."""
+    global _socket
+    _socket = sock
+    os.environ["MASTERBOT_SHARD"] = f"{index}/{shards}"
+    # One metrics endpoint per worker, above the supervisor's base port
+    base = int(os.getenv("METRICS_PORT", "9464"))
+    os.environ["METRICS_PORT"] = str(base + 1 + index) if base else "0"
+    import main as bot
+
+    bot.app.run(bot.main())
+
+
+# ----------------------------
+# Supervisor side
+# ----------------------------
+class RouterClient(Client):
+    """The supervisor's client: every update Telegram pushes is handed to route(), none is handled here."""
+
+    def __init__(self, *args, route: Callable[[object], None], **kwargs):
+        super().__init__(*args, **kwargs)
+        self._route = route
+
+    async def handle_updates(self, updates):
+        self.last_update_time = datetime.now()
+        self._route(updates)
+
+
+class _Worker:
+    __slots__ = ("index", "process", "channel", "task", "started", "last_beat", "beat", "routed", "dropped",
+                 "restarts", "restarting", "buffer")
+
+    def __init__(self, index: int, max_buffer: int):
+        self.index = index
+        self.process = None
+        self.channel: Optional[Channel] = None
+        self.task: Optional[asyncio.Task] = None
+        self.started = 0.0
+        self.last_beat = 0.0
+        self.beat: dict = {}
+        self.routed = 0
+        self.dropped = 0
+        self.restarts = 0
+        self.restarting = False
+        self.buffer: deque = deque(maxlen=max_buffer)
+
+
+class Supervisor:
+    """
+    - shards: worker processes
+    - beat_timeout: seconds without a heartbeat after which a worker is restarted
+    - start_timeout: seconds a (re)started worker gets to log in and attach
+    - max_buffer: updates kept for a worker that is down; the oldest go first
+    - max_backlog: bytes queued on a worker's channel before it counts as stalled
+    - restart_delay: back-off before restarting a worker that crashed soon after
+      starting (doubles each time, up to a minute)
+    - target: worker process entry (tests swap it for a dummy)
+    """
+
+    def __init__(self, shards: int, api_id: int, api_hash: str, bot_token: str, beat_timeout: float = 30.0,
+                 start_timeout: float = 120.0, max_buffer: int = 10000, max_backlog: int = 16 << 20,
+                 restart_delay: float = 1.0, target: Callable = _worker_main):
+        self.shards = shards
+        self.beat_timeout = beat_timeout
+        self.start_timeout = start_timeout
+        self.max_backlog = max_backlog
+        self.restart_delay = restart_delay
+        self.target = target
+        self.workers = [_Worker(i, max_buffer) for i in range(shards)]
+        self.client = RouterClient("MasterBot", api_id=api_id, api_hash=api_hash, bot_token=bot_token,
+                                   workers=1, route=self.route)
+        self._stopping = False
+        self._delays: Dict[int, float] = {}
+
+    # ---- routing ----
+    def route(self, updates):
+        for shard, part in split_updates(updates, self.shards).items():
+            self._send(self.workers[shard], ("update", part.write()))
+
+    def _send(self, worker: _Worker, message: tuple):
+        worker.routed += message[0] == "update"
+        if worker.channel is not None and worker.channel.buffered() < self.max_backlog:
+            worker.channel.send(message)
+            return
+        if len(worker.buffer) == worker.buffer.maxlen:
+            worker.dropped += 1
+        worker.buffer.append(message)
+
+    # ---- worker lifecycle ----
+    def _spawn(self, worker: _Worker):
+        import multiprocessing
+
+        parent, child = socket.socketpair()
+        # spawn: a fresh interpreter per worker (fork would copy the supervisor's loop and session)
+        worker.process = multiprocessing.get_context("spawn").Process(
+            target=self.target, args=(worker.index, self.shards, child), name=f"masterbot-shard{worker.index}")
+        worker.process.start()
+        child.close()
+        worker.started = worker.last_beat = time.monotonic()
+        worker.beat = {}
+        worker.task = asyncio.get_running_loop().create_task(self._serve(worker, parent))
+        log.info("Shard %d started (pid %d).", worker.index, worker.process.pid)
+
+    async def _serve(self, worker: _Worker, sock: socket.socket):
+        channel = await Channel.open(sock)
+        try:
+            while True:
+                message = await channel.recv()
+                kind = message[0]
+                if kind == "beat":
+                    if worker.channel is None:
+                        # First heartbeat: the worker is up; hand over what piled up meanwhile
+                        worker.channel = channel
+                        while worker.buffer:
+                            channel.send(worker.buffer.popleft())
+                    worker.last_beat = time.monotonic()
+                    worker.beat = message[1]
+                elif kind == "state":
+                    for other in self.workers:
+                        if other is not worker:
+                            self._send(other, message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            worker.channel = None
+            channel.close()
+
+    async def _stop(self, worker: _Worker, timeout: float = 10.0):
+        if worker.task is not None:
+            worker.task.cancel()
+            worker.task = None
+        worker.channel = None
+        process = worker.process
+        if process is None:
+            return
+        if process.is_alive():
+            process.terminate()  # SIGTERM: the worker's idle() returns and it shuts down cleanly
+            await asyncio.get_running_loop().run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                process.kill()
+                await asyncio.get_running_loop().run_in_executor(None, process.join, timeout)
+        worker.process = None
+
+    async def _restart(self, worker: _Worker, reason: str):
+        ran = time.monotonic() - worker.started
+        # Crash loops (bad config, login errors) back off instead of spinning
+        delay = self._delays.get(worker.index, self.restart_delay) if ran < 60 else self.restart_delay
+        self._delays[worker.index] = min(delay * 2, 60.0)
+        log.warning("Shard %d %s after %.0fs; restarting in %.0fs.", worker.index, reason, ran, delay)
+        worker.restarts += 1
+        worker.restarting = True
+        try:
+            await self._stop(worker)
+            await asyncio.sleep(delay)
+            if not self._stopping:
+                self._spawn(worker)
+        finally:
+            worker.restarting = False
+
+    def _health(self, worker: _Worker, now: float) -> Optional[str]:
+        """Why the worker needs a restart, or None if it is healthy."""
+        if worker.restarting or worker.process is None:
+            return None
+        if not worker.process.is_alive():
+            return f"exited ({worker.process.exitcode})"
+        if worker.channel is None:
+            if now - worker.started > self.start_timeout:
+                return "did not attach"
+            return None
+        if now - worker.last_beat > self.beat_timeout:
+            return "stopped sending heartbeats"
+        if worker.channel.buffered() >= self.max_backlog:
+            return "stopped reading updates"
+        return None
+
+    async def _monitor(self, interval: float = 2.0, report_every: float = 60.0):
+        last_report = time.monotonic()
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for worker in self.workers:
+                reason = self._health(worker, now)
+                if reason:
+                    asyncio.get_running_loop().create_task(self._restart(worker, reason))
+            if now - last_report >= report_every:
+                last_report = now
+                for s in self.stats():
+                    log.info("Shard %(shard)d: routed %(routed)d, buffered %(buffered)d, dropped %(dropped)d, "
+                             "restarts %(restarts)d, %(beat)s", s)
+
+    def stats(self) -> List[dict]:
+        return [{
+            "shard": w.index,
+            "alive": bool(w.process and w.process.is_alive()),
+            "attached": w.channel is not None,
+            "routed": w.routed,
+            "buffered": len(w.buffer),
+            "dropped": w.dropped,
+            "restarts": w.restarts,
+            "beat": w.beat,
+        } for w in self.workers]
+
+    # ---- run ----
+    async def _main(self):
+        for worker in self.workers:
+            self._spawn(worker)
+        # Updates that arrive before a worker attaches wait in its buffer
+        await self.client.start()
+        log.info("Supervisor routing updates to %d shard(s).", self.shards)
+        monitor = asyncio.get_running_loop().create_task(self._monitor())
+        try:
+            await idle()
+        finally:
+            self._stopping = True
+            monitor.cancel()
+            await asyncio.gather(*(self._stop(w) for w in self.workers))
+            await self.client.stop()
+
+    def run(self):
+        self.client.run(self._main())
+
+
+def _main():
+    import sys
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    shards = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.getenv("SHARDS") or os.cpu_count() or 1)
+    # The importable copy of this module, so worker processes unpickle its _worker_main
+    from utils.lazy import timed_import
+    module = timed_import("bot.shards")
+    module.Supervisor(
+        shards,
+        api_id=int(os.getenv("API_ID", "0")),
+        api_hash=os.getenv("API_HASH", ""),
+        bot_token=os.getenv("BOT_TOKEN", ""),
+    ).run()
+
+
+if __name__ == "__main__":
+    _main()
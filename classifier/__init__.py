@@ -0,0 +1,2 @@
+from .models import StubModel, TextModel, TransformersModel, make_model
+from .service import Classifier, Scores, get_classifier
@@ -0,0 +1,68 @@
+# classifier/handlers.py - abusive group messages (registered by classifier/manifest.py)
+# Every group message with text is scored by the local classifier. Above the
+# abuse threshold, CLASSIFIER_ACTION decides: flag (warn, the default), delete,
+# or mute (the escalating /mute). Chat moderators are never touched.
+# The handler only submits the text and returns: the dispatcher worker is free
+# at once, and a batch can hold more texts than there are dispatcher workers.
+# The rare abusive result is acted on in a background task.
+
+import asyncio
+import logging
+import os
+
+from pyrogram.types import Message
+
+from bot.plugins import service
+from bot.sender import get_outbox
+from utils.metrics import metrics
+
+from .service import get_classifier
+
+log = logging.getLogger("masterbot.classifier")
+
+ACTIONS = ("flag", "delete", "mute")
+
+_tasks: set = set()  # background actions, referenced until they finish
+
+
+def abuse_action() -> str:
+    action = os.getenv("CLASSIFIER_ACTION", "flag").lower()
+    return action if action in ACTIONS else "flag"
+
+
+async def abuse_guard(client, message: Message):
+    classifier = get_classifier()
+    user = message.from_user
+    if not classifier.enabled or not user or user.is_bot:
+        return
+    text = message.text or message.caption
+    if not text or text.startswith("/"):
+        return
+    classifier.submit(text).add_done_callback(lambda fut: _scored(client, message, fut))
+
+
+def _scored(client, message: Message, fut: asyncio.Future):
+    if fut.cancelled() or not get_classifier().is_abusive(fut.result()):
+        return
+    task = asyncio.get_running_loop().create_task(_act(client, message))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def _act(client, message: Message):
+    user = message.from_user
+    try:
+        if await service("can_moderate")(client, message, user.id):
+            return
+        action = abuse_action()
+        metrics.inc("abusive_messages_total", action, label_name="action")
+        outbox = get_outbox()
+        if action == "mute":
+            from modules.moderation import escalate_mute
+            await escalate_mute(client, message, user, reason="for abusive messages")
+        elif action == "delete":
+            await outbox.call(message.chat.id, message.delete)
+        else:
+            await outbox.reply(message, f"{user.mention}, keep it friendly please. 🙏", key=f"abuse:{user.id}")
+    except Exception as e:
+        log.warning("Acting on an abusive message in %s failed: %s", message.chat.id, e)
@@ -0,0 +1,14 @@
+# classifier/manifest.py - abuse scoring (only when CLASSIFIER_MODEL is set)
+
+import os
+
+from pyrogram import filters
+
+from bot.plugins import on_message
+
+HANDLERS = (
+    # Last group. The handler only submits the text (classifier/handlers.py), so no dispatcher
+    # worker waits for a batch; abusive results are acted on in the background
+    on_message("classifier.handlers:abuse_guard",
+               filters.group & (filters.text | filters.caption) & ~filters.service, group=3),
+) if os.getenv("CLASSIFIER_MODEL") else ()
@@ -0,0 +1,118 @@
+# classifier/models.py - pluggable text scorers for the local classifier
+# A model is built once inside the classifier's worker process (see
+# classifier/worker.py) and called with a whole micro-batch of texts. Select
+# one with CLASSIFIER_MODEL:
+#
+#   stub[:batch_ms[:item_ms]]    keyword scorer that sleeps like a batched model
+#                                would (local runs and benchmarks)
+#   hf:<model>                   transformers text-classification pipeline for abuse, e.g.
+#                                hf:citizenlab/distilbert-base-multilingual-cased-toxicity
+#                                (runs offline once the model is in the HF cache)
+#   module.path:ClassName[:arg]  any class with the TextModel interface
+#
+# CLASSIFIER_INTENT_MODEL optionally names a second text-classification model
+# whose labels are moderation actions (mute, unmute, ban, unban, kick, none).
+
+import importlib
+import logging
+import os
+import time
+from typing import List, Optional
+
+log = logging.getLogger("masterbot.classifier")
+
+# Labels counted as abuse (lowercased); the rest (non-toxic, neutral, ...) are not
+ABUSE_LABELS = ("toxic", "toxicity", "severe_toxic", "obscene", "threat", "insult", "identity_hate",
+                "hate", "offensive", "abusive")
+
+
+class TextModel:
+    name = "base"
+
+    def load(self):
+        """Called once in the worker process before the first batch (load weights here)."""
+
+    def score(self, texts: List[str]) -> List[dict]:
+        """One {"abuse": 0..1, "intent": label or None, "intent_score": 0..1} per text."""
+        raise NotImplementedError
+
+
+class StubModel(TextModel):
+    """Keyword abuse list and the keyword intent tables, with a simulated batch cost."""
+
+    name = "stub"
+    WORDS = frozenset(("idiot", "stupid", "moron", "loser", "bewakoof", "pagal", "kamina", "gadha", "ullu"))
+
+    def __init__(self, batch_ms: float = 0.0, item_ms: float = 0.0):
+        self.batch_ms = batch_ms
+        self.item_ms = item_ms
+
+    def score(self, texts):
+        from filters.intent import classify_text
+
+        if texts and (self.batch_ms or self.item_ms):
+            time.sleep((self.batch_ms + self.item_ms * len(texts)) / 1000)
+        out = []
+        for text in texts:
+            abusive = any(w in self.WORDS for w in text.lower().split())
+            action = classify_text(text, full=True).action
+            out.append({"abuse": 1.0 if abusive else 0.0, "intent": action, "intent_score": 1.0 if action else 0.0})
+        return out
+
+
+class TransformersModel(TextModel):
+    """Hugging Face text-classification pipelines on CPU, called once per batch."""
+
+    name = "hf"
+
+    def __init__(self, model: str, intent_model: Optional[str] = None, max_length: int = 128):
+        self.model = model
+        self.intent_model = intent_model
+        self.max_length = max_length
+        labels = os.getenv("CLASSIFIER_ABUSE_LABELS")
+        self.abuse_labels = frozenset(l.strip().lower() for l in labels.split(",")) if labels else frozenset(ABUSE_LABELS)
+        self._abuse = None
+        self._intent = None
+
+    def load(self):
+        if self._abuse is None:
+            from utils.lazy import timed_import
+            transformers = timed_import("transformers")
+            self._abuse = transformers.pipeline("text-classification", model=self.model, top_k=None, device=-1)
+            if self.intent_model:
+                self._intent = transformers.pipeline("text-classification", model=self.intent_model, device=-1)
+
+    def score(self, texts):
+        if not texts:
+            return []
+        self.load()
+        kwargs = {"batch_size": len(texts), "truncation": True, "max_length": self.max_length}
+        out = []
+        for labels in self._abuse(texts, **kwargs):
+            abuse = max((l["score"] for l in labels if l["label"].lower() in self.abuse_labels), default=0.0)
+            out.append({"abuse": float(abuse), "intent": None, "intent_score": 0.0})
+        if self._intent is not None:
+            for row, top in zip(out, self._intent(texts, **kwargs)):
+                top = top[0] if isinstance(top, list) else top
+                label = top["label"].lower()
+                row["intent"] = None if label == "none" else label
+                row["intent_score"] = float(top["score"])
+        return out
+
+
+def make_model(spec: Optional[str], intent_model: Optional[str] = None) -> Optional[TextModel]:
+    """Build a model from a CLASSIFIER_MODEL spec; None when the classifier is disabled."""
+    if not spec:
+        return None
+    kind, _, arg = spec.partition(":")
+    if kind == "stub":
+        batch_ms, _, item_ms = arg.partition(":")
+        return StubModel(float(batch_ms or 0), float(item_ms or 0))
+    if kind == "hf":
+        if not arg:
+            raise ValueError("CLASSIFIER_MODEL=hf:<model> needs a model name")
+        return TransformersModel(arg, intent_model or None)
+    # module.path:ClassName[:arg]
+    cls_name, _, arg = arg.partition(":")
+    cls = getattr(importlib.import_module(kind), cls_name)
+    return cls(arg) if arg else cls()
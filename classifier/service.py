@@ -0,0 +1,274 @@
+# classifier/service.py - micro-batching front end of the local text classifier
+# Handlers call classify(text) and await a future. Texts are collected on the
+# event loop into micro-batches: a batch goes to the worker process when it has
+# max_batch texts or its first text has waited max_wait seconds. While one batch
+# is being inferred the next one fills up, so batches grow with load and the
+# per-message cost falls. Results are cached (LRU) on the normalized text, and
+# identical texts waiting for the same batch share one slot.
+#
+# Scoring is best effort: a full queue or a failed batch yields None, and the
+# caller carries on as if the classifier were off.
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional
+
+from ai.cache import normalize_prompt
+from filters.intent import ACTION_PRIORITY
+from utils.metrics import metrics
+
+from .models import make_model
+from .worker import init_worker, score_batch
+
+log = logging.getLogger("masterbot.classifier")
+
+
+class Scores:
+    __slots__ = ("abuse", "intent", "intent_score")
+
+    def __init__(self, abuse: float, intent: Optional[str], intent_score: float):
+        self.abuse = abuse
+        self.intent = intent
+        self.intent_score = intent_score
+
+    def __repr__(self):
+        return f"Scores(abuse={self.abuse:.2f}, intent={self.intent!r}, intent_score={self.intent_score:.2f})"
+
+
+class Classifier:
+    """
+    - model / intent_model: CLASSIFIER_MODEL and CLASSIFIER_INTENT_MODEL specs
+      (see classifier/models.py); no model disables the classifier
+    - max_batch / max_wait: batch size cap, and seconds the first text of a batch may wait
+    - max_queue: texts waiting for a batch before new ones are refused (scored None)
+    - max_inflight: batches inferred at once (one per worker process is enough)
+    - processes / threads: worker processes, and CPU threads each may use
+    - cache_size: LRU entries keyed on normalized text
+    - max_chars: longer texts are scored on their beginning
+    - abuse_threshold / intent_threshold: scores at which is_abusive() / action() say yes
+    - batch_fn: the per-batch stage; anything but the default runs in a thread
+      instead of the worker process (benchmarks and local checks)
+    """
+
+    def __init__(self, model: Optional[str], intent_model: Optional[str] = None, max_batch: int = 32,
+                 max_wait: float = 0.02, max_queue: int = 1024, max_inflight: int = 1, processes: int = 1,
+                 threads: int = 2, cache_size: int = 4096, max_chars: int = 512, abuse_threshold: float = 0.8,
+                 intent_threshold: float = 0.7, batch_fn: Callable[[List[str]], List[dict]] = score_batch):
+        self.spec = model
+        self.intent_model = intent_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.max_inflight = max_inflight
+        self.processes = processes
+        self.threads = threads
+        self.cache_size = cache_size
+        self.max_chars = max_chars
+        self.abuse_threshold = abuse_threshold
+        self.intent_threshold = intent_threshold
+        self.batch_fn = batch_fn
+
+        self._cache: "OrderedDict[str, Scores]" = OrderedDict()
+        self._waiting: Dict[str, asyncio.Future] = {}  # key -> future of a queued/in-flight text
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.batches = 0
+        self.items = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.spec)
+
+    # ---- public API ----
+    def submit(self, text: str) -> asyncio.Future:
+        """Future with the text's Scores (None when refused or failed)."""
+        loop = asyncio.get_running_loop()
+        key = normalize_prompt(text[:self.max_chars])
+        scores = self._cache.get(key)
+        if scores is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            fut = loop.create_future()
+            fut.set_result(scores)
+            return fut
+        waiting = self._waiting.get(key)
+        if waiting is not None:
+            self.coalesced += 1
+            return waiting
+        self._ensure_running()
+        fut = loop.create_future()
+        try:
+            self._queue.put_nowait((key, text[:self.max_chars], fut))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            fut.set_result(None)
+            return fut
+        self.misses += 1
+        self._waiting[key] = fut
+        return fut
+
+    async def classify(self, text: str) -> Optional[Scores]:
+        # Shielded: a cancelled handler must not cancel a future other handlers share
+        return await asyncio.shield(self.submit(text))
+
+    def is_abusive(self, scores: Optional[Scores]) -> bool:
+        return scores is not None and scores.abuse >= self.abuse_threshold
+
+    def action(self, scores: Optional[Scores]) -> Optional[str]:
+        """The intent as a moderation action (mute, ban, ...) when the model is confident."""
+        if scores is None or scores.intent not in ACTION_PRIORITY or scores.intent_score < self.intent_threshold:
+            return None
+        return scores.intent
+
+    async def warm_up(self):
+        """Start the worker process and load the model before the first message needs it."""
+        if not self.enabled:
+            return
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor(), self.batch_fn, [])
+        except Exception as e:
+            log.warning("Classifier warm-up failed: %s", e)
+            return
+        log.info("Classifier %s ready in %.1fs.", self.spec, time.perf_counter() - started)
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "cache_entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ---- internals ----
+    def _ensure_running(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._slots = asyncio.Semaphore(self.max_inflight)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._batcher())
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.batch_fn is not score_batch:
+            return None
+        if self._pool is None:
+            import multiprocessing
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker, initargs=(self.spec, self.intent_model, self.threads),
+            )
+        return self._pool
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Waiting for a free slot lets the next batch keep filling meanwhile
+            await self._slots.acquire()
+            loop.create_task(self._infer(batch))
+
+    async def _infer(self, batch: list):
+        started = time.perf_counter()
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(
+                self._executor(), self.batch_fn, [text for _, text, _ in batch])
+        except Exception as e:
+            self.failed += len(batch)
+            log.warning("Classifier batch of %d failed: %s", len(batch), e)
+            if isinstance(e, BrokenProcessPool):
+                self._pool = None  # respawned on the next batch
+            rows = [None] * len(batch)
+        finally:
+            self._slots.release()
+        metrics.observe("classifier_batch", time.perf_counter() - started)
+        self.batches += 1
+        self.items += len(batch)
+        if not isinstance(rows, list) or len(rows) != len(batch):
+            log.warning("Classifier returned %s rows for a batch of %d; scoring them None.",
+                        len(rows) if isinstance(rows, list) else type(rows).__name__, len(batch))
+            self.failed += len(batch)
+            rows = [None] * len(batch)
+        for (key, _, fut), row in zip(batch, rows):
+            # Every text is resolved and released, whatever the row holds: callers must never hang
+            scores = None
+            if row:
+                try:
+                    scores = Scores(float(row["abuse"]), row.get("intent"), float(row.get("intent_score") or 0.0))
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    self.failed += 1
+                    log.warning("Malformed classifier row %r: %s", row, e)
+            if scores is not None:
+                self._cache[key] = scores
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            self._waiting.pop(key, None)
+            if not fut.done():
+                fut.set_result(scores)
+
+
+_classifier: Optional[Classifier] = None
+
+
+def get_classifier() -> Classifier:
+    """Process-wide classifier configured from CLASSIFIER_* variables (no process until the first batch)."""
+    global _classifier
+    if _classifier is None:
+        _classifier = Classifier(
+            model=os.getenv("CLASSIFIER_MODEL", ""),
+            intent_model=os.getenv("CLASSIFIER_INTENT_MODEL") or None,
+            max_batch=int(os.getenv("CLASSIFIER_BATCH", "32")),
+            max_wait=float(os.getenv("CLASSIFIER_WAIT_MS", "20")) / 1000,
+            threads=int(os.getenv("CLASSIFIER_THREADS", "2")),
+            cache_size=int(os.getenv("CLASSIFIER_CACHE_SIZE", "4096")),
+            abuse_threshold=float(os.getenv("CLASSIFIER_ABUSE_THRESHOLD", "0.8")),
+            intent_threshold=float(os.getenv("CLASSIFIER_INTENT_THRESHOLD", "0.7")),
+        )
+        if _classifier.enabled:
+            # Fail at startup on a bad spec rather than inside the worker
+            make_model(_classifier.spec, _classifier.intent_model)
+    return _classifier
@@ -0,0 +1,34 @@
+# classifier/worker.py - batched inference, run inside the classifier's worker process
+# The event loop sends whole micro-batches here; the model is built once per
+# process by init_worker.
+#
+# Keep this module light: it is imported by the worker process at spawn.
+
+import logging
+import os
+from typing import List, Optional
+
+from .models import TextModel, make_model
+
+log = logging.getLogger("masterbot.classifier")
+
+_model: Optional[TextModel] = None
+
+
+def init_worker(spec: str, intent_model: Optional[str], threads: int):
+    """Process-pool initializer: cap CPU threads, then build and load the model."""
+    global _model
+    # Read by torch / MKL / OpenMP when they are first imported
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, str(threads))
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    _model = make_model(spec, intent_model)
+    if _model is not None:
+        _model.load()
+
+
+def score_batch(texts: List[str]) -> List[dict]:
+    """Runs in the worker process: one score dict per text (see TextModel.score)."""
+    if _model is None or not texts:
+        return [{"abuse": 0.0, "intent": None, "intent_score": 0.0} for _ in texts]
+    return _model.score(texts)
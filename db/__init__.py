@@ -0,0 +1,15 @@
+import os
+from typing import Optional
+
+from .backends import Backend, MemoryBackend, MongoBackend, SQLiteBackend, make_backend
+from .store import DataStore
+
+_store: Optional[DataStore] = None
+
+
+def get_store() -> DataStore:
+    """Process-wide DataStore built from MONGO_URL (nothing connects until first use)."""
+    global _store
+    if _store is None:
+        _store = DataStore(make_backend(os.getenv("MONGO_URL")))
+    return _store
@@ -0,0 +1,221 @@
+# db/backends.py - pluggable document backends for the data layer
+# All backends expose the same small async API over "collections" of flat
+# documents matched by equality on their fields:
+#
+#   find_one(coll, query) / find(coll, query) / update_one(coll, query, fields, upsert)
+#   bulk_update(coll, [(query, fields), ...]) / delete_one(coll, query)
+#
+# MongoBackend runs pymongo in worker threads so handlers never block the loop;
+# SQLiteBackend and MemoryBackend are embedded stand-ins for local runs and tests.
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger("masterbot.db")
+
+Update = Tuple[dict, dict]
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    return all(doc.get(k) == v for k, v in query.items())
+
+
+class Backend:
+    name = "base"
+
+    async def find_one(self, coll: str, query: dict) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def find(self, coll: str, query: dict) -> List[dict]:
+        raise NotImplementedError
+
+    async def update_one(self, coll: str, query: dict, fields: dict, upsert: bool = True):
+        raise NotImplementedError
+
+    async def bulk_update(self, coll: str, updates: List[Update]):
+        for query, fields in updates:
+            await self.update_one(coll, query, fields, upsert=True)
+
+    async def delete_one(self, coll: str, query: dict):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryBackend(Backend):
+    """Process-local dict store; nothing survives a restart."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._colls: Dict[str, List[dict]] = {}
+
+    def _docs(self, coll: str) -> List[dict]:
+        return self._colls.setdefault(coll, [])
+
+    async def find_one(self, coll, query):
+        for doc in self._docs(coll):
+            if _matches(doc, query):
+                return dict(doc)
+        return None
+
+    async def find(self, coll, query):
+        return [dict(d) for d in self._docs(coll) if _matches(d, query)]
+
+    async def update_one(self, coll, query, fields, upsert=True):
+        for doc in self._docs(coll):
+            if _matches(doc, query):
+                doc.update(fields)
+                return
+        if upsert:
+            self._docs(coll).append({**query, **fields})
+
+    async def delete_one(self, coll, query):
+        docs = self._docs(coll)
+        for i, doc in enumerate(docs):
+            if _matches(doc, query):
+                del docs[i]
+                return
+
+
+class SQLiteBackend(Backend):
+    """
+    Embedded store: one table of JSON documents. Calls run in a worker thread
+    (sqlite3 is blocking); a lock serialises access to the shared connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS docs (coll TEXT NOT NULL, doc TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS docs_coll ON docs (coll)")
+        self._conn.commit()
+
+    def _scan(self, coll: str, query: dict) -> List[Tuple[int, dict]]:
+        rows = self._conn.execute("SELECT rowid, doc FROM docs WHERE coll = ?", (coll,)).fetchall()
+        out = []
+        for rowid, raw in rows:
+            doc = json.loads(raw)
+            if _matches(doc, query):
+                out.append((rowid, doc))
+        return out
+
+    def _update_sync(self, coll: str, updates: List[Update], upsert: bool = True):
+        with self._lock:
+            for query, fields in updates:
+                hits = self._scan(coll, query)
+                if hits:
+                    rowid, doc = hits[0]
+                    doc.update(fields)
+                    self._conn.execute("UPDATE docs SET doc = ? WHERE rowid = ?", (json.dumps(doc), rowid))
+                elif upsert:
+                    self._conn.execute("INSERT INTO docs (coll, doc) VALUES (?, ?)", (coll, json.dumps({**query, **fields})))
+            self._conn.commit()
+
+    def _find_sync(self, coll: str, query: dict) -> List[dict]:
+        with self._lock:
+            return [doc for _, doc in self._scan(coll, query)]
+
+    def _delete_sync(self, coll: str, query: dict):
+        with self._lock:
+            hits = self._scan(coll, query)
+            if hits:
+                self._conn.execute("DELETE FROM docs WHERE rowid = ?", (hits[0][0],))
+                self._conn.commit()
+
+    async def find_one(self, coll, query):
+        docs = await asyncio.to_thread(self._find_sync, coll, query)
+        return docs[0] if docs else None
+
+    async def find(self, coll, query):
+        return await asyncio.to_thread(self._find_sync, coll, query)
+
+    async def update_one(self, coll, query, fields, upsert=True):
+        await asyncio.to_thread(self._update_sync, coll, [(query, fields)], upsert)
+
+    async def bulk_update(self, coll, updates):
+        if updates:
+            await asyncio.to_thread(self._update_sync, coll, list(updates))
+
+    async def delete_one(self, coll, query):
+        await asyncio.to_thread(self._delete_sync, coll, query)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MongoBackend(Backend):
+    """pymongo (blocking) driven from worker threads; imported and connected on first use."""
+
+    name = "mongo"
+
+    def __init__(self, url: str, db_name: str = "MasterBotDB"):
+        self.url = url
+        self.db_name = db_name
+        self._db = None
+        self._client = None
+
+    def _database(self):
+        if self._db is None:
+            from utils.lazy import timed_import
+            self._client = timed_import("pymongo").MongoClient(self.url)
+            self._db = self._client[self.db_name]
+        return self._db
+
+    def _strip(self, doc: Optional[dict]) -> Optional[dict]:
+        if doc is not None:
+            doc.pop("_id", None)
+        return doc
+
+    async def find_one(self, coll, query):
+        return self._strip(await asyncio.to_thread(lambda: self._database()[coll].find_one(query)))
+
+    async def find(self, coll, query):
+        return [self._strip(d) for d in await asyncio.to_thread(lambda: list(self._database()[coll].find(query)))]
+
+    async def update_one(self, coll, query, fields, upsert=True):
+        await asyncio.to_thread(lambda: self._database()[coll].update_one(query, {"$set": fields}, upsert=upsert))
+
+    async def bulk_update(self, coll, updates):
+        if not updates:
+            return
+        from pymongo import UpdateOne
+        ops = [UpdateOne(q, {"$set": f}, upsert=True) for q, f in updates]
+        await asyncio.to_thread(lambda: self._database()[coll].bulk_write(ops, ordered=False))
+
+    async def delete_one(self, coll, query):
+        await asyncio.to_thread(lambda: self._database()[coll].delete_one(query))
+
+    async def close(self):
+        if self._client is not None:
+            await asyncio.to_thread(self._client.close)
+            self._client = None
+            self._db = None
+
+
+def make_backend(url: Optional[str]) -> Backend:
+    """
+    mongodb://... or mongodb+srv://...  -> MongoBackend
+    sqlite:///bot.db, sqlite:////abs/bot.db or sqlite://  -> SQLiteBackend
+    memory:// or empty                   -> MemoryBackend (nothing persisted)
+    """
+    if url and url.startswith(("mongodb://", "mongodb+srv://")):
+        return MongoBackend(url)
+    if url and url.startswith("sqlite://"):
+        # SQLAlchemy-style: sqlite:///relative.db, sqlite:////abs/path.db, sqlite:// = in memory
+        path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else ""
+        return SQLiteBackend(path or ":memory:")
+    if url and not url.startswith("memory://"):
+        log.warning("Unrecognised MONGO_URL scheme; using in-memory store.")
+    elif not url:
+        log.warning("No MONGO_URL set; punishments and global bans will not persist.")
+    return MemoryBackend()
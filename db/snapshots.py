@@ -0,0 +1,203 @@
+# db/snapshots.py - warm-state snapshots of the in-memory caches
+# Everything the bot learns at run time (admin rights, usernames, conversation
+# context, cached replies, the ban set) lives in memory and would otherwise be
+# rebuilt after a restart through slow, FloodWait-prone API calls. Components
+# register here with snapshot() -> JSON-able data and restore(data, age) -> count.
+#
+# - the file is SQLite: one row per component, zlib-compressed JSON, written in
+#   one transaction (a crash leaves the previous snapshot intact) and read
+#   through mmap
+# - snapshots are taken every `interval` seconds and at shutdown; the state is
+#   collected on the event loop, encoding and writing run in a thread
+# - at start-up the file is read in a thread and each section is handed to its
+#   component; sections older than their max_age are skipped, and components
+#   drop expired entries and never overwrite what they learned meanwhile
+#
+#   python -m db.snapshots [path]    # what a snapshot file holds
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger("masterbot.snapshots")
+
+FORMAT = 1  # bump when a component's snapshot layout changes incompatibly
+MMAP_BYTES = 64 << 20
+
+
+class Snapshots:
+    """
+    - path: SQLite file holding the latest snapshot ("" disables snapshots)
+    - interval: seconds between periodic snapshots
+    """
+
+    def __init__(self, path: str, interval: float = 300.0):
+        self.path = path
+        self.interval = interval
+        self._components: Dict[str, Tuple[object, float]] = {}  # name -> (component, max_age)
+        self._task: Optional[asyncio.Task] = None
+        self.saves = 0
+        self.failed = 0
+        self.last_save_ms = 0.0
+        self.last_collect_ms = 0.0
+        self.last_bytes = 0
+        self.restored: Dict[str, int] = {}
+        self.stale: List[str] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def register(self, name: str, component, max_age: float):
+        """component.snapshot() / component.restore(data, age); sections older than max_age are not restored."""
+        self._components[name] = (component, max_age)
+
+    # ---- restore ----
+    async def restore(self) -> int:
+        """Load the last snapshot into the registered components; returns the entries restored."""
+        if not self.enabled or not os.path.exists(self.path):
+            return 0
+        started = time.perf_counter()
+        try:
+            rows = await asyncio.to_thread(_read, self.path, list(self._components))
+        except Exception as e:
+            log.warning("Snapshot %s unreadable; starting cold: %s", self.path, e)
+            return 0
+        now = time.time()
+        total = 0
+        for name, (saved_at, fmt, data) in rows.items():
+            component, max_age = self._components[name]
+            age = max(now - saved_at, 0.0)
+            if fmt != FORMAT or age > max_age:
+                self.stale.append(name)
+                continue
+            try:
+                count = component.restore(data, age)
+            except Exception as e:
+                log.warning("Restoring %s from the snapshot failed: %s", name, e)
+                continue
+            self.restored[name] = count
+            total += count
+        log.info("Restored %d entries from %s in %.0f ms (%s%s).", total, self.path,
+                 (time.perf_counter() - started) * 1000,
+                 ", ".join(f"{k} {v}" for k, v in self.restored.items()) or "nothing",
+                 f"; stale: {', '.join(self.stale)}" if self.stale else "")
+        return total
+
+    # ---- save ----
+    async def save(self):
+        if not self.enabled:
+            return
+        started = time.perf_counter()
+        sections = {}
+        for name, (component, _) in self._components.items():
+            try:
+                sections[name] = component.snapshot()
+            except Exception as e:
+                log.warning("Snapshot of %s failed: %s", name, e)
+        self.last_collect_ms = (time.perf_counter() - started) * 1000
+        try:
+            self.last_bytes = await asyncio.to_thread(_write, self.path, sections, time.time())
+        except Exception as e:
+            self.failed += 1
+            log.warning("Writing snapshot %s failed: %s", self.path, e)
+            return
+        self.saves += 1
+        self.last_save_ms = (time.perf_counter() - started) * 1000
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
+
+    def start(self):
+        if self.enabled and self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def close(self):
+        """Stop the periodic snapshots and take a last one (shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.save()
+
+    def stats(self) -> dict:
+        return {
+            "saves": self.saves,
+            "failed": self.failed,
+            "last_save_ms": round(self.last_save_ms, 1),
+            "last_collect_ms": round(self.last_collect_ms, 1),
+            "last_bytes": self.last_bytes,
+            "restored": sum(self.restored.values()),
+            "stale_sections": len(self.stale),
+        }
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA mmap_size = {MMAP_BYTES}")
+    conn.execute("CREATE TABLE IF NOT EXISTS sections "
+                 "(name TEXT PRIMARY KEY, saved_at REAL NOT NULL, format INTEGER NOT NULL, data BLOB NOT NULL)")
+    return conn
+
+
+def _write(path: str, sections: Dict[str, object], saved_at: float) -> int:
+    rows = [(name, saved_at, FORMAT, zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 6))
+            for name, data in sections.items()]
+    conn = _connect(path)
+    try:
+        with conn:  # one transaction: readers see the old snapshot or the new one, never a mix
+            conn.executemany("INSERT OR REPLACE INTO sections VALUES (?, ?, ?, ?)", rows)
+    finally:
+        conn.close()
+    return sum(len(r[3]) for r in rows)
+
+
+def _read(path: str, names: List[str]) -> Dict[str, Tuple[float, int, object]]:
+    if not names:
+        return {}
+    conn = _connect(path)
+    try:
+        marks = ",".join("?" * len(names))
+        rows = conn.execute(f"SELECT name, saved_at, format, data FROM sections WHERE name IN ({marks})",
+                            names).fetchall()
+    finally:
+        conn.close()
+    return {name: (saved_at, fmt, json.loads(zlib.decompress(data))) for name, saved_at, fmt, data in rows}
+
+
+_snapshots: Optional[Snapshots] = None
+
+
+def get_snapshots() -> Snapshots:
+    """Process-wide snapshots at SNAPSHOT_PATH (one file per shard when sharded)."""
+    global _snapshots
+    if _snapshots is None:
+        path = os.getenv("SNAPSHOT_PATH", "MasterBot.snapshot")
+        shard = os.getenv("MASTERBOT_SHARD", "").partition("/")[0]
+        if path and shard:
+            path = f"{path}.shard{shard}"
+        _snapshots = Snapshots(path, interval=float(os.getenv("SNAPSHOT_INTERVAL", "300")))
+    return _snapshots
+
+
+def _main():
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else get_snapshots().path
+    conn = _connect(path)
+    try:
+        rows = conn.execute("SELECT name, saved_at, format, length(data) FROM sections ORDER BY name").fetchall()
+    finally:
+        conn.close()
+    for name, saved_at, fmt, size in rows:
+        print(f"{name:22s} {size:10,d} bytes  format {fmt}  {time.time() - saved_at:8.0f}s old")
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,345 @@
+# db/store.py - cached data layer used by the handlers
+# - global bans live in an in-memory set (write-through on change, periodic refresh),
+#   so check_global_ban is a set lookup, never a network call
+# - punishment records are read once then served from memory; spam-counter
+#   updates are buffered and flushed in one bulk write (write-behind)
+# - groups the bot has seen (and whether it is admin there) are kept in memory
+#   and flushed the same way; background jobs (gban fan-out) checkpoint here
+# - per-chat settings (flood limits, spam action, ...) are loaded once and written through
+# - changes to the global state (bans, the bot's chats) are published to subscribers,
+#   so sharded worker processes can mirror each other (bot/shards.py)
+# - start() never waits for the database: the backend is loaded in the background
+#   (retried until it answers) while handlers are served what memory holds, empty or
+#   seeded from a warm-state snapshot (db/snapshots.py); wait_loaded() is for the
+#   few callers that need the full picture (the gban fan-out's chat list)
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .backends import Backend
+
+log = logging.getLogger("masterbot.db")
+
+GLOBAL_BAN = "global_ban"
+PUNISHMENTS = "punishments"
+CHATS = "chats"
+JOBS = "jobs"
+SETTINGS = "settings"
+
+
+class DataStore:
+    """
+    - flush_interval: seconds between write-behind flushes of punishment updates
+    - refresh_interval: seconds between reloads of the global-ban set (picks up
+      changes made by other processes or by hand in the database)
+    - max_cached: punishment records kept in memory (LRU; dirty ones are never dropped)
+    """
+
+    def __init__(self, backend: Backend, flush_interval: float = 2.0, refresh_interval: float = 300.0,
+                 max_cached: int = 50000):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.max_cached = max_cached
+
+        self.global_bans: Set[int] = set()
+        self._ban_changes: List[Dict[int, bool]] = []  # one per refresh in flight: bans changed since its read
+        self._punishments: "OrderedDict[Tuple[int, int], dict]" = OrderedDict()
+        self._dirty: Dict[Tuple[int, int], dict] = {}
+        self.chats: Dict[int, bool] = {}  # chat_id -> bot is admin there
+        self._dirty_chats: Set[int] = set()
+        self.settings: Dict[int, dict] = {}  # chat_id -> settings
+        self._listeners: List[Callable[[str, int, object], None]] = []
+        self._changed_settings: Dict[int, dict] = {}  # set_chat_settings() calls made before the load
+        self._tasks = []
+        self._started = False
+        self._loaded = asyncio.Event()
+        self.load_attempts = 0
+        self.loaded_at = 0.0
+        self.flushes = 0
+        self.flushed_docs = 0
+
+    # ---- lifecycle ----
+    async def start(self):
+        """Start loading from the backend and the flush/refresh loops; returns at once (idempotent)."""
+        if self._started:
+            return
+        self._started = True
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._flush_loop()), loop.create_task(self._refresh_loop())]
+        if not self._loaded.is_set():
+            self._tasks.append(loop.create_task(self._load_in_background()))
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded.is_set()
+
+    async def wait_loaded(self):
+        """Until the backend has been read once (start() must have been called)."""
+        await self._loaded.wait()
+
+    async def _load(self):
+        await self.refresh_global_bans()
+        docs = [doc for doc in await self.backend.find(CHATS, {}) if "chat_id" in doc]
+        # The backend is the record; only chats noted since start-up (not yet flushed) are newer
+        known = {doc["chat_id"] for doc in docs}
+        for chat_id in [c for c in self.chats if c not in known and c not in self._dirty_chats]:
+            del self.chats[chat_id]
+        for doc in docs:
+            if doc["chat_id"] not in self._dirty_chats:
+                self.chats[doc["chat_id"]] = bool(doc.get("bot_admin"))
+        for doc in await self.backend.find(SETTINGS, {}):
+            if "chat_id" in doc:
+                chat_id = doc.pop("chat_id")
+                # The backend replaces snapshot values; fields set here meanwhile are newer
+                self.settings[chat_id] = {**doc, **self._changed_settings.get(chat_id, {})}
+
+    async def _load_in_background(self):
+        delay = 1.0
+        while True:
+            self.load_attempts += 1
+            try:
+                await self._load()
+                break
+            except Exception as e:
+                log.warning("Loading the store failed (retrying in %gs; serving what memory holds): %s", delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.refresh_interval)
+        self._changed_settings.clear()
+        self._loaded.set()
+
+    async def close(self):
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+        try:
+            await self.flush()
+        finally:
+            # A failed last flush (database down) must not leak the connection
+            await self.backend.close()
+            self._started = False
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.exception("Punishment flush failed (will retry): %s", e)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh_global_bans()
+            except Exception as e:
+                log.exception("Global-ban refresh failed: %s", e)
+
+    # ---- global bans ----
+    async def refresh_global_bans(self):
+        changes: Dict[int, bool] = {}
+        self._ban_changes.append(changes)
+        try:
+            docs = await self.backend.find(GLOBAL_BAN, {"banned": True})
+        finally:
+            self._ban_changes.remove(changes)
+        bans = {d["user_id"] for d in docs if "user_id" in d}
+        # Bans set or mirrored while the read was in flight may be missing from it (or not written yet)
+        for user_id, banned in changes.items():
+            if banned:
+                bans.add(user_id)
+            else:
+                bans.discard(user_id)
+        self.global_bans = bans
+        self.loaded_at = time.time()
+        log.info("Loaded %d global bans.", len(self.global_bans))
+
+    def is_globally_banned(self, user_id: int) -> bool:
+        return user_id in self.global_bans
+
+    def _set_ban(self, user_id: int, banned: bool):
+        if banned:
+            self.global_bans.add(user_id)
+        else:
+            self.global_bans.discard(user_id)
+        for changes in self._ban_changes:
+            changes[user_id] = banned
+
+    async def set_global_ban(self, user_id: int, banned: bool = True):
+        """Write-through: memory first (takes effect immediately), then the backend."""
+        self._set_ban(user_id, banned)
+        self._publish("global_ban", user_id, banned)
+        await self.backend.update_one(GLOBAL_BAN, {"user_id": user_id}, {"banned": banned}, upsert=True)
+
+    # ---- punishments ----
+    async def get_punishment(self, user_id: int, group_id: int) -> dict:
+        key = (user_id, group_id)
+        doc = self._punishments.get(key)
+        if doc is None:
+            doc = await self.backend.find_one(PUNISHMENTS, {"user_id": user_id, "group_id": group_id}) or {}
+            doc.pop("user_id", None)
+            doc.pop("group_id", None)
+            doc.setdefault("spams", 0)
+            # A concurrent caller may have cached (or dirtied) it while we awaited
+            doc = self._punishments.setdefault(key, doc)
+        self._punishments.move_to_end(key)
+        self._trim()
+        return dict(doc)
+
+    def set_punishment(self, user_id: int, group_id: int, data: dict):
+        """Update memory now; the backend write is batched into the next flush."""
+        key = (user_id, group_id)
+        fields = {k: v for k, v in data.items() if k not in ("_id", "user_id", "group_id")}
+        doc = self._punishments.setdefault(key, {})
+        doc.update(fields)
+        self._punishments.move_to_end(key)
+        self._dirty.setdefault(key, {}).update(fields)
+        self._trim()
+
+    # ---- chats the bot is in ----
+    def note_chat(self, chat_id: int, bot_admin: Optional[bool] = None):
+        """Record a group the bot is in; only changes are written (next flush)."""
+        known = self.chats.get(chat_id)
+        if bot_admin is None:
+            if known is not None:
+                return
+            bot_admin = False
+        elif known == bot_admin:
+            return
+        self.chats[chat_id] = bot_admin
+        self._dirty_chats.add(chat_id)
+        self._publish("chat", chat_id, bot_admin)
+
+    def forget_chat(self, chat_id: int):
+        if self.chats.pop(chat_id, None) is not None:
+            self._dirty_chats.add(chat_id)
+            self._publish("chat", chat_id, None)
+
+    def admin_chats(self):
+        return [c for c, admin in self.chats.items() if admin]
+
+    async def _flush_chats(self):
+        if not self._dirty_chats:
+            return
+        pending, self._dirty_chats = self._dirty_chats, set()
+        try:
+            updates = []
+            for chat_id in pending:
+                if chat_id in self.chats:
+                    updates.append(({"chat_id": chat_id}, {"bot_admin": self.chats[chat_id]}))
+                else:
+                    await self.backend.delete_one(CHATS, {"chat_id": chat_id})
+            await self.backend.bulk_update(CHATS, updates)
+        except Exception:
+            # Deletes and updates are idempotent: the next flush retries the whole batch
+            self._dirty_chats |= pending
+            raise
+
+    # ---- change feed ----
+    def subscribe(self, listener: Callable[[str, int, object], None]):
+        """listener(kind, key, value) is called on every local change to global state."""
+        self._listeners.append(listener)
+
+    def _publish(self, kind: str, key: int, value):
+        for listener in self._listeners:
+            listener(kind, key, value)
+
+    def apply_remote(self, kind: str, key: int, value):
+        """Mirror a change another process made (memory only: that process writes it)."""
+        if kind == "global_ban":
+            self._set_ban(key, bool(value))
+        elif kind == "chat":
+            if value is None:
+                self.chats.pop(key, None)
+            else:
+                self.chats[key] = value
+
+    # ---- warm restarts (db/snapshots.py) ----
+    def snapshot(self) -> dict:
+        return {
+            "global_bans": sorted(self.global_bans),
+            "chats": [[chat_id, admin] for chat_id, admin in self.chats.items()],
+            "settings": [[chat_id, fields] for chat_id, fields in self.settings.items()],
+        }
+
+    def restore(self, data: dict, age: float) -> int:
+        """Seed memory before start() (later it would only be staler than what is loaded)."""
+        if self._started:
+            return 0
+        self.global_bans |= set(data.get("global_bans", ()))
+        for chat_id, admin in data.get("chats", ()):
+            self.chats.setdefault(chat_id, admin)
+        for chat_id, fields in data.get("settings", ()):
+            self.settings.setdefault(chat_id, fields)
+        self.loaded_at = time.time() - age
+        return len(self.global_bans) + len(self.chats) + len(self.settings)
+
+    # ---- per-chat settings ----
+    def chat_settings(self, chat_id: int) -> dict:
+        return self.settings.get(chat_id, {})
+
+    async def set_chat_settings(self, chat_id: int, **fields):
+        """Write-through, like global bans: settings change rarely and must not be lost."""
+        self.settings.setdefault(chat_id, {}).update(fields)
+        if not self._loaded.is_set():
+            self._changed_settings.setdefault(chat_id, {}).update(fields)
+        await self.backend.update_one(SETTINGS, {"chat_id": chat_id}, fields, upsert=True)
+
+    # ---- job checkpoints ----
+    async def save_job(self, job_id: str, fields: dict):
+        await self.backend.update_one(JOBS, {"job_id": job_id}, fields, upsert=True)
+
+    async def load_jobs(self, kind: str, status: str = "running"):
+        return await self.backend.find(JOBS, {"kind": kind, "status": status})
+
+    async def flush(self):
+        # Independent collections: a failed chat write must not hold punishments back
+        try:
+            await self._flush_chats()
+        finally:
+            await self._flush_punishments()
+
+    async def _flush_punishments(self):
+        if not self._dirty:
+            return
+        pending, self._dirty = self._dirty, {}
+        updates = [({"user_id": u, "group_id": g}, fields) for (u, g), fields in pending.items()]
+        try:
+            await self.backend.bulk_update(PUNISHMENTS, updates)
+        except Exception:
+            # Put them back (newer in-memory changes win) so the next flush retries
+            for key, fields in pending.items():
+                self._dirty[key] = {**fields, **self._dirty.get(key, {})}
+            raise
+        self.flushes += 1
+        self.flushed_docs += len(updates)
+
+    def _trim(self):
+        excess = len(self._punishments) - self.max_cached
+        if excess <= 0:
+            return
+        # Oldest first; unflushed records are skipped, so look at most len(dirty) further
+        for key in list(islice(self._punishments, excess + len(self._dirty))):
+            if excess <= 0:
+                break
+            if key not in self._dirty:
+                del self._punishments[key]
+                excess -= 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "loaded": int(self.loaded),
+            "load_attempts": self.load_attempts,
+            "global_bans": len(self.global_bans),
+            "cached_punishments": len(self._punishments),
+            "dirty": len(self._dirty),
+            "chats": len(self.chats),
+            "chat_settings": len(self.settings),
+            "flushes": self.flushes,
+            "flushed_docs": self.flushed_docs,
+        }
@@ -0,0 +1,3 @@
+from .intent import Intent, classify_message, classify_text, detect_action, parse_duration
+from .flood import FloodDetector, FloodLimits, SlidingSketch
+from .dupes import Cluster, DuplicateIndex, normalize, signature
@@ -0,0 +1,208 @@
+# filters/dupes.py - cross-chat near-duplicate (spam wave) detection
+# Every group message with enough text gets a MinHash signature (one-permutation
+# hashing: each character 5-gram is hashed once into one of `k` bins, so a
+# message costs O(length), not O(length * k)). Signatures are banded into an LSH
+# index shared by all chats; messages whose signatures agree on a whole band are
+# candidates, and a candidate joins a cluster when its estimated Jaccard
+# similarity is above the threshold. A cluster that reaches `min_chats` chats
+# (or `min_count` copies across at least two chats) inside the window is a spam
+# wave; repeats inside one chat alone never are, that is ordinary chatter.
+#
+# Memory is bounded by max_clusters: clusters expire `window` seconds after their
+# last message, and the least recently hit ones are evicted first when full.
+
+import re
+import unicodedata
+import zlib
+from array import array
+from collections import OrderedDict
+from itertools import count
+from typing import Dict, List, Optional, Set
+
+_SHINGLE = 5
+_MASK = 0xFFFFFFFF
+# Zero-width and other format characters spammers sprinkle in to dodge exact matching
+_INVISIBLE = dict.fromkeys(c for c in range(0x2000, 0x2070) if unicodedata.category(chr(c)) == "Cf")
+_INVISIBLE[0xFEFF] = None
+_NON_WORD = re.compile(r"[\W_]+")
+_DIGITS = re.compile(r"\d+")
+
+
+def normalize(text: str) -> str:
+    """Casefold, drop invisible characters and punctuation, and treat every number alike."""
+    text = unicodedata.normalize("NFKC", text).translate(_INVISIBLE).casefold()
+    text = _DIGITS.sub("0", text)
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def signature(text: str, k: int = 32) -> Optional[array]:
+    """
+    One-permutation MinHash of normalized text's character 5-grams (k bins, a
+    power of two); None when the text has no shingles. Empty bins borrow from the next filled
+    bin (densification), so short texts still compare position by position.
+    """
+    if len(text) < _SHINGLE:
+        return None
+    n = len(text) - _SHINGLE + 1
+    if text.isascii():
+        data = text.encode()
+        shingles = [data[i:i + _SHINGLE] for i in range(n)]
+    else:
+        shingles = [text[i:i + _SHINGLE].encode() for i in range(n)]
+    crc32 = zlib.crc32
+    mask, shift = k - 1, k.bit_length() - 1
+    # Low bits pick the bin, the rest is the value. Descending, so each bin keeps its minimum.
+    hashes = sorted([crc32(sh) for sh in shingles], reverse=True)
+    mins = {h & mask: h >> shift for h in hashes}
+    sig = [mins.get(b) for b in range(k)]
+    if len(mins) < k:
+        for b in range(k):
+            if sig[b] is None:
+                # Nearest filled bin to the right (wrapping), offset by the distance
+                step = next(d for d in range(1, k) if sig[(b + d) % k] is not None)
+                sig[b] = (sig[(b + step) % k] + step * 0x01000193) & _MASK
+    return array("I", sig)
+
+
+class Cluster:
+    __slots__ = ("id", "sig", "keys", "first", "last", "count", "chats", "notified")
+
+    def __init__(self, cluster_id: int, sig: array, now: float):
+        self.id = cluster_id
+        self.sig = sig
+        self.keys: List[int] = []  # LSH band keys pointing at this cluster
+        self.first = now
+        self.last = now
+        self.count = 0
+        self.chats: Set[int] = set()
+        self.notified: Set[int] = set()  # chats already told about this wave (modules/antispam.py)
+
+    def __repr__(self):
+        return f"Cluster(id={self.id}, count={self.count}, chats={len(self.chats)})"
+
+
+class DuplicateIndex:
+    """
+    - window: seconds a cluster lives after its last message
+    - threshold: estimated Jaccard similarity for a message to join a cluster
+    - min_chats / min_count: a cluster is a spam wave once it has been seen in this
+      many chats, or this many times in at least two chats
+    - min_chars: shorter messages (after normalization) are ignored; "good morning"
+      is legitimately posted everywhere
+    - k / bands: signature size and LSH bands (k // bands rows per band)
+    - max_clusters: memory bound; about 2 KB per cluster, LSH keys included
+    - max_variants: signatures of one cluster kept in the LSH index (tracks drift)
+    - max_members: distinct chats remembered per cluster
+    """
+
+    def __init__(self, window: float = 600.0, threshold: float = 0.7, min_chats: int = 3, min_count: int = 5,
+                 min_chars: int = 40, k: int = 32, bands: int = 8, max_clusters: int = 10000,
+                 max_variants: int = 4, max_members: int = 256):
+        if k & (k - 1) or k % bands:
+            raise ValueError("k must be a power of two and a multiple of bands")
+        self.window = window
+        self.threshold = threshold
+        self.min_chats = min_chats
+        self.min_count = min_count
+        self.min_chars = min_chars
+        self.k = k
+        self.bands = bands
+        self.rows = k // bands
+        self.max_clusters = max_clusters
+        self.max_variants = max_variants
+        self.max_members = max_members
+        self._clusters: "OrderedDict[int, Cluster]" = OrderedDict()  # least recently hit first
+        self._buckets: Dict[int, int] = {}  # band key -> cluster id
+        self._ids = count(1)
+        self.messages = 0
+        self.checked = 0
+        self.flagged = 0
+        self.evicted = 0
+
+    def _band_keys(self, sig: array) -> List[int]:
+        r = self.rows
+        return [hash((band, *sig[band * r:(band + 1) * r])) for band in range(self.bands)]
+
+    def _similarity(self, a: array, b: array) -> float:
+        return sum(x == y for x, y in zip(a, b)) / self.k
+
+    def _expire(self, now: float):
+        clusters = self._clusters
+        cutoff = now - self.window
+        while clusters:
+            cluster = next(iter(clusters.values()))
+            if cluster.last >= cutoff and len(clusters) <= self.max_clusters:
+                break
+            if cluster.last >= cutoff:
+                self.evicted += 1
+            self._drop(cluster)
+
+    def _drop(self, cluster: Cluster):
+        del self._clusters[cluster.id]
+        buckets = self._buckets
+        for key in cluster.keys:
+            # A later cluster may have taken the bucket over
+            if buckets.get(key) == cluster.id:
+                del buckets[key]
+
+    def add(self, chat_id: int, text: str, now: float) -> Optional[Cluster]:
+        """
+        Index one message; returns its cluster when that cluster is (now) a spam
+        wave, else None. Texts too short to judge are not indexed.
+        """
+        self.messages += 1
+        norm = normalize(text)
+        if len(norm) < self.min_chars:
+            return None
+        self.checked += 1
+        self._expire(now)
+        sig = signature(norm, self.k)
+        keys = self._band_keys(sig)
+
+        best, best_sim = None, self.threshold
+        seen = set()
+        for key in keys:
+            cid = self._buckets.get(key)
+            if cid is None or cid in seen:
+                continue
+            seen.add(cid)
+            cluster = self._clusters.get(cid)
+            if cluster is None:
+                continue
+            sim = self._similarity(sig, cluster.sig)
+            if sim >= best_sim:
+                best, best_sim = cluster, sim
+
+        if best is None:
+            best = Cluster(next(self._ids), sig, now)
+            self._clusters[best.id] = best
+            self._index(best, keys)
+        else:
+            self._clusters.move_to_end(best.id)
+            if best_sim < 1.0 and len(best.keys) < self.max_variants * self.bands:
+                self._index(best, keys)
+        best.last = now
+        best.count += 1
+        if len(best.chats) < self.max_members:
+            best.chats.add(chat_id)
+        if len(best.chats) >= self.min_chats or (best.count >= self.min_count and len(best.chats) >= 2):
+            self.flagged += 1
+            return best
+        return None
+
+    def _index(self, cluster: Cluster, keys: List[int]):
+        for key in keys:
+            self._buckets[key] = cluster.id
+        cluster.keys.extend(keys)
+
+    def stats(self) -> dict:
+        return {
+            "messages": self.messages,
+            "checked": self.checked,
+            "flagged": self.flagged,
+            "clusters": len(self._clusters),
+            "waves": sum(1 for c in self._clusters.values()
+                         if len(c.chats) >= self.min_chats or (c.count >= self.min_count and len(c.chats) >= 2)),
+            "lsh_keys": len(self._buckets),
+            "evicted": self.evicted,
+        }
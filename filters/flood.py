@@ -0,0 +1,187 @@
+# filters/flood.py - memory-bounded flood detection
+# Per-(chat, user) message rates over sliding windows, counted in a timing wheel
+# of count-min sketches: fixed arrays whose size does not depend on how many
+# users the bot has seen. A message costs a few array reads/increments; expiring
+# a slot only touches the cells that slot incremented.
+#
+# Counts are approximate and can only err high: a cell shared with other keys
+# (a hash collision) adds their messages to a user's estimate, so someone just
+# under the limit can be tripped. Conservative update and taking the minimum over
+# `depth` rows keep that rare, and the width is sized from the number of
+# (chat, user) pairs expected to be active in a window: with K of them and
+# `width` columns, a row collides with probability about K / width, all rows
+# with about (K / width) ** depth. The default 8 columns per active pair and 4
+# rows leave about 5 estimates in 10,000 with any excess at all (measured; the
+# rows' hashes are not independent), and then only by the few messages of the
+# colliding users.
+
+from array import array
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class SlidingSketch:
+    """
+    Count-min sketch over a sliding window, as a wheel of `slots` sub-sketches.
+    - window: seconds covered
+    - width / depth: sketch columns (power of two) and rows
+    """
+
+    def __init__(self, window: float, slots: int = 10, width: int = 16384, depth: int = 4):
+        if width & (width - 1):
+            raise ValueError("width must be a power of two")
+        self.window = window
+        self.slots = slots
+        self.slot_len = window / slots
+        self.width = width
+        self.depth = depth
+        self._mask = width - 1
+        size = width * depth
+        # total = sum of the live slots, so an estimate reads one array
+        self._total = array("I", bytes(4 * size))
+        self._slot_counts = [array("H", bytes(2 * size)) for _ in range(slots)]
+        self._touched = [[] for _ in range(slots)]  # cell indices each slot incremented
+        self._epoch = 0  # absolute index of the current slot
+
+    def _cells(self, key: int):
+        h1 = key & 0xFFFFFFFF
+        h2 = ((key >> 32) ^ (key >> 7)) | 1
+        w, mask = self.width, self._mask
+        return [r * w + ((h1 + r * h2) & mask) for r in range(self.depth)]
+
+    def _advance(self, now: float):
+        epoch = int(now / self.slot_len)
+        if epoch <= self._epoch:
+            return
+        total = self._total
+        # Expire every slot passed since the last message (at most the whole wheel)
+        for e in range(max(self._epoch + 1, epoch - self.slots + 1), epoch + 1):
+            i = e % self.slots
+            counts, touched = self._slot_counts[i], self._touched[i]
+            for cell in touched:
+                total[cell] -= counts[cell]
+                counts[cell] = 0
+            touched.clear()
+        self._epoch = epoch
+
+    def add(self, key: int, now: float) -> int:
+        """Count one event for key; returns its estimated count in the window."""
+        self._advance(now)
+        cells = self._cells(key)
+        total = self._total
+        low = min(total[c] for c in cells)
+        slot = self._epoch % self.slots
+        counts, touched = self._slot_counts[slot], self._touched[slot]
+        for c in cells:
+            # Conservative update: only the rows at the minimum hold key's own count
+            if total[c] == low and counts[c] < 0xFFFF:
+                if not counts[c]:
+                    touched.append(c)
+                counts[c] += 1
+                total[c] += 1
+        return low + 1
+
+    def estimate(self, key: int, now: float) -> int:
+        self._advance(now)
+        return min(self._total[c] for c in self._cells(key))
+
+    def nbytes(self) -> int:
+        return self._total.itemsize * len(self._total) + sum(a.itemsize * len(a) for a in self._slot_counts)
+
+
+class FloodLimits:
+    __slots__ = ("burst", "sustained", "enabled")
+
+    def __init__(self, burst: int, sustained: int, enabled: bool = True):
+        self.burst = burst
+        self.sustained = sustained
+        self.enabled = enabled
+
+    def __repr__(self):
+        return f"FloodLimits(burst={self.burst}, sustained={self.sustained}, enabled={self.enabled})"
+
+
+class FloodDetector:
+    """
+    - burst_window / burst_limit: more than burst_limit messages in burst_window seconds trips
+    - sustained_window / sustained_limit: the same over a longer window
+    - cooldown: seconds a tripped (chat, user) is not reported again (the mute is running)
+    - active_keys: (chat, user) pairs expected to post within sustained_window; the
+      sketch width is the next power of two of columns_per_key times that
+    - width / depth: sketch size (width overrides active_keys); memory is fixed at
+      roughly (slots + 2) * width * depth * 2 bytes per window, whatever the number of users
+    """
+
+    def __init__(self, burst_window: float = 5.0, burst_limit: int = 8, sustained_window: float = 60.0,
+                 sustained_limit: int = 30, cooldown: float = 60.0, active_keys: int = 2048,
+                 columns_per_key: int = 8, width: Optional[int] = None, depth: int = 4, max_tripped: int = 10000):
+        if width is None:
+            width = 1 << max(10, (active_keys * columns_per_key - 1).bit_length())
+        self.default = FloodLimits(burst_limit, sustained_limit)
+        self.burst_window = burst_window
+        self.sustained_window = sustained_window
+        self.cooldown = cooldown
+        self.max_tripped = max_tripped
+        self._burst = SlidingSketch(burst_window, slots=5, width=width, depth=depth)
+        self._sustained = SlidingSketch(sustained_window, slots=12, width=width, depth=depth)
+        self._limits: Dict[int, FloodLimits] = {}
+        self._tripped: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
+        self.messages = 0
+        self.trips = 0
+
+    # ---- per-chat thresholds ----
+    def limits(self, chat_id: int) -> FloodLimits:
+        return self._limits.get(chat_id, self.default)
+
+    def set_limits(self, chat_id: int, burst: Optional[int] = None, sustained: Optional[int] = None,
+                   enabled: Optional[bool] = None) -> FloodLimits:
+        cur = self.limits(chat_id)
+        new = FloodLimits(
+            burst if burst is not None else cur.burst,
+            sustained if sustained is not None else cur.sustained,
+            enabled if enabled is not None else cur.enabled,
+        )
+        self._limits[chat_id] = new
+        return new
+
+    def reset_limits(self, chat_id: int):
+        self._limits.pop(chat_id, None)
+
+    # ---- hot path ----
+    def hit(self, chat_id: int, user_id: int, now: float) -> Optional[str]:
+        """
+        Count one message; returns "burst" or "sustained" when it takes the user
+        over the chat's limit, else None.
+        """
+        self.messages += 1
+        limits = self._limits.get(chat_id, self.default)
+        if not limits.enabled:
+            return None
+        key = hash((chat_id, user_id)) & 0xFFFFFFFFFFFFFFFF
+        burst = self._burst.add(key, now)
+        sustained = self._sustained.add(key, now)
+        if burst > limits.burst:
+            reason = "burst"
+        elif sustained > limits.sustained:
+            reason = "sustained"
+        else:
+            return None
+        pair = (chat_id, user_id)
+        until = self._tripped.get(pair)
+        if until is not None and until > now:
+            return None
+        self._tripped[pair] = now + self.cooldown
+        self._tripped.move_to_end(pair)
+        if len(self._tripped) > self.max_tripped:
+            self._tripped.popitem(last=False)
+        self.trips += 1
+        return reason
+
+    def stats(self) -> dict:
+        return {
+            "messages": self.messages,
+            "trips": self.trips,
+            "chats_with_limits": len(self._limits),
+            "sketch_width": self._sustained.width,
+            "sketch_bytes": self._burst.nbytes() + self._sustained.nbytes(),
+        }
@@ -0,0 +1,193 @@
+# filters/intent.py - single-pass trigger/intent matcher
+# Every group message used to be lowercased and regex-scanned several times
+# (moderation_handler, detect_action, then again in ai_handler). Here the
+# Hindi/English keyword tables are compiled into ONE regex; a single findall
+# pass classifies the message and the result is memoised per update so every
+# handler group reuses it.
+
+import re
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
+
+MASTER_WORD = "master"
+
+# Action keyword tables (word-bounded). Order = priority, as in the original detect_action.
+ACTION_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("mute", ("mute", "chup", "silent", "silence", "restrict", "restricted")),
+    ("unmute", ("unmute", "allow", "undo mute", "remove mute", "kholo", "bolne do")),
+    ("ban", ("ban", "nikal", "remove from group", "ban karo", "nikal do")),
+    ("unban", ("unban", "wapis", "unblock", "remove ban", "unban karo")),
+    ("kick", ("kick", "kick out", "bahar", "nakaal")),
+)
+ACTION_PRIORITY = tuple(action for action, _ in ACTION_KEYWORDS)
+
+# A moderation message must contain one of these anywhere (substring, not word-bounded)
+MODERATION_KEYWORDS = ("mute", "unmute", "ban", "unban", "kick", "nikal", "chup", "remove", "allow", "unblock")
+
+DEFAULT_MUTE = timedelta(minutes=10)
+
+_DURATION_UNITS = r"min(?:ute)?s?|hour(?:s?)|day(?:s?)"
+_DURATION_RE = re.compile(r"(\d+)\s*(" + _DURATION_UNITS + r")", flags=re.IGNORECASE)
+
+
+def parse_duration(text: str) -> Optional[timedelta]:
+    """
+    Parses the first duration expression in text.
+    Supports: min(s), minute(s), hour(s), day(s)
+    Returns timedelta or None.
+    """
+    m = _DURATION_RE.search(text)
+    if not m:
+        return None
+    return _to_timedelta(int(m.group(1)), m.group(2).lower())
+
+
+def _to_timedelta(amt: int, unit: str) -> Optional[timedelta]:
+    if "min" in unit:
+        return timedelta(minutes=amt)
+    if "hour" in unit:
+        return timedelta(hours=amt)
+    if "day" in unit:
+        return timedelta(days=amt)
+    return None
+
+
+def _alternation(words) -> str:
+    # Longest first so "ban karo" is tried before "ban"; the regex still backtracks
+    # to the shorter word when the longer one fails its word boundary.
+    return "|".join(re.escape(w) for w in sorted(set(words), key=len, reverse=True))
+
+
+def _build():
+    rank = {action: i for i, (action, _) in enumerate(ACTION_KEYWORDS)}
+    action_of: Dict[str, str] = {}
+    for action, words in ACTION_KEYWORDS:
+        for w in words:
+            action_of.setdefault(w, action)
+    # The old detect_action ran one search per action in priority order, so a phrase
+    # that contains a higher-priority word ("undo mute" contains "mute") resolved to
+    # that word. A single non-overlapping pass consumes the whole phrase, so bake the
+    # winning action (and whether it contains a moderation keyword) into the table.
+    effective, is_mod = {}, {}
+    for phrase, action in action_of.items():
+        for w, other in action_of.items():
+            if rank[other] < rank[action] and re.search(r"\b" + re.escape(w) + r"\b", phrase):
+                action = other
+        effective[phrase] = action
+        is_mod[phrase] = any(m in phrase for m in MODERATION_KEYWORDS)
+    # The leading class lets the engine reject most positions before trying the alternation.
+    first = "".join(sorted({w[0] for w in list(action_of) + list(MODERATION_KEYWORDS)}))
+    pattern = re.compile(
+        r"(?=[" + first + r"0-9])"
+        r"(?:\b(?P<act>" + _alternation(action_of) + r")\b"
+        r"|(?P<mod>" + _alternation(MODERATION_KEYWORDS) + r")"
+        r"|(?P<amount>\d+)\s*(?P<unit>" + _DURATION_UNITS + r"))"
+    )
+    return pattern, effective, is_mod
+
+
+_PATTERN, _ACTION_OF, _ACT_IS_MOD = _build()
+_RANK = {action: i for i, action in enumerate(ACTION_PRIORITY)}
+
+
+class Intent:
+    __slots__ = ("contains_master", "reply_to_master", "has_mod_keyword", "action", "duration")
+
+    def __init__(self, contains_master: bool, reply_to_master: bool, has_mod_keyword: bool,
+                 action: Optional[str], duration: Optional[timedelta]):
+        self.contains_master = contains_master
+        self.reply_to_master = reply_to_master
+        self.has_mod_keyword = has_mod_keyword
+        self.action = action
+        self.duration = duration
+
+    @property
+    def is_master_related(self) -> bool:
+        return self.contains_master or self.reply_to_master
+
+    @property
+    def is_moderation(self) -> bool:
+        """Master-related and mentions a moderation keyword (what moderation_handler acts on)."""
+        return self.is_master_related and self.has_mod_keyword
+
+    def __repr__(self):
+        return (f"Intent(master={self.is_master_related}, mod={self.has_mod_keyword}, "
+                f"action={self.action!r}, duration={self.duration})")
+
+
+_NOT_MASTER = Intent(False, False, False, None, None)
+
+
+def classify_text(text: str, reply_text: Optional[str] = None, full: bool = False) -> Intent:
+    """
+    Classify one message with a single keyword pass over its lowercased text.
+    Messages that are not master-related stop after the substring check (that is
+    most group traffic); pass full=True to classify keywords regardless.
+    """
+    lower = (text or "").lower()
+    contains_master = MASTER_WORD in lower
+    reply_to_master = bool(reply_text) and MASTER_WORD in reply_text.lower()
+    if not (contains_master or reply_to_master or full):
+        return _NOT_MASTER
+    has_mod = False
+    best = None
+    first_duration = None
+    for word, mod, amount, unit in _PATTERN.findall(lower):
+        if word:
+            if _ACT_IS_MOD[word]:
+                has_mod = True
+            rank = _RANK[_ACTION_OF[word]]
+            if best is None or rank < best:
+                best = rank
+        elif mod:
+            has_mod = True
+        elif amount and first_duration is None:
+            first_duration = (amount, unit)
+    action = ACTION_PRIORITY[best] if best is not None else None
+    duration = None
+    if action == "mute":
+        if first_duration is not None:
+            duration = _to_timedelta(int(first_duration[0]), first_duration[1])
+        duration = duration or DEFAULT_MUTE
+    return Intent(contains_master, reply_to_master, has_mod, action, duration)
+
+
+# id(message) -> (message, intent) for updates currently being handled. Holding the
+# message keeps its id from being reused; the bound covers every dispatcher worker.
+# (Setting an attribute on the Message instead would grow its ~60-key __dict__.)
+_RECENT: Dict[int, tuple] = {}
+_RECENT_MAX = 512
+_ring = [0] * _RECENT_MAX  # insertion order of _RECENT keys; oldest is overwritten
+_ring_pos = 0
+
+
+def classify_message(message) -> Intent:
+    """
+    Classify a Pyrogram message once; Pyrogram hands the same object to every
+    handler group, so later groups get the memoised Intent.
+    """
+    text = message.text or ""
+    reply = message.reply_to_message
+    reply_text = reply.text if reply is not None else None
+    # Common case (not addressed to master): two substring checks, cheaper to
+    # repeat than to memoise.
+    if MASTER_WORD not in text.lower() and not (reply_text and MASTER_WORD in reply_text.lower()):
+        return _NOT_MASTER
+    key = id(message)
+    hit = _RECENT.get(key)
+    if hit is not None and hit[0] is message:
+        return hit[1]
+    intent = classify_text(text, reply_text)
+    global _ring_pos
+    _RECENT.pop(_ring[_ring_pos], None)
+    _ring[_ring_pos] = key
+    _ring_pos = (_ring_pos + 1) % _RECENT_MAX
+    _RECENT[key] = (message, intent)
+    return intent
+
+
+def detect_action(text: str) -> Optional[str]:
+    """
+    Detect 'mute','unmute','ban','unban','kick' from text (Hindi/English tolerant).
+    """
+    return classify_text(text, full=True).action
@@ -2,22 +2,41 @@
 # Persona: Cute 18-year-old girl (gpt-5.1) + robust moderation
 # Paste into ~/MasterBot/main.py and run with your venv active.
 
+import time
+_LAUNCHED = time.perf_counter()  # cold-start reference for the "ready in" log line
+
+import asyncio
 import os
 import re
 import logging
 import random
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime
+from io import BytesIO
+from typing import List, Optional, Tuple
 
 from dotenv import load_dotenv
-from pyrogram import Client, filters
-from pyrogram.types import Message, ChatPermissions, User
-
-# Modern OpenAI client
-try:
-    from openai import OpenAI as OpenAIClient
-except Exception:
-    OpenAIClient = None
+from pyrogram import Client, filters, idle
+from pyrogram.enums import ChatMemberStatus, ChatType, MessageEntityType
+from pyrogram.types import Message, ChatPermissions, ChatMemberUpdated, User
+
+from ai.burst import BurstCoalescer
+from ai.cache import ResponseCache, normalize_prompt
+from ai.engine import AIEngine
+from ai.memory import ConversationMemory
+from ai.streaming import StreamingReplies
+from bot.admins import AdminCache, member_is_admin
+from bot.fanout import get_gban_executor
+from bot.members import MemberIndex
+from bot.plugins import get_plugin_loader, provide
+from bot.scheduler import get_scheduler
+from bot.sender import CHAT, NOTICE, get_outbox
+from classifier.service import get_classifier
+from db import get_store
+from db.snapshots import get_snapshots
+from filters.intent import DEFAULT_MUTE, classify_message, parse_duration
+from utils.diagnostics import diagnostics
+from utils.metrics import metrics
+from voice.pipeline import get_voice_pipeline
 
 # ----------------------------
 # Configuration & logging
@@ -29,6 +48,29 @@ API_HASH = os.getenv("API_HASH", "")
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 OWNER_ID = int(os.getenv("OWNER_ID", "0"))
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", None)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", None)  # e.g. a local stub, see ai/stub.py
+AI_MAX_WORKERS = int(os.getenv("AI_MAX_WORKERS", "8"))
+AI_PER_CHAT_LIMIT = int(os.getenv("AI_PER_CHAT_LIMIT", "1"))
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "20"))
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "2048"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", "600"))
+AI_CACHE_PER_CHAT = os.getenv("AI_CACHE_PER_CHAT", "0") == "1"
+AI_CONTEXT_TOKENS = int(os.getenv("AI_CONTEXT_TOKENS", "1200"))  # prompt budget incl. history
+AI_MEMORY_TURNS = int(os.getenv("AI_MEMORY_TURNS", "12"))  # ring buffer size per chat
+AI_MEMORY_MAX_TOKENS = int(os.getenv("AI_MEMORY_MAX_TOKENS", "1000000"))  # ceiling across all chats
+AI_BURST_QUIET = float(os.getenv("AI_BURST_QUIET", "1.5"))  # group burst closes after this much silence
+AI_BURST_WINDOW = float(os.getenv("AI_BURST_WINDOW", "4"))  # ... or this long after it opened; 0 disables
+AI_BURST_MAX = int(os.getenv("AI_BURST_MAX", "10"))  # ... or at this many messages
+AI_STREAM = os.getenv("AI_STREAM", "off")  # "dm", "all" or "off": show replies while they stream in
+AI_STREAM_INTERVAL = float(os.getenv("AI_STREAM_INTERVAL", "1.0"))  # seconds between edits of one reply
+AI_STREAM_MIN_CHARS = int(os.getenv("AI_STREAM_MIN_CHARS", "30"))  # new characters worth an edit
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "600"))
+USERNAME_TTL = float(os.getenv("USERNAME_TTL", "3600"))  # @usernames unseen this long are re-checked with Telegram
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # local Prometheus endpoint; 0 disables
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "86400"))  # older warm-state snapshots are not restored
+DIAG_TASK_AGES = os.getenv("DIAG_TASK_AGES", "0") == "1"  # stamp tasks at creation so /tasks shows true ages
+AI_SHED = os.getenv("AI_SHED", "fallback")  # AI work shed under load: "fallback" (local persona reply) or "drop"
+SHARD = os.getenv("MASTERBOT_SHARD", "")  # "<index>/<count>" in a sharded worker (python -m bot.shards)
 
 # List of additional bot-level admin user IDs (optional)
 BOT_ADMINS = set()  # e.g. {12345678, 98765432}
@@ -37,30 +79,48 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 log = logging.getLogger("masterbot")
 
 # ----------------------------
-# Initialize OpenAI modern client (v1+)
+# Async OpenAI engine (client is created lazily on the first call)
 # ----------------------------
-openai_client = None
-if OPENAI_API_KEY and OpenAIClient is not None:
-    try:
-        openai_client = OpenAIClient(api_key=OPENAI_API_KEY)
-        log.info("OpenAI client initialised successfully.")
-    except Exception as e:
-        openai_client = None
-        log.exception("Failed to initialize OpenAI client: %s", e)
-elif OPENAI_API_KEY and OpenAIClient is None:
-    log.warning("OPENAI_API_KEY present but OpenAI SDK not installed. pip install openai")
-else:
+ai_engine = AIEngine(
+    api_key=OPENAI_API_KEY,
+    model="gpt-5.1",
+    base_url=OPENAI_BASE_URL,
+    max_workers=AI_MAX_WORKERS,
+    per_chat_limit=AI_PER_CHAT_LIMIT,
+    timeout=AI_TIMEOUT,
+)
+if not OPENAI_API_KEY:
     log.info("No OPENAI_API_KEY found; using local persona fallbacks.")
 
+# Replies keyed on normalized text + persona/model settings
+reply_cache = ResponseCache(max_entries=AI_CACHE_SIZE, ttl=AI_CACHE_TTL, per_chat=AI_CACHE_PER_CHAT)
+
+# Recent turns per chat, bounded per chat and globally
+conversation_memory = ConversationMemory(turns_per_chat=AI_MEMORY_TURNS, max_total_tokens=AI_MEMORY_MAX_TOKENS)
+
 # ----------------------------
 # Pyrogram client init
 # ----------------------------
-app = Client(
-    "MasterBot",
-    api_id=API_ID,
-    api_hash=API_HASH,
-    bot_token=BOT_TOKEN
-)
+if SHARD:
+    # Updates come from the supervisor; API calls go out on this worker's own session
+    from bot.shards import ShardClient
+    _shard, _, _shards = SHARD.partition("/")
+    app = ShardClient(
+        f"MasterBot-shard{_shard}",
+        api_id=API_ID,
+        api_hash=API_HASH,
+        bot_token=BOT_TOKEN,
+        shard=int(_shard),
+        shards=int(_shards),
+    )
+else:
+    app = Client(
+        "MasterBot",
+        api_id=API_ID,
+        api_hash=API_HASH,
+        bot_token=BOT_TOKEN
+    )
+metrics.instrument_client(app)  # counts every Telegram API call by method
 
 # ----------------------------
 # Persona and local fallbacks
@@ -71,6 +131,13 @@ PERSONA_PROMPT = (
     "Avoid any content that is sexual, illegal, or harmful. Keep replies concise (1-4 sentences)."
 )
 
+# Added to the persona when one completion answers a burst of group messages
+BURST_PROMPT = (
+    "Several people in the group wrote to you at almost the same time; their messages follow, "
+    "one per line as 'Name: message'. Answer all of them in ONE short message, "
+    "addressing people by name when they asked different things."
+)
+
 PERSONA_FALLBACKS = [
     "Hey! I'm Master — your friendly AI girl. 😊 How can I help you?",
     "Hi! I'm here and listening — tell me what's on your mind!",
@@ -78,6 +145,47 @@ PERSONA_FALLBACKS = [
     "Hi there — I'm Master. What would you like to do?"
 ]
 
+# Moderation rights per (chat, user); one admin-list fetch per chat per TTL
+admin_cache = AdminCache(ttl=ADMIN_CACHE_TTL)
+
+# Every reply and moderation call goes out through one rate-limited scheduler (bot/sender.py)
+outbox = get_outbox()
+
+# Moderation, owner commands and AI replies run on prioritized lanes (bot/scheduler.py)
+scheduler = get_scheduler()
+
+# Streamed replies: a placeholder edited as the completion arrives (AI_STREAM)
+streaming_replies = StreamingReplies(outbox, interval=AI_STREAM_INTERVAL, min_chars=AI_STREAM_MIN_CHARS,
+                                     priority=CHAT)
+
+# Usernames / first names seen per chat, fed passively from updates (see track_members)
+member_index = MemberIndex(username_ttl=USERNAME_TTL)
+
+# Component stats exported as gauges on the metrics endpoint and in /stats
+metrics.register("ai_engine", ai_engine.stats)
+metrics.register("reply_cache", reply_cache.stats)
+metrics.register("conversation_memory", conversation_memory.stats)
+metrics.register("admin_cache", admin_cache.stats)
+metrics.register("member_index", member_index.stats)
+metrics.register("outbox", outbox.stats)
+metrics.register("scheduler", scheduler.stats)
+metrics.register("ai_stream", streaming_replies.stats)
+metrics.register("store", lambda: get_store().stats())
+metrics.register("gban", lambda: get_gban_executor().stats())
+metrics.register("voice", lambda: get_voice_pipeline().stats())
+metrics.register("classifier", lambda: get_classifier().stats())
+
+# Caches saved to SNAPSHOT_PATH periodically and at shutdown, restored at start (db/snapshots.py);
+# TTL'd entries (admin rights, cached replies) come back with what is left of their TTL
+snapshots = get_snapshots()
+snapshots.register("admin_cache", admin_cache, max_age=SNAPSHOT_MAX_AGE)
+snapshots.register("member_index", member_index, max_age=SNAPSHOT_MAX_AGE)
+snapshots.register("conversation_memory", conversation_memory, max_age=SNAPSHOT_MAX_AGE)
+snapshots.register("reply_cache", reply_cache, max_age=SNAPSHOT_MAX_AGE)
+snapshots.register("store", get_store(), max_age=SNAPSHOT_MAX_AGE)
+metrics.register("snapshots", snapshots.stats)
+metrics.register("diagnostics", diagnostics.stats)
+
 # ----------------------------
 # Utility helpers
 # ----------------------------
@@ -88,6 +196,7 @@ async def is_bot_admin_or_owner(client: Client, user_id: int) -> bool:
         return True
     return False
 
+@metrics.timed()
 async def can_moderate(client: Client, message: Message, user_id: int) -> bool:
     """
     Returns True if user_id may perform moderation:
@@ -95,48 +204,43 @@ async def can_moderate(client: Client, message: Message, user_id: int) -> bool:
     - bot admin (BOT_ADMINS)
     - chat creator
     - chat admin with restrictive rights
+    Chat rights come from admin_cache, so the common case makes no API call.
     """
     if await is_bot_admin_or_owner(client, user_id):
         return True
+    return await admin_cache.can_moderate(client, message.chat.id, user_id)
+
+# Action/duration words that can follow "master" but are never the target's name
+_NAME_STOPWORDS = {
+    "mute", "unmute", "ban", "unban", "kick", "chup", "silent", "silence", "restrict", "allow",
+    "nikal", "do", "karo", "remove", "from", "group", "unblock", "wapis", "kholo", "bolne",
+    "undo", "out", "bahar", "nakaal", "for", "min", "mins", "minute", "minutes",
+    "hour", "hours", "day", "days",
+}
+
+async def _get_user_cached(client: Client, username: str) -> Optional[User]:
+    """@username -> User via member_index, falling back to client.get_users (then indexed)."""
+    ref = member_index.by_username(username)
+    if ref:
+        return ref.to_user(client)
     try:
-        member = await client.get_chat_member(message.chat.id, user_id)
+        user = await client.get_users(f"@{username.lstrip('@')}")
     except Exception:
-        return False
-
-    if member.status == "creator":
-        return True
-    if member.status == "administrator":
-        if getattr(member, "can_restrict_members", False) or getattr(member, "can_promote_members", False):
-            return True
-    return False
-
-def parse_duration(text: str) -> Optional[timedelta]:
-    """
-    Parses the first duration expression in text.
-    Supports: min(s), minute(s), hour(s), day(s)
-    Returns timedelta or None.
-    """
-    m = re.search(r"(\d+)\s*(min(?:ute)?s?|hour(?:s?)|day(?:s?))", text, flags=re.IGNORECASE)
-    if not m:
         return None
-    amt = int(m.group(1))
-    unit = m.group(2).lower()
-    if "min" in unit:
-        return timedelta(minutes=amt)
-    if "hour" in unit:
-        return timedelta(hours=amt)
-    if "day" in unit:
-        return timedelta(days=amt)
-    return None
+    if user:
+        member_index.add(None, user)
+    return user
 
+@metrics.timed()
 async def resolve_user(client: Client, message: Message) -> Optional[User]:
     """
     Resolve a target user in priority:
     1) reply_to_message.from_user
     2) text_mention entities (entity.user)
-    3) mention entity (@username) -> client.get_users
-    4) raw @username in text -> client.get_users
-    5) best-effort first-name/username match among recent chat members (limited)
+    3) mention entity (@username) -> member_index, else client.get_users
+    4) raw @username in text -> member_index, else client.get_users
+    5) first-name/username match in member_index for the words after 'master',
+       else one server-side member search (works in groups of any size)
     """
     # 1) reply
     if message.reply_to_message and message.reply_to_message.from_user:
@@ -145,126 +249,55 @@ async def resolve_user(client: Client, message: Message) -> Optional[User]:
     # 2) text_mention entity (contains user)
     if message.entities:
         for ent in message.entities:
-            if ent.type == "text_mention" and ent.user:
+            if ent.type == MessageEntityType.TEXT_MENTION and ent.user:
                 return ent.user
 
     # 3) entity mention -> resolve
     if message.entities:
         for ent in message.entities:
-            if ent.type == "mention":
-                try:
-                    start = ent.offset
-                    length = ent.length
-                    mention_text = message.text[start:start+length]  # like @username
-                    user = await client.get_users(mention_text)
-                    if user:
-                        return user
-                except Exception:
-                    continue
+            if ent.type == MessageEntityType.MENTION:
+                mention_text = message.text[ent.offset:ent.offset + ent.length]  # like @username
+                user = await _get_user_cached(client, mention_text)
+                if user:
+                    return user
 
     # 4) raw @username regex fallback
     m = re.search(r"@([A-Za-z0-9_]{5,})", message.text or "")
     if m:
-        uname = m.group(1)
+        user = await _get_user_cached(client, m.group(1))
+        if user:
+            return user
+
+    # 5) name lookup among members seen in this chat
+    m2 = re.search(r"master(?:\s+|:)\s*([A-Za-z0-9_ ]{2,40})", message.text or "", flags=re.IGNORECASE)
+    words = m2.group(1).split() if m2 else (message.text or "").strip().split()[:1]
+    words = [w for w in words if not w.isdigit() and w.lower() not in _NAME_STOPWORDS]
+    for word in words:
+        ref = member_index.lookup(message.chat.id, word)
+        if ref:
+            return ref.to_user(client)
+
+    # Not seen yet: ask Telegram to search members by name (one request, not a scan)
+    candidate = words[0] if words else None
+    if candidate:
         try:
-            user = await client.get_users(f"@{uname}")
-            if user:
-                return user
-        except Exception:
-            pass
-
-    # 5) best-effort name lookup (limited)
-    # Try: find exact first-name or username among recent members (not guaranteed)
-    try:
-        candidate = None
-        m2 = re.search(r"master(?:\s+|:)\s*([A-Za-z0-9_ ]{2,40})", message.text or "", flags=re.IGNORECASE)
-        if m2:
-            candidate = m2.group(1).strip().split()[0]
-        if not candidate:
-            # fallback to first token
-            candidate = (message.text or "").strip().split()[0]
-        if candidate:
-            candidate = candidate.strip()
-            async for member in client.get_chat_members(message.chat.id, limit=200):
+            async for member in client.get_chat_members(message.chat.id, query=candidate, limit=10):
                 u = member.user
                 if not u:
                     continue
+                member_index.add(message.chat.id, u)
                 if (u.username and u.username.lower() == candidate.lower()) or (u.first_name and u.first_name.lower() == candidate.lower()):
                     return u
-    except Exception:
-        pass
-
-    return None
+        except Exception:
+            pass
 
-def detect_action(text: str) -> Optional[str]:
-    """
-    Detect 'mute','unmute','ban','unban','kick' from text (Hindi/English tolerant).
-    """
-    t = text.lower()
-    if re.search(r"\b(mute|chup|silent|silence|restrict|restricted)\b", t):
-        return "mute"
-    if re.search(r"\b(unmute|allow|undo mute|remove mute|kholo|bolne do)\b", t):
-        return "unmute"
-    if re.search(r"\b(ban|nikal|remove from group|ban karo|nikal do)\b", t):
-        return "ban"
-    if re.search(r"\b(unban|wapis|unblock|remove ban|unban karo)\b", t):
-        return "unban"
-    if re.search(r"\b(kick|kick out|bahar|nakaal)\b", t):
-        return "kick"
     return None
 
 # ----------------------------
 # OpenAI conversation / persona function using modern v1 API
 # ----------------------------
-async def ai_generate_reply(user_text: str) -> str:
-    """
-    Generate persona reply. If openai key/client exists, call modern API:
-    client.chat.completions.create(model="gpt-5.1", messages=[...])
-    Otherwise fall back to local persona messages.
-    """
-    # Use OpenAI if available
-    if openai_client:
-        try:
-            # Use recommended chat completions interface for v1 client
-            resp = openai_client.chat.completions.create(
-                model="gpt-5.1",
-                messages=[
-                    {"role": "system", "content": PERSONA_PROMPT},
-                    {"role": "user", "content": user_text}
-                ],
-                temperature=0.85,
-                max_tokens=300,
-            )
-            # resp.choices[0].message.content or similar structure
-            if resp and getattr(resp, "choices", None):
-                choice = resp.choices[0]
-                # Different SDK builds expose shape differently; attempt robust extraction
-                content = None
-                # Attempt attribute access first
-                try:
-                    msg = getattr(choice, "message", None)
-                    if isinstance(msg, dict):
-                        content = msg.get("content")
-                    elif msg and hasattr(msg, "get"):
-                        content = msg.get("content")
-                except Exception:
-                    content = None
-                # Fallback to dict-style
-                if not content:
-                    try:
-                        content = choice["message"]["content"]
-                    except Exception:
-                        try:
-                            # Some SDKs return choice.text
-                            content = getattr(choice, "text", None)
-                        except Exception:
-                            content = None
-                if content:
-                    return content.strip()
-        except Exception as e:
-            log.exception("OpenAI call failed: %s", e)
-            # fall through to local fallback
-
+def local_fallback_reply(user_text: str) -> str:
+    """Local persona reply used when the AI engine is unavailable."""
     # Local fallback heuristics
     lower = (user_text or "").lower()
     if any(kw in lower for kw in ["how are you", "kya haal", "how r u", "kya haal hai"]):
@@ -276,13 +309,128 @@ async def ai_generate_reply(user_text: str) -> str:
     # default fallback
     return random.choice(PERSONA_FALLBACKS)
 
+@metrics.timed()
+async def ai_generate_reply(user_text: str, chat_id: Optional[int] = None, speaker: Optional[str] = None) -> str:
+    """
+    Generate persona reply through the async AI engine (gpt-5.1).
+    - short, generic prompts ("hi master") come from reply_cache (one upstream call per burst)
+    - everything else is sent with the chat's recent turns, trimmed to AI_CONTEXT_TOKENS
+    The engine never blocks the event loop; if it is disabled, saturated,
+    times out or fails, fall back to local persona messages.
+    """
+    if reply_cache.cacheable(user_text):
+        key = reply_cache.make_key(
+            user_text, PERSONA_PROMPT, ai_engine.model, ai_engine.temperature, ai_engine.max_tokens,
+            chat_id=chat_id,
+        )
+        content = await reply_cache.get_or_compute(key, lambda: ai_engine.complete(
+            [
+                {"role": "system", "content": PERSONA_PROMPT},
+                {"role": "user", "content": user_text}
+            ],
+            chat_id=chat_id,
+        ))
+    else:
+        messages = conversation_memory.build_context(
+            chat_id, PERSONA_PROMPT, user_text, token_budget=AI_CONTEXT_TOKENS, speaker=speaker
+        )
+        content = await ai_engine.complete(messages, chat_id=chat_id)
+
+    if chat_id is not None:
+        conversation_memory.add(chat_id, "user", user_text, speaker=speaker)
+        if content:
+            conversation_memory.add(chat_id, "assistant", content)
+    return content or local_fallback_reply(user_text)
+
+@metrics.timed()
+async def ai_generate_burst_reply(chat_id: int, turns: List[Tuple[Optional[str], str]]) -> str:
+    """
+    One completion for a burst of group messages (see ai/burst.py):
+    the chat's recent turns plus every (speaker, text) of the burst.
+    """
+    burst_text = "\n".join(f"{speaker}: {text}" if speaker else text for speaker, text in turns)
+    messages = conversation_memory.build_context(
+        chat_id, PERSONA_PROMPT + " " + BURST_PROMPT, burst_text, token_budget=AI_CONTEXT_TOKENS
+    )
+    content = await ai_engine.complete(messages, chat_id=chat_id)
+    for speaker, text in turns:
+        conversation_memory.add(chat_id, "user", text, speaker=speaker)
+    if content:
+        conversation_memory.add(chat_id, "assistant", content)
+    return content or local_fallback_reply(turns[-1][1])
+
+async def answer_burst(chat_id: int, burst: List[Message]):
+    """One reply per group burst, threaded to its latest message."""
+    last = burst[-1]
+    try:
+        turns = [(m.from_user.first_name if m.from_user else None, (m.text or "").strip()) for m in burst]
+        if len({normalize_prompt(text) for _, text in turns}) == 1:
+            # One message, or everyone said the same ("hi master" x5): the cached single-reply path
+            reply = await ai_generate_reply(turns[-1][1], chat_id=chat_id, speaker=turns[-1][0])
+        else:
+            reply = await ai_generate_burst_reply(chat_id, turns)
+        await outbox.reply(last, reply, priority=CHAT, wait=False)
+    except Exception as err:
+        log.exception("Error answering a burst in %s: %s", chat_id, err)
+        await outbox.reply(last, "Sorry, I couldn't reply right now.", priority=CHAT, wait=False)
+
+def should_stream(message: Message, text: str) -> bool:
+    if AI_STREAM not in ("dm", "all") or not ai_engine.enabled:
+        return False
+    if AI_STREAM == "dm" and message.chat.type != ChatType.PRIVATE:
+        return False  # every edit counts against the group's message limit
+    # Short generic prompts come out of reply_cache at once: nothing to wait for
+    return not reply_cache.cacheable(text)
+
+@metrics.timed()
+async def ai_stream_reply(message: Message, text: str, speaker: Optional[str] = None):
+    """ai_generate_reply + reply, shown progressively while the completion streams in."""
+    chat_id = message.chat.id
+    messages = conversation_memory.build_context(
+        chat_id, PERSONA_PROMPT, text, token_budget=AI_CONTEXT_TOKENS, speaker=speaker
+    )
+    content = await streaming_replies.reply(
+        message, ai_engine.stream(messages, chat_id=chat_id), lambda: local_fallback_reply(text)
+    )
+    conversation_memory.add(chat_id, "user", text, speaker=speaker)
+    if content:  # "" for a fallback or an interrupted stream: not the model's answer
+        conversation_memory.add(chat_id, "assistant", content)
+
+async def ai_reply(message: Message, text: str, speaker: Optional[str] = None):
+    """One AI reply to one message (runs on a scheduler lane)."""
+    try:
+        if should_stream(message, text):
+            await ai_stream_reply(message, text, speaker)
+            return
+        reply = await ai_generate_reply(text, chat_id=message.chat.id, speaker=speaker)
+        await outbox.reply(message, reply, priority=CHAT, wait=False)
+    except Exception as err:
+        log.exception("Error in AI handler: %s", err)
+        await outbox.reply(message, "Sorry, I couldn't reply right now.", priority=CHAT, wait=False)
+
+def shed_reply(message: Message, text: str):
+    """AI work shed under load: a local persona reply (one per chat per outbox window) or nothing."""
+    if AI_SHED == "fallback":
+        asyncio.get_running_loop().create_task(
+            outbox.reply(message, local_fallback_reply(text), priority=CHAT, key="ai_shed", wait=False))
+
+async def schedule_burst(chat_id: int, burst: List[Message]):
+    last = burst[-1]
+    await scheduler.dispatch("group_ai", lambda: answer_burst(chat_id, burst),
+                             on_shed=lambda: shed_reply(last, last.text or ""))
+
+# Group messages to master are answered per burst; DMs stay immediate
+ai_bursts = BurstCoalescer(schedule_burst, quiet=AI_BURST_QUIET, window=AI_BURST_WINDOW, max_messages=AI_BURST_MAX)
+metrics.register("ai_bursts", ai_bursts.stats)
+
 # ----------------------------
 # Commands: /start, /ping
 # ----------------------------
 @app.on_message(filters.command("start"))
 async def cmd_start(_, message: Message):
     first = message.from_user.first_name or "there"
-    await message.reply_text(
+    await outbox.reply(
+        message,
         f"Hi {first}, I'm Master — a cute AI girl. 💕\n\n"
         "• In private chat I can chat with you freely.\n"
         "• In groups I only respond when someone mentions 'master' or replies to a 'master' message.\n"
@@ -291,12 +439,113 @@ async def cmd_start(_, message: Message):
 
 @app.on_message(filters.command("ping") & filters.user(OWNER_ID))
 async def cmd_ping(_, message: Message):
-    await message.reply_text("Pong! Bot owner verified.")
+    await scheduler.dispatch("owner", lambda: outbox.reply(message, "Pong! Bot owner verified."))
+
+@app.on_message(filters.command("stats") & filters.user(OWNER_ID))
+async def cmd_stats(_, message: Message):
+    await scheduler.dispatch("owner", lambda: outbox.reply(message, metrics.summary()))
+
+# ----------------------------
+# Owner diagnostics: /profile, /tasks, /slow (utils/diagnostics.py; nothing runs until asked)
+# ----------------------------
+def command_number(message: Message, index: int, default: float, low: float, high: float) -> Optional[float]:
+    """Numeric command argument clamped to [low, high]; None if it is not a number."""
+    if len(message.command) <= index:
+        return default
+    try:
+        return min(max(float(message.command[index]), low), high)
+    except ValueError:
+        return None
+
+async def reply_report(message: Message, text: str, name: str, caption: str, as_file: bool = False):
+    """The report as a message, or as a text file when asked to or too long for one."""
+    if len(text) <= 3500 and not as_file:
+        await outbox.reply(message, text)
+        return
+
+    def document() -> BytesIO:
+        doc = BytesIO(text.encode())  # fresh per attempt: a FloodWait retry re-reads it from the start
+        doc.name = name
+        return doc
+
+    await outbox.submit(message.chat.id, lambda: message.reply_document(document(), caption=caption),
+                        priority=NOTICE)
+
+async def run_profile(message: Message, seconds: float):
+    await outbox.reply(message, f"Profiling the event loop for {seconds:g}s…")
+    try:
+        report = await diagnostics.profile(seconds)
+    except RuntimeError as e:
+        await outbox.reply(message, f"Not started: {e}.")
+        return
+    busy = report.splitlines()[2]
+    await reply_report(message, report, f"profile-{int(time.time())}.txt", f"{seconds:g}s profile. {busy}.",
+                       as_file=True)
+
+async def run_slow_watch(message: Message, seconds: float, threshold_ms: float):
+    await outbox.reply(message, f"Timing loop callbacks for {seconds:g}s (reporting those over {threshold_ms:g} ms)…")
+    try:
+        report = await diagnostics.watch_slow(seconds, threshold_ms / 1000)
+    except RuntimeError as e:
+        await outbox.reply(message, f"Not started: {e}.")
+        return
+    await reply_report(message, report, f"slow-{int(time.time())}.txt", "Slow callbacks")
+
+@app.on_message(filters.command("profile") & filters.user(OWNER_ID))
+async def cmd_profile(_, message: Message):
+    seconds = command_number(message, 1, 10, 1, 120)
+    if seconds is None:
+        await outbox.reply(message, "Usage: /profile [seconds]")
+        return
+    await scheduler.dispatch("owner", lambda: run_profile(message, seconds))
+
+@app.on_message(filters.command("tasks") & filters.user(OWNER_ID))
+async def cmd_tasks(_, message: Message):
+    await scheduler.dispatch(
+        "owner", lambda: reply_report(message, diagnostics.tasks(), f"tasks-{int(time.time())}.txt", "Pending tasks"))
+
+@app.on_message(filters.command("slow") & filters.user(OWNER_ID))
+async def cmd_slow(_, message: Message):
+    seconds = command_number(message, 1, 30, 1, 600)
+    threshold_ms = command_number(message, 2, 100, 1, 10000)
+    if seconds is None or threshold_ms is None:
+        await outbox.reply(message, "Usage: /slow [seconds] [threshold ms]")
+        return
+    await scheduler.dispatch("owner", lambda: run_slow_watch(message, seconds, threshold_ms))
+
+# ----------------------------
+# Passive tracking (group=-1 runs before everything else and never replies)
+# ----------------------------
+@app.on_message(filters.group, group=-1)
+async def track_members(_, message: Message):
+    member_index.observe_message(message)
+    get_store().note_chat(message.chat.id)  # groups the gban fan-out will cover
+
+@app.on_chat_member_updated()
+async def track_admin_changes(_, update: ChatMemberUpdated):
+    # Keep admin_cache and member_index in sync without waiting for TTLs
+    admin_cache.on_member_updated(update)
+    member_index.observe_member_update(update)
+    # The bot's own status: where it can enforce global bans
+    new = update.new_chat_member
+    if new and new.user and new.user.is_self:
+        if new.status in (ChatMemberStatus.LEFT, ChatMemberStatus.BANNED):
+            get_store().forget_chat(update.chat.id)
+        else:
+            get_store().note_chat(update.chat.id, bot_admin=member_is_admin(new))
 
 # ----------------------------
 # Moderation handler (priority group=1)
+# The keyword gate runs in the dispatcher; enforcement runs on the moderation
+# lane, which AI work can neither delay nor crowd out
 # ----------------------------
 @app.on_message(filters.text & filters.group, group=1)
+async def moderation_gate(client: Client, message: Message):
+    intent = classify_message(message)
+    if intent.is_master_related and intent.has_mod_keyword:
+        await scheduler.dispatch("moderation", lambda: moderation_handler(client, message))
+
+@metrics.timed(per_chat=True)
 async def moderation_handler(client: Client, message: Message):
     """
     This handler only runs for group messages and has priority.
@@ -307,48 +556,46 @@ async def moderation_handler(client: Client, message: Message):
         text = (message.text or "").strip()
         if not text:
             return
-        lower = text.lower()
+        # One keyword pass per update, shared with ai_handler (filters/intent.py)
+        intent = classify_message(message)
 
         # Must be master-related: message contains 'master' OR reply-to contains 'master'
-        contains_master = "master" in lower
-        is_reply_to_master = False
-        if message.reply_to_message and message.reply_to_message.text:
-            is_reply_to_master = "master" in (message.reply_to_message.text.lower() or "")
-
-        if not (contains_master or is_reply_to_master):
+        if not intent.is_master_related:
             return  # not a master-related message
 
         # If message doesn't contain moderation keywords, ignore in moderation handler
-        if not re.search(r"(mute|unmute|ban|unban|kick|nikal|chup|remove|allow|unblock)", lower):
+        if not intent.has_mod_keyword:
             return
 
         # Permission check
         sender_id = message.from_user.id
         if not await can_moderate(client, message, sender_id):
-            await message.reply_text("You are not allowed to perform moderation actions.")
+            # Repeated attempts by the same user pile up fast; send the notice once per window
+            await outbox.reply(message, "You are not allowed to perform moderation actions.", key="not_allowed")
             return
 
         # Resolve target user
         target = await resolve_user(client, message)
         if not target or not getattr(target, "id", None):
-            await message.reply_text("Cannot detect the target user. Reply to the user or mention them with @username.")
+            await outbox.reply(message, "Cannot detect the target user. Reply to the user or mention them with @username.")
             return
 
-        # Detect action
-        action = detect_action(lower)
+        # Detected action (and mute duration, 10 minutes unless given)
+        action = intent.action
+        duration_td = intent.duration
+        if not action and get_classifier().enabled:
+            # Phrasings the keyword tables miss: ask the local intent model
+            action = get_classifier().action(await get_classifier().classify(text))
+            duration_td = parse_duration(text) or DEFAULT_MUTE
         if not action:
-            await message.reply_text("No recognized moderation action found (mute/unmute/ban/unban/kick).")
+            await outbox.reply(message, "No recognized moderation action found (mute/unmute/ban/unban/kick).")
             return
 
-        # Parse duration if mute
-        duration_td = None
-        if action == "mute":
-            duration_td = parse_duration(lower) or timedelta(minutes=10)
-
         # Execute actions
         if action == "mute":
             until_time = datetime.utcnow() + duration_td
-            await message.chat.restrict_member(
+            await outbox.call(
+                message.chat.id, message.chat.restrict_member,
                 target.id,
                 permissions=ChatPermissions(
                     can_send_messages=False,
@@ -358,17 +605,18 @@ async def moderation_handler(client: Client, message: Message):
                 ),
                 until_date=until_time
             )
-            await message.reply_text(f"{target.first_name or target.username} muted for {duration_td}.")
+            await outbox.reply(message, f"{target.first_name or target.username} muted for {duration_td}.")
             return
 
         if action == "unmute":
             # Hardening: ensure target exists and has id
             if not target or not getattr(target, "id", None):
-                await message.reply_text("Unmute failed: target not resolvable.")
+                await outbox.reply(message, "Unmute failed: target not resolvable.")
                 return
             try:
                 # Attempt to restore send permissions (safe operation).
-                await message.chat.restrict_member(
+                await outbox.call(
+                    message.chat.id, message.chat.restrict_member,
                     target.id,
                     permissions=ChatPermissions(
                         can_send_messages=True,
@@ -378,88 +626,140 @@ async def moderation_handler(client: Client, message: Message):
                     ),
                     until_date=None
                 )
-                await message.reply_text(f"{target.first_name or target.username} has been unmuted.")
+                await outbox.reply(message, f"{target.first_name or target.username} has been unmuted.")
             except Exception as e:
                 log.exception("Unmute error: %s", e)
-                await message.reply_text(f"Unmute failed: {e}")
+                await outbox.reply(message, f"Unmute failed: {e}")
             return
 
         if action == "ban":
             try:
-                await message.chat.ban_member(target.id)
-                await message.reply_text(f"{target.first_name or target.username} has been banned.")
+                await outbox.call(message.chat.id, message.chat.ban_member, target.id)
+                await outbox.reply(message, f"{target.first_name or target.username} has been banned.")
             except Exception as e:
                 log.exception("Ban error: %s", e)
-                await message.reply_text(f"Ban failed: {e}")
+                await outbox.reply(message, f"Ban failed: {e}")
             return
 
         if action == "unban":
             try:
-                await message.chat.unban_member(target.id)
-                await message.reply_text(f"{target.first_name or target.username} has been unbanned.")
+                await outbox.call(message.chat.id, message.chat.unban_member, target.id)
+                await outbox.reply(message, f"{target.first_name or target.username} has been unbanned.")
             except Exception:
-                await message.reply_text(f"{target.first_name or target.username} was not banned or unban failed.")
+                await outbox.reply(message, f"{target.first_name or target.username} was not banned or unban failed.")
             return
 
         if action == "kick":
             try:
-                await message.chat.ban_member(target.id)
-                await message.chat.unban_member(target.id)
-                await message.reply_text(f"{target.first_name or target.username} has been kicked.")
+                await outbox.call(message.chat.id, message.chat.ban_member, target.id)
+                await outbox.call(message.chat.id, message.chat.unban_member, target.id)
+                await outbox.reply(message, f"{target.first_name or target.username} has been kicked.")
             except Exception as e:
                 log.exception("Kick error: %s", e)
-                await message.reply_text(f"Kick failed: {e}")
+                await outbox.reply(message, f"Kick failed: {e}")
             return
 
     except Exception as err:
         log.exception("Error in moderation_handler: %s", err)
         try:
-            await message.reply_text("An error occurred while processing moderation.")
+            await outbox.reply(message, "An error occurred while processing moderation.")
         except Exception:
             pass
 
 # ----------------------------
 # AI handler (priority group=2)
 # DM: reply to all messages
-# Group: only when 'master' is in message OR reply-to contains 'master'
+# Group: only when 'master' is in message OR reply-to contains 'master',
+#        one reply per burst (ai_bursts)
 # ----------------------------
 @app.on_message(filters.text & (filters.private | filters.group), group=2)
+@metrics.timed(per_chat=True)
 async def ai_handler(client: Client, message: Message):
     try:
         text = (message.text or "").strip()
         if not text:
             return
 
-        # Private chat: respond to all messages
-        if message.chat.type == "private":
-            reply = await ai_generate_reply(text)
-            await message.reply_text(reply)
+        # Private chat: respond to all messages (lowest lane: shed first under load)
+        if message.chat.type == ChatType.PRIVATE:
+            await scheduler.dispatch("dm_ai", lambda: ai_reply(message, text),
+                                     on_shed=lambda: shed_reply(message, text))
             return
 
         # Group chat: only respond when 'master' or reply-to contains 'master'
-        lower = text.lower()
-        contains_master = "master" in lower
-        reply_to_master = False
-        if message.reply_to_message and message.reply_to_message.text:
-            reply_to_master = "master" in (message.reply_to_message.text.lower() or "")
+        # (classified once per update; moderation_handler already did the work)
+        if not classify_message(message).is_master_related:
+            return
 
-        if not (contains_master or reply_to_master):
+        if ai_bursts.enabled:
+            ai_bursts.add(message.chat.id, message)  # answered with the rest of its burst
             return
 
-        reply = await ai_generate_reply(text)
-        await message.reply_text(reply)
+        speaker = message.from_user.first_name if message.from_user else None
+        await scheduler.dispatch("group_ai", lambda: ai_reply(message, text, speaker),
+                                 on_shed=lambda: shed_reply(message, text))
         return
 
     except Exception as err:
         log.exception("Error in AI handler: %s", err)
         try:
-            await message.reply_text("Sorry, I couldn't reply right now.")
+            await outbox.reply(message, "Sorry, I couldn't reply right now.", priority=CHAT)
         except Exception:
             pass
 
+# ----------------------------
+# Plugins: modules/, ai/, filters/, voice/, classifier/ manifests (imported on first matching update)
+# ----------------------------
+plugins = get_plugin_loader()
+provide("ai_generate_reply", ai_generate_reply)  # voice notes reuse the text reply path
+provide("can_moderate", can_moderate)  # antiflood exempts moderators
+plugins.load(app)
+metrics.register("plugins", plugins.stats)
+
 # ----------------------------
 # Application start
 # ----------------------------
+async def main():
+    if DIAG_TASK_AGES:
+        diagnostics.track_tasks(asyncio.get_running_loop())
+    # Read in a thread while the client connects; components skip what they learn meanwhile
+    restore_task = asyncio.get_running_loop().create_task(snapshots.restore())
+    await app.start()
+    await restore_task  # usually done by now; the gban resume below needs the restored store
+    await get_store().start()  # loads in the background: no handler waits for the database
+    log.info("Ready in %.2fs.", time.perf_counter() - _LAUNCHED)
+    await metrics.start(port=METRICS_PORT)
+    # Heavy SDKs (openai, ...) load in a thread now instead of stalling the first request
+    warm_task = asyncio.get_running_loop().create_task(plugins.warm_up())
+    # Local classifier: spawn its worker and load the model before messages need it
+    classifier_task = asyncio.get_running_loop().create_task(get_classifier().warm_up())
+    if SHARD:
+        await app.attach()  # routed updates in, shared state (global bans, chats) both ways
+    if not SHARD or app.shard == 0:
+        # Finish fan-outs whose process stopped: jobs carry a heartbeat lease, so one another shard is
+        # still running is left alone, and a crashed shard's job is taken over once its lease runs out
+        await get_gban_executor().resume(app)
+        get_gban_executor().watch(app)
+    snapshots.start()
+    try:
+        await idle()
+    finally:
+        warm_task.cancel()
+        classifier_task.cancel()
+        await ai_bursts.close()  # answer bursts still collecting
+        await scheduler.close()  # lets queued replies and moderation finish (bounded)
+        await snapshots.close()  # last snapshot, so the next start is warm
+        if SHARD:
+            await app.detach()
+        await get_gban_executor().close()
+        await get_voice_pipeline().close()  # stops the decode/transcribe worker processes
+        await get_classifier().close()
+        await outbox.close()
+        await metrics.close()
+        await app.stop()
+        await ai_engine.close()
+        await get_store().close()  # flushes buffered punishment writes
+
 if __name__ == "__main__":
     log.info("Starting Master Bot...")
-    app.run()
+    app.run(main())
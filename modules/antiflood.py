@@ -0,0 +1,116 @@
+# modules/antiflood.py - automatic flood protection (registered by modules/manifest.py)
+# Every group message is counted by filters/flood.py; a user who goes over the
+# chat's limits gets the same escalating mute as /mute (5, 15, then 30 minutes).
+# Chat moderators are never muted. /setflood changes a chat's limits.
+
+import asyncio
+import os
+import time
+from typing import Optional
+
+from pyrogram.types import Message
+
+from bot.plugins import service
+from bot.sender import get_outbox
+from db import get_store
+from filters.flood import FloodDetector
+from utils.metrics import metrics
+
+from .moderation import escalate_mute
+
+_detector: Optional[FloodDetector] = None
+_synced = False  # chat limits loaded from the store
+_resync: Optional[asyncio.Task] = None
+
+
+def get_detector() -> FloodDetector:
+    global _detector
+    if _detector is None:
+        _detector = FloodDetector(
+            burst_window=float(os.getenv("FLOOD_BURST_WINDOW", "5")),
+            burst_limit=int(os.getenv("FLOOD_BURST_LIMIT", "8")),
+            sustained_window=float(os.getenv("FLOOD_SUSTAINED_WINDOW", "60")),
+            sustained_limit=int(os.getenv("FLOOD_SUSTAINED_LIMIT", "30")),
+            active_keys=int(os.getenv("FLOOD_ACTIVE_USERS", "2048")),  # sizes the sketches, see filters/flood.py
+        )
+        metrics.register("flood", _detector.stats)
+    return _detector
+
+
+def _apply(detector: FloodDetector, chat_id: int, settings: dict):
+    flood = settings.get("flood")
+    if flood:
+        detector.set_limits(chat_id, flood.get("burst"), flood.get("sustained"), flood.get("enabled"))
+
+
+async def _sync(detector: FloodDetector):
+    global _synced, _resync
+    store = get_store()
+    await store.start()
+    for chat_id, settings in store.settings.items():
+        _apply(detector, chat_id, settings)
+    _synced = True
+    if not store.loaded and _resync is None:
+        # Limits from the snapshot (if any) for now, the database's once it has been read
+        _resync = asyncio.get_running_loop().create_task(_sync_when_loaded(detector))
+
+
+async def _sync_when_loaded(detector: FloodDetector):
+    store = get_store()
+    await store.wait_loaded()
+    for chat_id, settings in store.settings.items():
+        _apply(detector, chat_id, settings)
+
+
+async def flood_guard(client, message: Message):
+    user = message.from_user
+    if not user or user.is_bot:
+        return
+    detector = get_detector()
+    if not _synced:
+        await _sync(detector)
+    reason = detector.hit(message.chat.id, user.id, time.monotonic())
+    if reason is None:
+        return
+    if await service("can_moderate")(client, message, user.id):
+        return
+    await escalate_mute(client, message, user, reason="for flooding the chat")
+
+
+async def set_flood(client, message: Message):
+    """/setflood <burst> [per_minute] | on | off  (no arguments: show the limits)"""
+    outbox = get_outbox()
+    detector = get_detector()
+    if not _synced:
+        await _sync(detector)
+    chat_id = message.chat.id
+    args = (message.command or [])[1:]
+    if args:
+        if not message.from_user or not await service("can_moderate")(client, message, message.from_user.id):
+            await outbox.reply(message, "You are not allowed to change flood limits.", key="not_allowed")
+            return
+        if args[0].lower() in ("on", "off"):
+            limits = detector.set_limits(chat_id, enabled=args[0].lower() == "on")
+        else:
+            try:
+                burst = int(args[0])
+                sustained = int(args[1]) if len(args) > 1 else None
+            except ValueError:
+                await outbox.reply(message, "Usage: /setflood <messages per burst> [messages per minute] | on | off")
+                return
+            if burst < 2 or (sustained is not None and sustained < burst):
+                await outbox.reply(message, "Limits must be at least 2, and the per-minute limit at least the burst.")
+                return
+            limits = detector.set_limits(chat_id, burst, sustained, True)
+        await get_store().set_chat_settings(
+            chat_id, flood={"burst": limits.burst, "sustained": limits.sustained, "enabled": limits.enabled}
+        )
+    limits = detector.limits(chat_id)
+    if not limits.enabled:
+        await outbox.reply(message, "Flood protection is off in this chat.")
+        return
+    await outbox.reply(
+        message,
+        f"Flood protection: more than {limits.burst} messages in {detector.burst_window:g}s "
+        f"or {limits.sustained} in {detector.sustained_window:g}s gets an escalating mute.",
+    )
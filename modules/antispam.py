@@ -0,0 +1,106 @@
+# modules/antispam.py - cross-chat spam waves (registered by modules/manifest.py)
+# Every group message with text is fingerprinted by filters/dupes.py into one
+# index shared by all chats. Once a near-duplicate of it has been posted in
+# several chats (or many times across at least two), further copies are
+# deleted, or only flagged in chats that chose so; each chat gets one notice
+# per wave. Chat moderators are never touched. /setspam changes the chat's
+# action.
+
+import os
+import time
+from typing import Optional
+
+from pyrogram.types import Message
+
+from bot.plugins import service
+from bot.sender import NOTICE, get_outbox
+from db import get_store
+from filters.dupes import DuplicateIndex
+from utils.metrics import metrics
+
+ACTIONS = ("delete", "flag", "off")
+
+_index: Optional[DuplicateIndex] = None
+_default_action = "delete"
+
+
+def get_index() -> DuplicateIndex:
+    global _index, _default_action
+    if _index is None:
+        _index = DuplicateIndex(
+            window=float(os.getenv("SPAM_WINDOW", "600")),
+            threshold=float(os.getenv("SPAM_SIMILARITY", "0.7")),
+            min_chats=int(os.getenv("SPAM_MIN_CHATS", "3")),
+            min_count=int(os.getenv("SPAM_MIN_COUNT", "5")),
+            max_clusters=int(os.getenv("SPAM_MAX_CLUSTERS", "20000")),
+        )
+        action = os.getenv("SPAM_ACTION", "delete").lower()
+        _default_action = action if action in ACTIONS else "delete"
+        metrics.register("spam_waves", _index.stats)
+    return _index
+
+
+def chat_action(chat_id: int) -> str:
+    return get_store().chat_settings(chat_id).get("spam", _default_action)
+
+
+async def dupe_guard(client, message: Message):
+    user = message.from_user
+    if not user or user.is_bot:
+        return
+    text = message.text or message.caption
+    if not text or text.startswith("/"):
+        return
+    index = get_index()
+    # Indexed even where the chat turned it off: the copies there still count towards the wave
+    cluster = index.add(message.chat.id, text, time.monotonic())
+    if cluster is None:
+        return
+    store = get_store()
+    await store.start()
+    action = chat_action(message.chat.id)
+    if action == "off":
+        return
+    if await service("can_moderate")(client, message, user.id):
+        return
+    metrics.inc("spam_wave_messages_total", action, label_name="action")
+    outbox = get_outbox()
+    # One notice per wave per chat, for as long as the wave lives (not just the outbox's coalescing window)
+    notify = message.chat.id not in cluster.notified
+    cluster.notified.add(message.chat.id)
+    notice = (f"Spam wave: a near-copy of this message was posted {cluster.count} times "
+              f"in {len(cluster.chats)} chats in the last {index.window / 60:g} minutes.")
+    if action == "flag":
+        if notify:
+            await outbox.reply(message, notice)
+        return
+    await outbox.call(message.chat.id, message.delete)
+    if notify:
+        # Not a reply: the message is gone
+        deleted = f"Deleted {user.mention}'s message. {notice}"
+        await outbox.submit(message.chat.id, lambda: client.send_message(message.chat.id, deleted), priority=NOTICE)
+
+
+async def set_spam(client, message: Message):
+    """/setspam delete | flag | off  (no arguments: show the setting)"""
+    outbox = get_outbox()
+    get_index()
+    store = get_store()
+    await store.start()
+    chat_id = message.chat.id
+    args = (message.command or [])[1:]
+    if args:
+        if not message.from_user or not await service("can_moderate")(client, message, message.from_user.id):
+            await outbox.reply(message, "You are not allowed to change spam protection.", key="not_allowed")
+            return
+        action = args[0].lower()
+        if action not in ACTIONS:
+            await outbox.reply(message, "Usage: /setspam delete | flag | off")
+            return
+        await store.set_chat_settings(chat_id, spam=action)
+    action = chat_action(chat_id)
+    await outbox.reply(message, {
+        "delete": "Spam waves (the same message across several chats) are deleted in this chat.",
+        "flag": "Spam waves (the same message across several chats) are flagged, not deleted, in this chat.",
+        "off": "Spam-wave protection is off in this chat.",
+    }[action])
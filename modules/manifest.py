@@ -0,0 +1,29 @@
+# modules/manifest.py - handlers provided by modules/ (loaded lazily by bot/plugins.py)
+
+from pyrogram import filters
+
+from bot.plugins import on_message
+
+HANDLERS = (
+    # Counts every group message (any type: sticker floods too); own group so nothing shadows it
+    on_message("modules.antiflood:flood_guard", filters.group & ~filters.service, group=-3),
+    # Cross-chat spam waves: every group message with text, before flood counting
+    on_message("modules.antispam:dupe_guard", filters.group & (filters.text | filters.caption) & ~filters.service,
+               group=-4),
+    on_message("modules.antispam:set_spam", filters.command("setspam") & filters.group),
+    on_message("modules.antiflood:set_flood", filters.command("setflood") & filters.group),
+    # Lowest group of all (below dupe_guard's -4 and flood_guard's -3), so a globally
+    # banned user's message is deleted before the spam and flood checks handle it
+    on_message("modules.moderation:check_global_ban", filters.group, group=-5),
+    # Enforcement and owner commands run on their scheduler lanes, ahead of AI work
+    on_message("modules.moderation:mute_user", filters.command(["mute", "master_mute"]) & filters.group,
+               lane="moderation"),
+    on_message("modules.moderation:soft_ban", filters.command(["softban", "master_ban"]) & filters.group,
+               lane="moderation"),
+    on_message("modules.moderation:global_ban", filters.command(["gban", "global_ban"]) & filters.private,
+               lane="owner"),
+    on_message("modules.moderation:global_unban", filters.command(["ungban", "global_unban"]) & filters.private,
+               lane="owner"),
+    on_message("modules.moderation:sorry_reset",
+               filters.text & filters.group & filters.regex(r"(?i)master sorry|sorry master")),
+)
@@ -1,97 +1,141 @@
-from pyrogram import Client, filters
-from pyrogram.types import Message
-import asyncio
-from pymongo import MongoClient
+# modules/moderation.py - spam punishments and global bans
+# Handlers are registered by modules/manifest.py; this module is imported the
+# first time one of them matches an update, and does no I/O at import.
+
+from datetime import timedelta
 import os
 
-# Load MongoDB
-MONGO_URL = os.getenv("MONGO_URL")
-mongo = MongoClient(MONGO_URL)
-db = mongo["MasterBotDB"]
-punishments = db["punishments"]
-settings = db["settings"]
+from pyrogram.types import ChatPermissions, Message
+
+from bot.fanout import get_gban_executor
+from bot.plugins import service
+from bot.sender import get_outbox
+from db import get_store
+
+# Data layer (db/): cached, non-blocking; MONGO_URL picks the backend
+store = get_store()
+
+# Replies and restrictions go through the shared rate-limited scheduler (bot/sender.py)
+outbox = get_outbox()
 
-# Owner ID
-OWNER_ID = int(os.getenv("BOT_OWNER_ID"))
+# Owner ID (read when needed: a missing variable must not break the import)
+def owner_id() -> int:
+    return int(os.getenv("OWNER_ID") or os.getenv("BOT_OWNER_ID") or 0)
 
 # Utility function: check if user is owner/admin
 async def is_bot_owner(message: Message):
-    return message.from_user and message.from_user.id == OWNER_ID
+    return message.from_user and message.from_user.id == owner_id()
 
-# Function to get punishment info from DB
-def get_user_data(user_id, group_id):
-    return punishments.find_one({"user_id": user_id, "group_id": group_id}) or {"spams": 0}
+# Function to get punishment info from DB (served from memory after the first read)
+async def get_user_data(user_id, group_id):
+    await store.start()
+    return await store.get_punishment(user_id, group_id)
 
 def update_user_data(user_id, group_id, data):
-    punishments.update_one({"user_id": user_id, "group_id": group_id}, {"$set": data}, upsert=True)
-
-# === Soft Mute Command ===
-@Client.on_message(filters.command(["mute", "master_mute"]) & filters.group)
-async def mute_user(client, message: Message):
-    if not message.reply_to_message:
-        await message.reply_text("Reply to a user to mute them.")
-        return
+    # Write-behind: batched into the next bulk flush
+    store.set_punishment(user_id, group_id, data)
 
-    target = message.reply_to_message.from_user
-    group_id = message.chat.id
-    user_data = get_user_data(target.id, group_id)
-
-    # Escalating punishment
+# === Escalating mute: 5, then 15, then 30 minutes (shared with modules/antiflood.py) ===
+def mute_duration(spams: int) -> int:
     duration = 5 * 60  # 5 minutes default
-    if user_data["spams"] == 1:
+    if spams == 1:
         duration = 15 * 60
-    elif user_data["spams"] >= 2:
+    elif spams >= 2:
         duration = 30 * 60
+    return duration
+
+async def escalate_mute(client, message: Message, target, reason: str = "due to repeated spam") -> int:
+    group_id = message.chat.id
+    user_data = await get_user_data(target.id, group_id)
+    duration = mute_duration(user_data["spams"])
 
     # Update DB
     user_data["spams"] = user_data.get("spams", 0) + 1
     update_user_data(target.id, group_id, user_data)
 
     # Mute (restrict)
-    await client.restrict_chat_member(group_id, target.id, until_date=int(message.date.timestamp()) + duration)
-    await message.reply_text(f"{target.mention} is muted for {duration//60} minutes due to repeated spam.")
+    await outbox.call(
+        group_id, client.restrict_chat_member, group_id, target.id,
+        permissions=ChatPermissions(can_send_messages=False),
+        until_date=message.date + timedelta(seconds=duration),
+    )
+    await outbox.reply(message, f"{target.mention} is muted for {duration//60} minutes {reason}.")
+    return duration
+
+# Group admins (and bot admins/owner) only, like /setflood; anonymous senders have no from_user
+async def allowed_to_moderate(client, message: Message) -> bool:
+    if not message.from_user or not await service("can_moderate")(client, message, message.from_user.id):
+        await outbox.reply(message, "You are not allowed to perform moderation actions.", key="not_allowed")
+        return False
+    return True
+
+# === Soft Mute Command ===
+async def mute_user(client, message: Message):
+    if not await allowed_to_moderate(client, message):
+        return
+    if not message.reply_to_message or not message.reply_to_message.from_user:
+        await outbox.reply(message, "Reply to a user to mute them.")
+        return
+
+    await escalate_mute(client, message, message.reply_to_message.from_user)
 
 # === Unmute on Sorry Command ===
-@Client.on_message(filters.text & filters.group)
 async def sorry_reset(client, message: Message):
     if "master sorry" in message.text.lower() or "sorry master" in message.text.lower():
         group_id = message.chat.id
         target = message.from_user
-        user_data = get_user_data(target.id, group_id)
+        user_data = await get_user_data(target.id, group_id)
         user_data["spams"] = 0
         update_user_data(target.id, group_id, user_data)
-        await message.reply_text(f"{target.mention}, your spam limits have been reset. Be careful!")
+        await outbox.reply(message, f"{target.mention}, your spam limits have been reset. Be careful!")
 
 # === Soft Ban Command ===
-@Client.on_message(filters.command(["softban", "master_ban"]) & filters.group)
 async def soft_ban(client, message: Message):
-    if not message.reply_to_message:
-        await message.reply_text("Reply to a user to soft ban them.")
+    if not await allowed_to_moderate(client, message):
+        return
+    if not message.reply_to_message or not message.reply_to_message.from_user:
+        await outbox.reply(message, "Reply to a user to soft ban them.")
         return
 
     target = message.reply_to_message.from_user
     group_id = message.chat.id
-    await message.reply_text(f"{target.mention} is soft banned (no real ban, just for fun)!")
+    await outbox.reply(message, f"{target.mention} is soft banned (no real ban, just for fun)!")
 
 # === Global Ban (owner only) ===
-@Client.on_message(filters.command(["gban", "global_ban"]) & filters.private)
 async def global_ban(client, message: Message):
     if not await is_bot_owner(message):
-        await message.reply_text("Only bot owner can use this command.")
+        await outbox.reply(message, "Only bot owner can use this command.")
         return
     if not message.reply_to_message:
-        await message.reply_text("Reply to a user to global ban them.")
+        await outbox.reply(message, "Reply to a user to global ban them.")
         return
     target = message.reply_to_message.from_user
-    db["global_ban"].update_one({"user_id": target.id}, {"$set": {"banned": True}}, upsert=True)
-    await message.reply_text(f"{target.mention} is globally banned from all groups.")
+    await store.start()
+    await store.set_global_ban(target.id)
+    # Enforce now: ban in every group the bot administers (throttled, resumable)
+    status = await outbox.reply(message, f"{target.mention} is globally banned from all groups. Enforcing…")
+    await get_gban_executor().submit(client, target.id, "ban", report_chat=status.chat.id, report_message=status.id)
+
+# === Global Unban (owner only) ===
+async def global_unban(client, message: Message):
+    if not await is_bot_owner(message):
+        await outbox.reply(message, "Only bot owner can use this command.")
+        return
+    if not message.reply_to_message:
+        await outbox.reply(message, "Reply to a user to global unban them.")
+        return
+    target = message.reply_to_message.from_user
+    await store.start()
+    await store.set_global_ban(target.id, banned=False)
+    status = await outbox.reply(message, f"{target.mention} is no longer globally banned. Unbanning…")
+    await get_gban_executor().submit(client, target.id, "unban", report_chat=status.chat.id, report_message=status.id)
 
 # === Check Global Ban on New Messages ===
-@Client.on_message(filters.group)
 async def check_global_ban(client, message: Message):
-    user_id = message.from_user.id
-    gb = db["global_ban"].find_one({"user_id": user_id})
-    if gb and gb.get("banned"):
-        await message.delete()
-        await message.reply_text(f"{message.from_user.mention} is globally banned from this group.")
+    if not message.from_user:
+        return
+    await store.start()  # no-op once started; the ban set loads in the background
+    if store.is_globally_banned(message.from_user.id):
+        await outbox.call(message.chat.id, message.delete)
+        await outbox.reply(message, f"{message.from_user.mention} is globally banned from this group.", key=f"gbanned:{message.from_user.id}")
 
@@ -0,0 +1,59 @@
+# tests/test_engine.py - AIEngine concurrency against the local stub (ai/stub.py)
+# Real HTTP through the OpenAI SDK to a StubServer on localhost; every call
+# takes DELAY seconds, so elapsed time tells how many ran side by side.
+#
+#   python -m pytest -q tests/test_engine.py
+
+import asyncio
+import time
+
+from ai.engine import AIEngine
+from ai.stub import StubServer
+
+DELAY = 0.3
+
+
+def _messages(i):
+    return [{"role": "user", "content": f"hi {i}"}]
+
+
+async def _timed(calls, **engine_kwargs):
+    """Run (chat_id, i) calls concurrently; returns (replies, seconds, engine)."""
+    server = await StubServer(delay=DELAY).start()
+    engine = AIEngine(api_key="stub", base_url=server.base_url, timeout=10, **engine_kwargs)
+    try:
+        engine._get_client()  # keep the SDK import out of the timing
+        t0 = time.perf_counter()
+        replies = await asyncio.gather(*[engine.complete(_messages(i), chat_id=chat_id) for chat_id, i in calls])
+        return replies, time.perf_counter() - t0, engine
+    finally:
+        await engine.close()
+        await server.stop()
+
+
+def test_concurrent_chats_overlap():
+    n = 20
+    replies, elapsed, engine = asyncio.run(_timed([(i, i) for i in range(n)], max_workers=n))
+    assert replies == [f"stub reply to: hi {i}" for i in range(n)]
+    # All in flight at once: about one call's time, not n of them
+    assert elapsed < DELAY * 3
+    assert engine.stats()["errors"] == engine.stats()["timeouts"] == 0
+
+
+def test_one_chat_is_serialised():
+    n = 3
+    replies, elapsed, engine = asyncio.run(_timed([(42, i) for i in range(n)], max_workers=8, per_chat_limit=1))
+    assert all(replies)
+    # per_chat_limit=1: one after another although global slots were free
+    assert elapsed >= DELAY * n * 0.9
+    assert engine.stats()["active_chats"] == 0  # per-chat slots are dropped when unused
+
+
+def test_max_pending_rejects_extra_callers():
+    replies, elapsed, engine = asyncio.run(_timed([(i, i) for i in range(5)], max_workers=1, max_pending=2))
+    # The first two wait for the single slot, the other three get None at once
+    assert sum(1 for r in replies if r) == 2
+    assert replies[2:] == [None, None, None]
+    assert engine.stats()["rejected"] == 3
+    assert engine.stats()["pending"] == 0
+    assert elapsed < DELAY * 4
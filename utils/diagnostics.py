@@ -0,0 +1,286 @@
+# utils/diagnostics.py - on-demand profiling and event-loop diagnostics
+# For looking inside a slow production bot without restarting it (owner
+# commands in main.py). Nothing here runs until asked for:
+# - profile(): a sampling profiler. A thread reads the event-loop thread's stack
+#   every `interval` for N seconds; the report lists the hottest functions (own
+#   and total time), how busy the loop was, and collapsed stacks for flame graphs
+# - tasks(): pending asyncio tasks grouped by where they are suspended, with how
+#   long they have existed (since creation with DIAG_TASK_AGES=1, otherwise since
+#   a /tasks dump first saw them)
+# - watch_slow(): for N seconds, times every loop callback and reports those
+#   above a threshold (the same check asyncio's debug mode does, without the
+#   rest of debug mode's cost)
+# While idle there is no thread, no hook and no task factory (unless
+# DIAG_TASK_AGES is set); the profiler and the slow-callback timer are removed
+# as soon as their window ends.
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from utils.metrics import metrics
+
+log = logging.getLogger("masterbot.diagnostics")
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_ROOT):
+        return filename[len(_ROOT):]
+    i = filename.rfind("site-packages" + os.sep)
+    if i >= 0:
+        return filename[i + len("site-packages") + 1:]
+    return os.sep.join(filename.split(os.sep)[-2:])  # asyncio/base_events.py
+
+
+def _qualname(code) -> str:
+    return getattr(code, "co_qualname", code.co_name)  # 3.11+
+
+
+def _label(code) -> str:
+    return f"{_qualname(code)} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(code) -> bool:
+    # The loop waiting for I/O in selectors: not work, but shown as the loop's idle share
+    return code.co_name in ("select", "poll", "control") and code.co_filename.endswith("selectors.py")
+
+
+class _Sampler:
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.idle = 0
+        self.own: Counter = Counter()
+        self.total: Counter = Counter()
+        self.stacks: Counter = Counter()
+
+    def run(self, seconds: float):
+        deadline = time.monotonic() + seconds
+        labels: Dict[object, str] = {}  # code object -> label, computed once
+        while time.monotonic() < deadline:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            if _is_idle(frame.f_code):
+                self.idle += 1
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _label(code)
+                stack.append(label)
+                frame = frame.f_back
+            self.own[stack[0]] += 1
+            self.total.update(set(stack))  # recursion counts once per sample
+            self.stacks[";".join(reversed(stack))] += 1
+
+
+class Diagnostics:
+    """
+    - interval: seconds between profiler samples (5 ms is ~200 samples/s)
+    - top: functions listed per table in a profile report
+    """
+
+    def __init__(self, interval: float = 0.005, top: int = 40):
+        self.interval = interval
+        self.top = top
+        self.profiles = 0
+        self.slow_callbacks = 0
+        self._profiling = False
+        self._slow_until = 0.0
+        self._first_seen: "weakref.WeakKeyDictionary[asyncio.Task, float]" = weakref.WeakKeyDictionary()
+        self._tracking = False
+
+    # ---- sampling profiler ----
+    @property
+    def profiling(self) -> bool:
+        return self._profiling
+
+    async def profile(self, seconds: float) -> str:
+        """Sample the event-loop thread for `seconds`; returns the report (raises if one is running)."""
+        if self._profiling:
+            raise RuntimeError("a profile is already running")
+        self._profiling = True
+        sampler = _Sampler(threading.get_ident(), self.interval)
+        started = time.perf_counter()
+        try:
+            # A plain thread rather than the default executor: other to_thread work must not wait behind it
+            done = asyncio.get_running_loop().create_future()
+            thread = threading.Thread(target=self._run_sampler, args=(sampler, seconds, done),
+                                      name="masterbot-profiler", daemon=True)
+            thread.start()
+            await done
+        finally:
+            self._profiling = False
+        self.profiles += 1
+        return self._profile_report(sampler, time.perf_counter() - started)
+
+    @staticmethod
+    def _run_sampler(sampler: _Sampler, seconds: float, done: asyncio.Future):
+        error = None
+        try:
+            sampler.run(seconds)
+        except Exception as e:
+            error = e
+
+        def finish():
+            if not done.done():
+                done.set_result(None) if error is None else done.set_exception(error)
+
+        try:
+            done.get_loop().call_soon_threadsafe(finish)
+        except RuntimeError:
+            pass  # the loop closed while we sampled (shutdown)
+
+    def _profile_report(self, sampler: _Sampler, elapsed: float) -> str:
+        busy = sampler.samples - sampler.idle
+        lines = [
+            f"Master Bot profile, pid {os.getpid()}, {time.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"{elapsed:.1f}s, {sampler.samples} samples of the event-loop thread every {self.interval * 1000:g} ms",
+            f"Loop busy {busy / sampler.samples:.0%} of samples" if sampler.samples else "No samples taken",
+        ]
+        for title, counts in (("Own time (the function itself was running)", sampler.own),
+                              ("Total time (the function or something it called)", sampler.total)):
+            lines += ["", title, f"{'samples':>8} {'busy':>6}  function"]
+            for label, n in counts.most_common(self.top):
+                lines.append(f"{n:8d} {n / busy:6.1%}  {label}")
+        lines += ["", "# Collapsed stacks (flamegraph.pl, speedscope): frames root;...;leaf, then samples"]
+        lines += [f"{stack} {n}" for stack, n in sampler.stacks.most_common()]
+        return "\n".join(lines) + "\n"
+
+    # ---- pending tasks ----
+    def track_tasks(self, loop: asyncio.AbstractEventLoop):
+        """Stamp every task at creation so tasks() reports true ages (one dict insert per task)."""
+        if self._tracking:
+            return
+        inner = loop.get_task_factory()
+
+        def factory(loop, coro, **kwargs):
+            task = inner(loop, coro, **kwargs) if inner is not None else asyncio.Task(coro, loop=loop, **kwargs)
+            self._first_seen[task] = time.monotonic()
+            return task
+
+        loop.set_task_factory(factory)
+        self._tracking = True
+
+    def tasks(self, limit: int = 60) -> str:
+        """Pending tasks grouped by coroutine and suspension point, oldest first."""
+        now = time.monotonic()
+        current = asyncio.current_task()
+        groups: Dict[Tuple[str, str], List[float]] = {}
+        for task in asyncio.all_tasks():
+            if task is current:
+                continue
+            age = now - self._first_seen.setdefault(task, now)
+            groups.setdefault(_where(task), []).append(age)
+        total = sum(len(ages) for ages in groups.values())
+        since = "created" if self._tracking else "first seen by /tasks (DIAG_TASK_AGES=1 stamps creation)"
+        lines = [f"{total} pending tasks in {len(groups)} places, pid {os.getpid()}; ages since {since}", ""]
+        rows = sorted(groups.items(), key=lambda kv: max(kv[1]), reverse=True)
+        for (coro, site), ages in rows[:limit]:
+            lines.append(f"{len(ages):4d}x oldest {_duration(max(ages)):>7} newest {_duration(min(ages)):>7}  {coro}")
+            lines.append(f"      at {site}")
+        if len(rows) > limit:
+            lines.append(f"... {len(rows) - limit} more places")
+        return "\n".join(lines) + "\n"
+
+    # ---- slow callbacks ----
+    @property
+    def watching_slow(self) -> bool:
+        return self._slow_until > 0
+
+    async def watch_slow(self, seconds: float, threshold: float) -> str:
+        """Time every loop callback for `seconds`; returns the ones that ran `threshold` seconds or longer."""
+        if self._slow_until:
+            raise RuntimeError("already watching for slow callbacks")
+        seen: Dict[str, List[float]] = {}  # description -> [count, total, max]
+        handle_cls = asyncio.events.Handle
+        original = handle_cls._run
+
+        def timed_run(handle):
+            start = time.perf_counter()
+            original(handle)
+            took = time.perf_counter() - start
+            if took >= threshold:
+                desc = _describe(handle)
+                log.warning("Executing %s took %.3f seconds", desc, took)
+                self.slow_callbacks += 1
+                metrics.inc("slow_callbacks_total")
+                row = seen.setdefault(desc, [0, 0.0, 0.0])
+                row[0] += 1
+                row[1] += took
+                row[2] = max(row[2], took)
+
+        self._slow_until = time.monotonic() + seconds
+        handle_cls._run = timed_run  # every Handle and TimerHandle the loop runs
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            handle_cls._run = original
+            self._slow_until = 0.0
+        lines = [f"Callbacks over {threshold * 1000:g} ms in {seconds:g}s: "
+                 f"{sum(int(r[0]) for r in seen.values())} in {len(seen)} places, pid {os.getpid()}"]
+        for desc, (count, total, worst) in sorted(seen.items(), key=lambda kv: kv[1][1], reverse=True):
+            lines.append(f"{int(count):4d}x max {worst * 1000:7.1f} ms total {total * 1000:8.1f} ms  {desc}")
+        return "\n".join(lines) + "\n"
+
+    def stats(self) -> dict:
+        return {
+            "profiles": self.profiles,
+            "profiling": int(self._profiling),
+            "watching_slow": int(self.watching_slow),
+            "slow_callbacks": self.slow_callbacks,
+            "tracked_tasks": len(self._first_seen),
+        }
+
+
+def _where(task: asyncio.Task, depth: int = 4) -> Tuple[str, str]:
+    """(coroutine, await chain down to where it is suspended) of a pending task."""
+    coro = task.get_coro()
+    name = getattr(coro, "__qualname__", type(coro).__name__)
+    frames = []
+    awaited = coro
+    while awaited is not None:
+        frame = getattr(awaited, "cr_frame", None) or getattr(awaited, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(f"{_qualname(frame.f_code)} ({_short_path(frame.f_code.co_filename)}:{frame.f_lineno})")
+        awaited = getattr(awaited, "cr_await", None) or getattr(awaited, "gi_yieldfrom", None)
+    if not frames:
+        return name, "(not started)"
+    if len(frames) > depth:
+        frames = frames[:1] + ["..."] + frames[-(depth - 1):]
+    return name, " > ".join(frames)
+
+
+def _describe(handle) -> str:
+    callback = handle._callback
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        coro, site = _where(task)
+        return f"step of {coro}, then suspended at {site}" if not task.done() else f"last step of {coro}"
+    return getattr(callback, "__qualname__", None) or repr(callback)
+
+
+def _duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds / 3600:.1f}h"
+
+
+diagnostics = Diagnostics()
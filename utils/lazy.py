@@ -0,0 +1,84 @@
+# utils/lazy.py - deferred imports for heavy optional dependencies
+# openai, pymongo, transformers, librosa ... cost hundreds of milliseconds to
+# import. Code that needs them calls timed_import() (or touches a LazyModule)
+# at first use; every import made this way is timed for the startup report.
+
+import asyncio
+import importlib
+import importlib.util
+import logging
+import sys
+import time
+from typing import Dict, Iterable
+
+log = logging.getLogger("masterbot.lazy")
+
+# module name -> seconds its first import took (0.0 if it was already loaded)
+import_timings: Dict[str, float] = {}
+
+
+def timed_import(name: str):
+    """importlib.import_module that records how long the first import took."""
+    module = sys.modules.get(name)
+    if module is not None:
+        import_timings.setdefault(name, 0.0)
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    import_timings[name] = time.perf_counter() - start
+    log.info("Imported %s in %.0f ms", name, import_timings[name] * 1000)
+    return module
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access:
+
+        librosa = LazyModule("librosa")
+        ...
+        y, sr = librosa.load(path)   # imported here
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = timed_import(self._name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None or self._name in sys.modules
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+
+def available(name: str) -> bool:
+    """True if the module can be imported, without importing it."""
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+async def warm(names: Iterable[str]):
+    """
+    Import modules in a worker thread so the first request that needs them
+    does not pay for it on the event loop. Missing modules are skipped.
+    """
+    for name in names:
+        if name in sys.modules or not available(name):
+            continue
+        try:
+            await asyncio.to_thread(timed_import, name)
+        except Exception as e:
+            log.warning("Background import of %s failed: %s", name, e)
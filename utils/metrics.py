@@ -0,0 +1,311 @@
+# utils/metrics.py - in-process metrics for Master Bot
+# - latency histograms (fixed log-spaced buckets: one bisect + two adds per sample)
+#   for handlers and helpers, optionally broken down per chat for p99 lookups
+# - counters for Telegram API calls (every raw call goes through Client.invoke)
+#   and OpenAI requests
+# - gauges pulled from components' stats() dicts (cache hit rates, queue depths)
+#   only when the metrics are read, so they cost nothing in between
+# - event-loop lag sampled by a background task
+# Exposed as Prometheus text on a local HTTP port and summarised by /stats.
+
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger("masterbot.metrics")
+
+PREFIX = "masterbot"
+
+
+def _latency_bounds() -> Tuple[float, ...]:
+    # 0.25 ms .. ~80 s, x1.5 per bucket (31 buckets): quantiles are good to about a quarter
+    # of their value, which is enough to tell a 50 ms p99 from a 2 s one
+    bounds, b = [], 0.00025
+    while b < 80:
+        bounds.append(round(b, 6))
+        b *= 1.5
+    return tuple(bounds)
+
+
+LATENCY_BOUNDS = _latency_bounds()
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate (linear within the bucket); 0.0 when empty."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                lo = self.bounds[i - 1] if i > 0 else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return self.bounds[-1]
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+class Metrics:
+    """
+    - max_chats: per-chat histograms kept (LRU); the busiest chats stay in
+    - lag_interval: seconds between event-loop lag samples
+    """
+
+    def __init__(self, max_chats: int = 500, lag_interval: float = 0.5):
+        self.max_chats = max_chats
+        self.lag_interval = lag_interval
+        self.started = time.time()
+        self.histograms: Dict[str, Histogram] = {}
+        self.per_chat: Dict[str, "OrderedDict[int, Histogram]"] = {}
+        self.counters: Dict[Tuple[str, str], int] = {}  # (name, label) -> value
+        self._label_names: Dict[str, str] = {}
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+        self.loop_lag = 0.0
+        self.loop_lag_max = 0.0
+        self._lag_task: Optional[asyncio.Task] = None
+        self._server = None
+
+    # ---- recording ----
+    def observe(self, name: str, seconds: float, chat_id: Optional[int] = None):
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram()
+        hist.observe(seconds)
+        if chat_id is not None:
+            chats = self.per_chat.get(name)
+            if chats is None:
+                chats = self.per_chat[name] = OrderedDict()
+            h = chats.get(chat_id)
+            if h is None:
+                h = chats[chat_id] = Histogram()
+                if len(chats) > self.max_chats:
+                    chats.popitem(last=False)
+            else:
+                chats.move_to_end(chat_id)
+            h.observe(seconds)
+
+    def inc(self, name: str, label: str = "", value: int = 1, label_name: str = "method"):
+        if label and name not in self._label_names:
+            self._label_names[name] = label_name
+        key = (name, label)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def timed(self, name: Optional[str] = None, per_chat: bool = False):
+        """
+        Decorator for coroutine functions. per_chat=True also records the sample
+        under the chat of the first argument that has one (a Message / update).
+        """
+        def decorate(fn):
+            metric = name or fn.__name__
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    chat_id = None
+                    if per_chat:
+                        for a in args:
+                            chat = getattr(a, "chat", None)
+                            if chat is not None:
+                                chat_id = chat.id
+                                break
+                    self.observe(metric, time.perf_counter() - start, chat_id)
+            return wrapper
+        return decorate
+
+    def register(self, component: str, stats: Callable[[], dict]):
+        """Export the numeric values of stats() as gauges <prefix>_<component>_<key>."""
+        self._collectors[component] = stats
+
+    # ---- Telegram ----
+    def instrument_client(self, client):
+        """Count (and time) every raw Telegram call by method, plus errors by type."""
+        invoke = client.invoke
+
+        @functools.wraps(invoke)
+        async def counted_invoke(query, *args, **kwargs):
+            method = getattr(query, "QUALNAME", type(query).__name__)
+            if method.startswith("functions."):
+                method = method[len("functions."):]
+            self.inc("telegram_calls_total", method)
+            start = time.perf_counter()
+            try:
+                return await invoke(query, *args, **kwargs)
+            except Exception as e:
+                self.inc("telegram_errors_total", type(e).__name__, label_name="error")
+                raise
+            finally:
+                self.observe("telegram_call", time.perf_counter() - start)
+
+        client.invoke = counted_invoke
+        return client
+
+    # ---- event-loop lag ----
+    async def _lag_loop(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, time.perf_counter() - start - self.lag_interval)
+            self.loop_lag = lag
+            self.loop_lag_max = max(self.loop_lag_max, lag)
+            self.observe("event_loop_lag", lag)
+
+    # ---- reading ----
+    def chat_quantiles(self, name: str, q: float = 0.99, top: int = 10, min_samples: int = 20) -> List[Tuple[int, float, int]]:
+        """[(chat_id, quantile, samples)] for the slowest chats of one histogram."""
+        rows = [(chat_id, h.quantile(q), h.count) for chat_id, h in self.per_chat.get(name, {}).items()
+                if h.count >= min_samples]
+        rows.sort(key=lambda r: r[1], reverse=True)
+        return rows[:top]
+
+    def collect(self) -> Dict[str, dict]:
+        out = {}
+        for component, stats in self._collectors.items():
+            try:
+                out[component] = stats()
+            except Exception as e:
+                log.debug("Collector %s failed: %s", component, e)
+        return out
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for name, hist in sorted(self.histograms.items()):
+            metric = f"{PREFIX}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, c in zip(hist.bounds, hist.counts):
+                cumulative += c
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {hist.count}')
+            lines.append(f"{metric}_sum {hist.sum:.6f}")
+            lines.append(f"{metric}_count {hist.count}")
+        for name, chats in sorted(self.per_chat.items()):
+            metric = f"{PREFIX}_{name}_chat_p99_seconds"
+            lines.append(f"# TYPE {metric} gauge")
+            for chat_id, h in chats.items():
+                lines.append(f'{metric}{{chat="{chat_id}"}} {h.quantile(0.99):.6f}')
+        seen = set()
+        for (name, label), value in sorted(self.counters.items()):
+            metric = f"{PREFIX}_{name}"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            if label:
+                lines.append(f'{metric}{{{self._label_names.get(name, "method")}="{label}"}} {value}')
+            else:
+                lines.append(f"{metric} {value}")
+        lines.append(f"# TYPE {PREFIX}_event_loop_lag_max_seconds gauge")
+        lines.append(f"{PREFIX}_event_loop_lag_max_seconds {self.loop_lag_max:.6f}")
+        lines.append(f"# TYPE {PREFIX}_uptime_seconds gauge")
+        lines.append(f"{PREFIX}_uptime_seconds {time.time() - self.started:.0f}")
+        for component, stats in sorted(self.collect().items()):
+            for key, value in sorted(stats.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = f"{PREFIX}_{component}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Short human-readable digest for /stats."""
+        up = int(time.time() - self.started)
+        lines = [f"Uptime: {up // 3600}h {up % 3600 // 60}m", "", "Latency (count, p50 / p99 ms):"]
+        for name, h in sorted(self.histograms.items()):
+            if name in ("event_loop_lag", "telegram_call"):
+                continue
+            lines.append(f"• {name}: {h.count}, {h.quantile(0.5) * 1000:.1f} / {h.quantile(0.99) * 1000:.1f}")
+        tg = sum(v for (n, _), v in self.counters.items() if n == "telegram_calls_total")
+        tg_err = sum(v for (n, _), v in self.counters.items() if n == "telegram_errors_total")
+        lines.append("")
+        lines.append(f"Telegram calls: {tg} ({tg_err} errors)")
+        top = sorted(((v, l) for (n, l), v in self.counters.items() if n == "telegram_calls_total"), reverse=True)[:5]
+        for v, l in top:
+            lines.append(f"  {l}: {v}")
+        lines.append(f"OpenAI requests: {self.counters.get(('openai_requests_total', ''), 0)}")
+        lag = self.histograms.get("event_loop_lag")
+        if lag is not None:
+            lines.append(f"Event-loop lag: now {self.loop_lag * 1000:.1f} ms, p99 {lag.quantile(0.99) * 1000:.1f} ms, "
+                         f"max {self.loop_lag_max * 1000:.1f} ms")
+        for component, stats in sorted(self.collect().items()):
+            if "hit_rate" in stats:
+                lines.append(f"{component} hit rate: {stats['hit_rate']:.0%}")
+            if "pending" in stats:
+                lines.append(f"{component} pending: {stats['pending']}")
+        for name in sorted(self.per_chat):
+            slow = self.chat_quantiles(name, top=3)
+            if slow:
+                lines.append("")
+                lines.append(f"Slowest chats ({name}, p99 ms):")
+                lines.extend(f"  {chat_id}: {p * 1000:.1f} ({n})" for chat_id, p, n in slow)
+        return "\n".join(lines)
+
+    # ---- lifecycle ----
+    async def start(self, port: int = 0, host: str = "127.0.0.1"):
+        """Start lag sampling and, if port is set, the /metrics HTTP endpoint."""
+        loop = asyncio.get_running_loop()
+        if self._lag_task is None:
+            self._lag_task = loop.create_task(self._lag_loop())
+        if port and self._server is None:
+            try:
+                self._server = await asyncio.start_server(self._serve, host, port)
+                log.info("Metrics on http://%s:%d/metrics", host, port)
+            except OSError as e:
+                log.warning("Metrics endpoint not started (%s:%d): %s", host, port, e)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Drain headers; the request line is all we need
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[1].split("?")[0] in ("/metrics", "/"):
+                body, status = self.render().encode(), "200 OK"
+            else:
+                body, status = b"not found\n", "404 Not Found"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+metrics = Metrics()
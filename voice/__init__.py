@@ -0,0 +1,2 @@
+from .pipeline import VoiceBusy, VoicePipeline, get_voice_pipeline
+from .transcribers import StubTranscriber, Transcriber, WhisperTranscriber, make_transcriber
@@ -0,0 +1,39 @@
+# voice/handlers.py - voice notes answered like text (registered by voice/manifest.py)
+# DMs: every voice note. Groups: only notes that reply to the bot, so the
+# pipeline is not spent on every voice message in a busy group.
+
+import logging
+
+from pyrogram.enums import ChatType
+from pyrogram.types import Message
+
+from bot.plugins import service
+from bot.sender import CHAT, get_outbox
+
+from .pipeline import VoiceBusy, get_voice_pipeline
+
+log = logging.getLogger("masterbot.voice")
+
+
+async def voice_handler(client, message: Message):
+    pipeline = get_voice_pipeline()
+    if not pipeline.enabled:
+        return
+    if message.chat.type != ChatType.PRIVATE:
+        reply = message.reply_to_message
+        if not (reply and reply.from_user and reply.from_user.is_self):
+            return
+    try:
+        text = await pipeline.transcribe(client, message)
+    except VoiceBusy:
+        await get_outbox().reply(message, "So many voice notes right now! 🙈 Send it again in a minute?",
+                                 priority=CHAT, key="voice_busy", wait=False)
+        return
+    except Exception as e:
+        log.warning("Voice note not transcribed: %s", e)
+        return
+    if not text:
+        return
+    speaker = message.from_user.first_name if message.from_user else None
+    reply = await service("ai_generate_reply")(text, chat_id=message.chat.id, speaker=speaker)
+    await get_outbox().reply(message, reply, priority=CHAT, wait=False)
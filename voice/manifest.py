@@ -0,0 +1,25 @@
+# voice/manifest.py - voice notes (only when VOICE_TRANSCRIBER is set)
+
+import os
+
+from pyrogram import filters
+
+from bot.plugins import on_message
+
+
+# Group voice notes are only answered when they reply to the bot; filtering here keeps
+# the others off the group_ai lane entirely (async: Pyrogram runs plain functions in a thread)
+async def _replies_to_bot(_, __, message) -> bool:
+    reply = message.reply_to_message
+    return bool(reply and reply.from_user and reply.from_user.is_self)
+
+
+replies_to_bot = filters.create(_replies_to_bot, "replies_to_bot")
+
+HANDLERS = (
+    # Group 2 with ai_handler: its text filter never matches a voice note. Transcription and the
+    # reply take seconds, so they run on the sheddable AI lanes like text replies
+    on_message("voice.handlers:voice_handler", filters.voice & filters.private, group=2, lane="dm_ai"),
+    on_message("voice.handlers:voice_handler", filters.voice & filters.group & replies_to_bot, group=2,
+               lane="group_ai"),
+) if os.getenv("VOICE_TRANSCRIBER") else ()
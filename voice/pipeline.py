@@ -0,0 +1,230 @@
+# voice/pipeline.py - voice note -> text, without blocking the event loop
+#   download (async, on the loop)  ->  per-chunk decode/resample -> features ->
+#   transcribe (process pool)      ->  transcript, in order
+# Admission is a bounded queue: when it is full, new notes are refused (the
+# caller tells the user to retry) instead of piling up. Within a note, at most
+# `window` chunks are in flight, so one long note cannot hog every worker and
+# memory stays at a few chunks' worth of samples.
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+from .transcribers import make_transcriber
+from .worker import init_worker, process_chunk
+
+log = logging.getLogger("masterbot.voice")
+
+
+class VoiceBusy(Exception):
+    """The pipeline's queue is full; try again later."""
+
+
+class VoicePipeline:
+    """
+    - transcriber: VOICE_TRANSCRIBER spec (see voice/transcribers.py); empty disables voice
+    - processes: pool workers for the CPU-bound stages
+    - max_queue: voice notes waiting for a slot before new ones are refused
+    - concurrency: voice notes processed at once
+    - chunk_seconds / window: chunk length, and chunks of one note in flight at once
+    - max_seconds: longer notes are only transcribed up to this point
+    - sample_rate: decode/resample target (16 kHz suits speech models)
+    - chunk_fn: the per-chunk stage; anything but the default runs in a thread
+      instead of the process pool (benchmarks and local checks)
+    """
+
+    def __init__(self, transcriber: Optional[str], processes: int = 2, max_queue: int = 16, concurrency: int = 2,
+                 chunk_seconds: float = 20.0, window: int = 2, max_seconds: float = 120.0,
+                 sample_rate: int = 16000, max_chars: int = 1500,
+                 chunk_fn: Callable[..., dict] = process_chunk):
+        self.spec = transcriber
+        self.processes = processes
+        self.max_queue = max_queue
+        self.concurrency = concurrency
+        self.chunk_seconds = chunk_seconds
+        self.window = window
+        self.max_seconds = max_seconds
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+        self.chunk_fn = chunk_fn
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._tmpdir: Optional[str] = None
+        self.active = 0
+        self.done = 0
+        self.failed = 0
+        self.rejected = 0
+        self.chunks = 0
+        self.silent_chunks = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.spec)
+
+    # ---- public API ----
+    async def transcribe(self, client, message) -> str:
+        """
+        Transcript of a voice message (may be ''). Raises VoiceBusy when the queue is full.
+        """
+        self._ensure_running()
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((client, message, fut))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise VoiceBusy() from None
+        return await fut
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "active": self.active,
+            "done": self.done,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "chunks": self.chunks,
+            "silent_chunks": self.silent_chunks,
+            "audio_seconds": round(self.audio_seconds, 1),
+            # < 1 means faster than real time
+            "realtime_factor": round(self.busy_seconds / self.audio_seconds, 3) if self.audio_seconds else 0.0,
+        }
+
+    async def close(self):
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    # ---- internals ----
+    def _ensure_running(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if not self._workers:
+            loop = asyncio.get_running_loop()
+            self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            import multiprocessing
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker, initargs=(self.spec,),
+            )
+        return self._pool
+
+    async def _worker(self):
+        while True:
+            client, message, fut = await self._queue.get()
+            if fut.cancelled():
+                continue
+            self.active += 1
+            try:
+                text = await self._process(client, message)
+            except Exception as e:
+                self.failed += 1
+                log.warning("Voice note %s in %s failed: %s", message.id, message.chat.id, e)
+                if not fut.done():
+                    fut.set_exception(e)
+            else:
+                self.done += 1
+                if not fut.done():
+                    fut.set_result(text)
+            finally:
+                self.active -= 1
+
+    async def _download(self, client, message) -> str:
+        if self._tmpdir is None:
+            self._tmpdir = tempfile.mkdtemp(prefix="masterbot-voice-")
+        target = os.path.join(self._tmpdir, f"{message.chat.id}_{message.id}.ogg")
+        # Streams to disk; the note is never held in memory as a whole
+        path = await client.download_media(message, file_name=target)
+        return path or target
+
+    async def _process(self, client, message) -> str:
+        started = time.perf_counter()
+        path = await self._download(client, message)
+        try:
+            voice = getattr(message, "voice", None) or getattr(message, "audio", None)
+            duration = min(float(getattr(voice, "duration", 0) or self.max_seconds), self.max_seconds)
+            return await self._transcribe_file(path, duration)
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def _transcribe_file(self, path: str, duration: float) -> str:
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool() if self.chunk_fn is process_chunk else None
+        starts = [i * self.chunk_seconds for i in range(max(1, int(-(-duration // self.chunk_seconds))))]
+        parts: List[str] = []
+        in_flight: List[asyncio.Future] = []
+        chars = 0
+        try:
+            for start in starts:
+                length = min(self.chunk_seconds, duration - start) if duration > start else self.chunk_seconds
+                in_flight.append(loop.run_in_executor(pool, self.chunk_fn, path, start, length, self.sample_rate))
+                if len(in_flight) < self.window:
+                    continue
+                # Window full: take the oldest chunk (results stay in order)
+                result = await in_flight.pop(0)
+                chars += self._collect(result, parts)
+                if result["end"] or chars >= self.max_chars:
+                    return " ".join(parts)
+            while in_flight:
+                result = await in_flight.pop(0)
+                chars += self._collect(result, parts)
+                if result["end"] or chars >= self.max_chars:
+                    break
+            return " ".join(parts)
+        finally:
+            for f in in_flight:
+                f.cancel()
+
+    def _collect(self, result: dict, parts: List[str]) -> int:
+        self.chunks += 1
+        self.audio_seconds += result.get("seconds", 0.0)
+        text = result.get("text") or ""
+        if not text:
+            self.silent_chunks += 1
+            return 0
+        parts.append(text)
+        return len(text)
+
+
+_pipeline: Optional[VoicePipeline] = None
+
+
+def get_voice_pipeline() -> VoicePipeline:
+    """Process-wide pipeline configured from VOICE_* variables (no pool until the first note)."""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = VoicePipeline(
+            transcriber=os.getenv("VOICE_TRANSCRIBER", ""),
+            processes=int(os.getenv("VOICE_PROCESSES", "2")),
+            max_queue=int(os.getenv("VOICE_MAX_QUEUE", "16")),
+            max_seconds=float(os.getenv("VOICE_MAX_SECONDS", "120")),
+        )
+        if _pipeline.enabled:
+            # Fail at startup on a bad spec rather than inside every worker
+            make_transcriber(_pipeline.spec)
+    return _pipeline
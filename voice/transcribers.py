@@ -0,0 +1,77 @@
+# voice/transcribers.py - pluggable speech-to-text backends
+# A transcriber is built once inside each pool worker process (see voice/worker.py)
+# and called per audio chunk. Select one with VOICE_TRANSCRIBER:
+#
+#   stub                         fixed text (VOICE_STUB_TEXT), for local runs and benchmarks
+#   whisper[:model]              transformers ASR pipeline, default openai/whisper-tiny
+#                                (runs offline once the model is in the HF cache)
+#   module.path:ClassName[:arg]  any class with the Transcriber interface
+
+import importlib
+import logging
+import os
+from typing import Optional
+
+log = logging.getLogger("masterbot.voice")
+
+
+class Transcriber:
+    name = "base"
+    # True if transcribe() wants the log-mel features computed by the pipeline
+    wants_features = False
+
+    def transcribe(self, audio, sample_rate: int, features: Optional[dict] = None) -> str:
+        """audio: mono float32 samples at sample_rate; returns the chunk's text ('' if none)."""
+        raise NotImplementedError
+
+
+class StubTranscriber(Transcriber):
+    """Returns the same text for every voiced chunk; no model, no download."""
+
+    name = "stub"
+
+    def __init__(self, text: Optional[str] = None):
+        self.text = text if text is not None else os.getenv("VOICE_STUB_TEXT", "hi master")
+
+    def transcribe(self, audio, sample_rate, features=None):
+        return self.text
+
+
+class WhisperTranscriber(Transcriber):
+    """Hugging Face transformers ASR pipeline (CPU); loaded on the first chunk."""
+
+    name = "whisper"
+
+    def __init__(self, model: str = "openai/whisper-tiny", language: Optional[str] = None):
+        self.model = model
+        self.language = language
+        self._asr = None
+
+    def _pipeline(self):
+        if self._asr is None:
+            from utils.lazy import timed_import
+            transformers = timed_import("transformers")
+            self._asr = transformers.pipeline("automatic-speech-recognition", model=self.model, device=-1)
+        return self._asr
+
+    def transcribe(self, audio, sample_rate, features=None):
+        kwargs = {}
+        if self.language:
+            kwargs["generate_kwargs"] = {"language": self.language}
+        out = self._pipeline()({"raw": audio, "sampling_rate": sample_rate}, **kwargs)
+        return (out.get("text") or "").strip()
+
+
+def make_transcriber(spec: Optional[str]) -> Optional[Transcriber]:
+    """Build a transcriber from a VOICE_TRANSCRIBER spec; None when voice is disabled."""
+    if not spec:
+        return None
+    kind, _, arg = spec.partition(":")
+    if kind == "stub":
+        return StubTranscriber(arg or None)
+    if kind == "whisper":
+        return WhisperTranscriber(arg or "openai/whisper-tiny")
+    # module.path:ClassName[:arg]
+    cls_name, _, arg = arg.partition(":")
+    cls = getattr(importlib.import_module(kind), cls_name)
+    return cls(arg) if arg else cls()
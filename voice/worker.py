@@ -0,0 +1,90 @@
+# voice/worker.py - CPU-bound voice stages, run inside pool worker processes
+# Each call handles ONE chunk of one voice note: decode + resample just that
+# window of the file, extract features, skip it if it is silence, else
+# transcribe it. Only a chunk's samples are ever in memory.
+#
+# Keep this module light: it is imported by every worker process at spawn.
+
+import logging
+import os
+from typing import Optional
+
+from utils.lazy import LazyModule
+
+from .transcribers import Transcriber, make_transcriber
+
+log = logging.getLogger("masterbot.voice")
+
+np = LazyModule("numpy")
+sf = LazyModule("soundfile")
+librosa = LazyModule("librosa")
+
+_transcriber: Optional[Transcriber] = None
+
+
+def init_worker(spec: str):
+    """Process-pool initializer: build the transcriber once per worker."""
+    global _transcriber
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    _transcriber = make_transcriber(spec)
+
+
+def decode(path: str, start: float, duration: float, sample_rate: int):
+    """
+    Mono float32 samples for [start, start+duration) of the file at sample_rate.
+    soundfile seeks straight to the window (Ogg/Opus with libsndfile >= 1.0.29);
+    other formats go through pydub/ffmpeg, which also decodes just the window.
+    """
+    try:
+        with sf.SoundFile(path) as f:
+            native = f.samplerate
+            f.seek(min(int(start * native), f.frames))
+            data = f.read(frames=int(duration * native), dtype="float32", always_2d=True)
+        audio = data.mean(axis=1)
+    except Exception:
+        from pydub import AudioSegment
+        seg = AudioSegment.from_file(path, start_second=start, duration=duration)
+        seg = seg.set_channels(1)
+        native = seg.frame_rate
+        scale = float(1 << (8 * seg.sample_width - 1))
+        audio = np.array(seg.get_array_of_samples(), dtype=np.float32) / scale
+    if len(audio) and native != sample_rate:
+        audio = librosa.resample(audio, orig_sr=native, target_sr=sample_rate)
+    return audio.astype(np.float32, copy=False)
+
+
+def features(audio, sample_rate: int, silence_rms: float = 0.01) -> dict:
+    """Frame energy (for silence skipping) and, on request, log-mel features."""
+    rms = librosa.feature.rms(y=audio, frame_length=1024, hop_length=512)[0]
+    voiced = float((rms > silence_rms).mean()) if len(rms) else 0.0
+    return {"rms": float(rms.mean()) if len(rms) else 0.0, "voiced": voiced}
+
+
+def log_mel(audio, sample_rate: int, n_mels: int = 80):
+    mel = librosa.feature.melspectrogram(y=audio, sr=sample_rate, n_fft=400, hop_length=160, n_mels=n_mels)
+    return librosa.power_to_db(mel)
+
+
+def process_chunk(path: str, start: float, duration: float, sample_rate: int,
+                  min_voiced: float = 0.1) -> dict:
+    """
+    Runs in a worker process. Returns
+    {"start", "seconds", "text", "voiced", "end"}; end=True once the file ran out.
+    """
+    audio = decode(path, start, duration, sample_rate)
+    seconds = len(audio) / sample_rate if sample_rate else 0.0
+    result = {"start": start, "seconds": seconds, "text": "", "voiced": 0.0,
+              "end": seconds < duration - 0.05}
+    if seconds < 0.2:
+        return result
+    feats = features(audio, sample_rate)
+    result["voiced"] = feats["voiced"]
+    if feats["voiced"] < min_voiced or _transcriber is None:
+        return result  # silence: nothing to transcribe
+    if _transcriber.wants_features:
+        feats["log_mel"] = log_mel(audio, sample_rate)
+    try:
+        result["text"] = _transcriber.transcribe(audio, sample_rate, feats).strip()
+    except Exception as e:
+        log.warning("Transcriber %s failed on %s@%.0fs: %s", _transcriber.name, os.path.basename(path), start, e)
+    return result